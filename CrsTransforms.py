@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsCoordinateTransformContext, \
+    QgsCsException, QgsGeometry, QgsPointXY, QgsRectangle
+
+from .OffsetEngine import arrays_to_geometry, geometry_to_arrays
+
+# geographic reference system of the UTM zone selection
+WGS84 = "EPSG:4326"
+# first EPSG code of the northern and southern WGS 84 / UTM zones
+UTM_NORTH = 32600
+UTM_SOUTH = 32700
+
+
+def crs_key(crs: QgsCoordinateReferenceSystem) -> str:
+    """
+    Returns a string, which identifies the reference system, the authority id or the WKT for custom systems
+    :param crs: coordinate reference system
+    :return: the identifying string, empty for invalid reference systems
+    """
+    if not crs.isValid():
+        return ""
+    return crs.authid() or crs.toWkt()
+
+
+def transform_arrays(parts: Sequence[np.ndarray], transform: QgsCoordinateTransform or None) -> List[np.ndarray]:
+    """
+    Transforms the coordinate arrays of all parts of a line in one pass. The parts are combined to a single geometry,
+    so all vertices are transformed with one call.
+    :param parts: list of (n x 2) coordinate arrays
+    :param transform: coordinate transform, None for the identity
+    :return: list of the transformed (n x 2) coordinate arrays
+    :raises QgsCsException: if the coordinates cannot be transformed
+    """
+    if transform is None or len(parts) == 0:
+        return list(parts)
+    geometry = arrays_to_geometry(parts)
+    geometry.transform(transform)
+    return geometry_to_arrays(geometry)
+
+
+def transform_geometries(geometries: Sequence[QgsGeometry], transform: QgsCoordinateTransform or None) -> \
+        List[QgsGeometry]:
+    """
+    Transforms whole geometries, the input geometries are not changed
+    :param geometries: list of geometries, empty geometries are kept
+    :param transform: coordinate transform, None for the identity
+    :return: list of the transformed geometries
+    :raises QgsCsException: if the coordinates cannot be transformed
+    """
+    if transform is None:
+        return list(geometries)
+    result = list()
+    for geometry in geometries:
+        if geometry is not None and not geometry.isEmpty():
+            geometry = QgsGeometry(geometry)
+            geometry.transform(transform)
+        result.append(geometry)
+    return result
+
+
+class CrsTransforms:
+    """
+    Cache of the coordinate transforms between pairs of reference systems and selection of the working reference
+    system of a construction. Offsets are calculated in a projected working system, so the unit distances are
+    always applied in its linear units, independent of the reference systems of the source layer and the project.
+    """
+
+    def __init__(self, context: QgsCoordinateTransformContext or None = None) -> None:
+        """
+        Initialization of the class
+        :param context: transform context of the project, None for the default context
+        """
+        self.__context = context if context is not None else QgsCoordinateTransformContext()
+        self.__transforms = dict()  # type: Dict[Tuple[str, str], QgsCoordinateTransform or None]
+
+    def __len__(self) -> int:
+        """
+        returns the number of cached transforms
+        :return: the number of cached transforms
+        """
+        return len(self.__transforms)
+
+    # setter and getter
+    @property
+    def context(self) -> QgsCoordinateTransformContext:
+        """
+        returns the transform context used for new transforms
+        :return: the transform context
+        """
+        return self.__context
+
+    @context.setter
+    def context(self, context: QgsCoordinateTransformContext) -> None:
+        """
+        Sets the transform context and removes all cached transforms
+        :param context: new transform context
+        :return: Nothing
+        """
+        self.__context = context
+        self.__transforms.clear()
+
+    #
+    # public functions
+    #
+
+    def clear(self) -> None:
+        """
+        Removes all cached transforms
+        :return: Nothing
+        """
+        self.__transforms.clear()
+
+    def get(self, source: QgsCoordinateReferenceSystem, target: QgsCoordinateReferenceSystem) -> \
+            QgsCoordinateTransform or None:
+        """
+        Returns the cached transform between the reference systems, it is created on first use
+        :param source: source reference system
+        :param target: target reference system
+        :return: the transform or None, if no transform is needed (equal or invalid reference systems)
+        """
+        key = (crs_key(source), crs_key(target))
+        if key in self.__transforms:
+            return self.__transforms[key]
+        transform = None
+        if key[0] != "" and key[1] != "" and key[0] != key[1]:
+            transform = QgsCoordinateTransform(source, target, self.__context)
+        self.__transforms[key] = transform
+        return transform
+
+    def transform_point(self, point: QgsPointXY, source: QgsCoordinateReferenceSystem,
+                        target: QgsCoordinateReferenceSystem) -> QgsPointXY:
+        """
+        Transforms a single point
+        :param point: point in the source reference system
+        :param source: source reference system
+        :param target: target reference system
+        :return: the point in the target reference system
+        :raises QgsCsException: if the point cannot be transformed
+        """
+        transform = self.get(source, target)
+        if transform is None:
+            return QgsPointXY(point)
+        return transform.transform(QgsPointXY(point))
+
+    def transform_rectangle(self, rectangle: QgsRectangle, source: QgsCoordinateReferenceSystem,
+                            target: QgsCoordinateReferenceSystem) -> QgsRectangle:
+        """
+        Transforms a rectangle into the bounding box of its transformed outline
+        :param rectangle: rectangle in the source reference system
+        :param source: source reference system
+        :param target: target reference system
+        :return: the bounding box in the target reference system
+        :raises QgsCsException: if the rectangle cannot be transformed
+        """
+        transform = self.get(source, target)
+        if transform is None:
+            return QgsRectangle(rectangle)
+        return transform.transformBoundingBox(rectangle)
+
+    def working_crs(self, source: QgsCoordinateReferenceSystem, parts: Sequence[np.ndarray]) -> \
+            QgsCoordinateReferenceSystem:
+        """
+        Selects the projected reference system, in which the offsets of a line are calculated. Projected source
+        systems are used directly, lines in geographic systems are calculated in the WGS 84 / UTM zone of their
+        center.
+        :param source: reference system of the line
+        :param parts: list of (n x 2) coordinate arrays of the line in the source reference system
+        :return: the working reference system, the source system, if it is projected, invalid or the line is empty
+        """
+        if not source.isValid() or not source.isGeographic() or len(parts) == 0:
+            return source
+        lower = np.min([part.min(axis=0) for part in parts], axis=0)
+        upper = np.max([part.max(axis=0) for part in parts], axis=0)
+        center = QgsPointXY(float(lower[0] + upper[0]) / 2, float(lower[1] + upper[1]) / 2)
+        try:
+            center = self.transform_point(center, source, QgsCoordinateReferenceSystem(WGS84))
+        except QgsCsException:
+            return source
+        zone = int((center.x() + 180.0) // 6.0) % 60 + 1
+        crs = QgsCoordinateReferenceSystem("EPSG:{}".format((UTM_NORTH if center.y() >= 0 else UTM_SOUTH) + zone))
+        return crs if crs.isValid() else source
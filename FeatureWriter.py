@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+from typing import List
+
+from qgis.core import QgsFeature, QgsFeatureSink, QgsFields, QgsGeometry, QgsRectangle
+
+
+class FeatureWriter:
+    """
+    Bulk writer for constructed unit lines. The attribute template is built once, features are collected and written
+    in chunks with one addFeatures call per chunk.
+    """
+
+    def __init__(self, sink: QgsFeatureSink, fields: QgsFields, name_field_index: int, multi_type: bool,
+                 multipart: bool, chunk_size: int = 1000, color_field_index: int = -1) -> None:
+        """
+        Initialization of the class
+        :param sink: feature sink (data provider or file writer), which receives the features
+        :param fields: fields of the sink
+        :param name_field_index: index of the name attribute
+        :param multi_type: True, if the sink stores multi part geometries
+        :param multipart: True, if multi part units are written as one feature, else as one feature per part
+        :param chunk_size: number of features written with one addFeatures call
+        :param color_field_index: index of the colour attribute, -1 if the sink has no colour attribute
+        :raises ValueError: if the name or the colour field index is not a valid field index
+        """
+        if not 0 <= name_field_index < fields.count():
+            raise ValueError("Invalid name field index: {}".format(name_field_index))
+        if not -1 <= color_field_index < fields.count():
+            raise ValueError("Invalid colour field index: {}".format(color_field_index))
+
+        self.__sink = sink
+        self.__fields = fields
+        self.__name_field_index = name_field_index
+        self.__color_field_index = color_field_index
+        self.__multi_type = multi_type
+        self.__multipart = multi_type and multipart
+        self.__chunk_size = max(int(chunk_size), 1)
+        self.__template = [None] * fields.count()
+        self.__features = list()  # type: List[QgsFeature]
+        self.__count = 0
+        self.__elapsed = 0.0
+        self.__extent = QgsRectangle()
+
+    @property
+    def count(self) -> int:
+        """
+        returns the number of written features
+        :return: the number of written features
+        """
+        return self.__count
+
+    @property
+    def elapsed(self) -> float:
+        """
+        returns the time spent for creating and writing the features in seconds
+        :return: the time spent for creating and writing the features in seconds
+        """
+        return self.__elapsed
+
+    @property
+    def extent(self) -> QgsRectangle:
+        """
+        returns the combined extent of all added features
+        :return: the combined extent of all added features (null, if nothing was added)
+        """
+        return QgsRectangle(self.__extent)
+
+    @property
+    def features_per_second(self) -> float:
+        """
+        returns the write throughput
+        :return: the number of written features per second
+        """
+        return self.__count / self.__elapsed if self.__elapsed > 0 else 0.0
+
+    #
+    # private functions
+    #
+
+    def __write(self) -> None:
+        """
+        Writes the collected features with one addFeatures call
+        :return: Nothing
+        :raises IOError: if the sink rejects the features
+        """
+        if len(self.__features) == 0:
+            return
+        result = self.__sink.addFeatures(self.__features, QgsFeatureSink.FastInsert)
+        # data providers return a tuple of the result and the added features
+        if isinstance(result, tuple):
+            result = result[0]
+        if not result:
+            raise IOError("Cannot write {} features to the output layer".format(len(self.__features)))
+        self.__count += len(self.__features)
+        self.__features = list()
+
+    #
+    # public functions
+    #
+
+    def add(self, units: List[List]) -> None:
+        """
+        Adds the given units. Full chunks are written immediately.
+        :param units: list of [name, geometry] pairs or [name, geometry, colour] triples
+        :return: Nothing
+        """
+        start = time.perf_counter()
+        for entry in units:
+            name, unit = entry[:2]
+            if self.__multipart or not unit.isMultipart():
+                geometries = [QgsGeometry(unit)]
+            else:
+                geometries = unit.asGeometryCollection()
+
+            attributes = list(self.__template)
+            attributes[self.__name_field_index] = name
+            if self.__color_field_index != -1 and len(entry) > 2:
+                attributes[self.__color_field_index] = entry[2]
+            for geometry in geometries:
+                if self.__multi_type:
+                    geometry.convertToMultiType()
+                feature = QgsFeature(self.__fields)
+                feature.setGeometry(geometry)
+                feature.setAttributes(attributes)
+                self.__extent.combineExtentWith(geometry.boundingBox())
+                self.__features.append(feature)
+
+            if len(self.__features) >= self.__chunk_size:
+                self.__write()
+        self.__elapsed += time.perf_counter() - start
+
+    def flush(self) -> None:
+        """
+        Writes all remaining features
+        :return: Nothing
+        """
+        start = time.perf_counter()
+        self.__write()
+        self.__elapsed += time.perf_counter() - start
+
+    def close(self) -> None:
+        """
+        Writes all remaining features and releases the sink, so a file writer can be deleted and its file completed
+        :return: Nothing
+        """
+        self.flush()
+        self.__sink = None
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from PyQt5.QtCore import QVariant
+from qgis.core import QgsCoordinateReferenceSystem, QgsField, QgsFields, QgsProviderRegistry, QgsVectorFileWriter, \
+    QgsVectorLayer, QgsWkbTypes
+
+# output formats, identical to the output_format combo box index
+FORMAT_MEMORY = 0
+FORMAT_GEOPACKAGE = 1
+FORMAT_FLATGEOBUF = 2
+
+# combo box text, OGR driver, file extension and file dialog filter of every output format
+OUTPUT_FORMATS = [("Temporary layer", "", "", ""),
+                  ("GeoPackage", "GPKG", ".gpkg", "GeoPackage (*.gpkg)"),
+                  ("FlatGeobuf", "FlatGeobuf", ".fgb", "FlatGeobuf (*.fgb)")]
+
+# suffix of the band polygon output, appended to the layer name and the file name of the line output
+BAND_SUFFIX = "_bands"
+
+
+def band_path(path: str) -> str:
+    """
+    Returns the path of the band polygon file, which belongs to the given line output file
+    :param path: path of the line output file
+    :return: the path of the band polygon file
+    """
+    root, extension = os.path.splitext(path)
+    return root + BAND_SUFFIX + extension
+
+
+def color_text(rgba: int) -> str:
+    """
+    Returns the text representation of a colour, which is stored in the colour attribute
+    :param rgba: colour as 32 bit ARGB value (QColor.rgba)
+    :return: the colour as #AARRGGBB hex string
+    """
+    return "#{:08x}".format(rgba & 0xffffffff)
+
+
+def output_fields(bands: bool = False) -> QgsFields:
+    """
+    Returns the attribute fields of an output layer
+    :param bands: True for the fields of a band polygon output
+    :return: fields with the name attribute, band polygon outputs have an additional colour attribute
+    """
+    fields = QgsFields()
+    # noinspection PyArgumentList
+    fields.append(QgsField("name", QVariant.String, len=255))
+    if bands:
+        # noinspection PyArgumentList
+        fields.append(QgsField("color", QVariant.String, len=9))
+    return fields
+
+
+def file_path(path: str, output_format: int) -> str:
+    """
+    Adds the file extension of the output format to the path, if it is missing
+    :param path: path of the output file
+    :param output_format: output format (FORMAT_GEOPACKAGE or FORMAT_FLATGEOBUF)
+    :return: the path with extension
+    """
+    extension = OUTPUT_FORMATS[output_format][2]
+    if not path.lower().endswith(extension):
+        path += extension
+    return path
+
+
+def output_matches(layer: QgsVectorLayer, output_format: int, path: str = "", table: str = "") -> bool:
+    """
+    Tests, if the layer is stored in the given output format and, for GeoPackages, in the given table of the given file
+    :param layer: output layer
+    :param output_format: output format (FORMAT_MEMORY or FORMAT_GEOPACKAGE)
+    :param path: path of the GeoPackage
+    :param table: name of the GeoPackage table
+    :return: True, if new features added to the layer are written to the selected output
+    """
+    if output_format == FORMAT_MEMORY:
+        return layer.providerType() == "memory"
+    if layer.providerType() != "ogr":
+        return False
+    # noinspection PyArgumentList
+    parts = QgsProviderRegistry.instance().decodeUri("ogr", layer.source())
+    source = parts.get("path") or ""
+    if source == "" or os.path.normcase(os.path.abspath(source)) != os.path.normcase(os.path.abspath(path)):
+        return False
+    return (parts.get("layerName") or "") == table
+
+
+def unique_path(path: str) -> str:
+    """
+    Returns the given path or, if the file exists, the path with the first free numeric suffix
+    :param path: path of the file
+    :return: path of a not existing file
+    """
+    if not os.path.exists(path):
+        return path
+    root, extension = os.path.splitext(path)
+    index = 1
+    while os.path.exists("{}_{}{}".format(root, index, extension)):
+        index += 1
+    return "{}_{}{}".format(root, index, extension)
+
+
+def geopackage_layer(path: str, table: str, crs: QgsCoordinateReferenceSystem, bands: bool = False) -> QgsVectorLayer:
+    """
+    Returns the given table of a GeoPackage as OGR layer. The table is created with a spatial index, if it does not
+    exist, features added to the layer are written directly to the file.
+    :param path: path of the GeoPackage
+    :param table: name of the table
+    :param crs: coordinate reference system of a new table
+    :param bands: True, if a new table stores band polygons instead of lines
+    :return: the OGR layer of the table
+    :raises IOError: if the table cannot be created or opened
+    """
+    uri = "{}|layername={}".format(path, table)
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = table
+    options.layerOptions = ["SPATIAL_INDEX=YES"]
+    options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteFile
+    if os.path.exists(path):
+        layer = QgsVectorLayer(uri, table, "ogr")
+        if layer.isValid():
+            return layer
+        options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+
+    # the table is created from an empty template layer with the output fields
+    geometry_type = "multipolygon" if bands else "multilinestring"
+    template = QgsVectorLayer("{}?crs=wkt:{}".format(geometry_type, crs.toWkt()), table, "memory")
+    template.dataProvider().addAttributes(output_fields(bands).toList())
+    template.updateFields()
+    result = QgsVectorFileWriter.writeAsVectorFormat(template, path, options)
+    error, message = result[:2] if isinstance(result, tuple) else (result, "")
+    if error != QgsVectorFileWriter.NoError:
+        raise IOError("Cannot create table \"{}\" in \"{}\": {}".format(table, path, message))
+
+    layer = QgsVectorLayer(uri, table, "ogr")
+    if not layer.isValid():
+        raise IOError("Cannot open table \"{}\" in \"{}\"".format(table, path))
+    return layer
+
+
+class FileOutputStream:
+    """
+    Streams features directly into a new file through a QgsVectorFileWriter. Used for formats, which cannot be
+    appended (FlatGeobuf).
+    """
+
+    def __init__(self, path: str, output_format: int, name: str, crs: QgsCoordinateReferenceSystem,
+                 bands: bool = False) -> None:
+        """
+        Initialization of the class
+        :param path: path of the new file
+        :param output_format: output format
+        :param name: layer name
+        :param crs: coordinate reference system of the file
+        :param bands: True, if the file stores band polygons instead of lines
+        :raises IOError: if the file cannot be created
+        """
+        self.__path = path
+        self.__name = name
+        self.__fields = output_fields(bands)
+        driver = OUTPUT_FORMATS[output_format][1]
+        wkb_type = QgsWkbTypes.MultiPolygon if bands else QgsWkbTypes.MultiLineString
+        self.__writer = QgsVectorFileWriter(path, "UTF-8", self.__fields, wkb_type, crs, driver)
+        if self.__writer.hasError() != QgsVectorFileWriter.NoError:
+            raise IOError("Cannot create \"{}\": {}".format(path, self.__writer.errorMessage()))
+
+    @property
+    def fields(self) -> QgsFields:
+        """
+        returns the fields of the file
+        :return: the fields of the file
+        """
+        return self.__fields
+
+    @property
+    def path(self) -> str:
+        """
+        returns the path of the file
+        :return: the path of the file
+        """
+        return self.__path
+
+    @property
+    def sink(self) -> QgsVectorFileWriter:
+        """
+        returns the feature sink of the file
+        :return: the feature sink of the file
+        """
+        return self.__writer
+
+    def close(self) -> QgsVectorLayer:
+        """
+        Finishes the file and opens it as layer. The FeatureWriter of the sink has to be closed first.
+        :return: the layer of the written file
+        :raises IOError: if the written file cannot be opened
+        """
+        # the file is completed, when the writer is deleted, the bulk writer must have released it before
+        if self.__writer is not None:
+            self.__writer.flushBuffer()
+            del self.__writer
+            self.__writer = None
+        layer = QgsVectorLayer(self.__path, self.__name, "ogr")
+        if not layer.isValid():
+            raise IOError("Cannot open \"{}\"".format(self.__path))
+        return layer
@@ -17,8 +17,11 @@ email                : stephan@donndorf.info
  ***************************************************************************/
 """
 
+import json
 import math
-from typing import Any, List
+from typing import Any, List, Tuple
+
+import numpy as np
 
 from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QRect, QRectF, QSize, QVariant, Qt
 from PyQt5.QtGui import QBrush, QColor, QPainter, QPen
@@ -26,11 +29,33 @@ from PyQt5.QtWidgets import QCheckBox, QLabel, QStyledItemDelegate, QStyleOption
 from qgis.gui import QgsColorButton
 
 
+# types of the unit fields by column index: construct unit, base unit, name, distance, color
+FIELD_TYPES = (bool, bool, str, int, QColor)
+
+
+def _check_value(index: int, value: Any) -> None:
+    """
+    Checks the type of a unit field value
+    :param index: column index of the field
+    :param value: new value of the field
+    :return: Nothing
+    :raises IndexError: if index is not between 0 and the number of fields
+    :raises TypeError: if value type doesn't fit to the requested type (id 0 and 1: bool, 2: str, 3: int, 4: QColor
+    """
+    if not (0 <= index < len(FIELD_TYPES)):
+        raise IndexError("Wrong key used")
+    if not isinstance(value, FIELD_TYPES[index]):
+        raise TypeError("value must be of type {}".format(FIELD_TYPES[index].__name__))
+
+
 class UnitConstructionData:
     """
-    Data storage class for a single unit to be constructed
+    Data storage class for a single unit to be constructed. The fields are stored in slots, the color as packed
+    RGBA value.
     """
 
+    __slots__ = ("__construct_unit", "__base_unit", "__name", "__distance", "__rgba")
+
     # define header name class wide
     __header_names = [
         "construct unit",
@@ -50,7 +75,6 @@ class UnitConstructionData:
         :param distance: distance to the upper unit
         :param color: color for unit construction
         """
-        self.__data = [None, None, None, None, None]
         self.construct_unit = construct_unit
         self.base_unit = base_unit
         self.name = name
@@ -74,13 +98,13 @@ class UnitConstructionData:
                                                                                      self.base_unit, self.distance,
                                                                                      self.color.name())
 
-    def __getitem__(self, item: int or List[int]) -> object or List:
+    def __getitem__(self, item: int or slice) -> object or List:
         """
         returns the item at position item or a list of items if a slice is requested
         :param item: index of the item(s)
         :return: returns the item at position item or a list of items if a slice is requested
         """
-        return self.__data[item]
+        return [self.__construct_unit, self.__base_unit, self.__name, self.__distance, self.color][item]
 
     def __setitem__(self, index: int, value: Any) -> None:
         """
@@ -88,20 +112,20 @@ class UnitConstructionData:
         :param index: index of the item to be changed
         :param value: new value of the item at position index
         :return: Nothing
-        :raises IndexError: if index is not between 0 and len(self.__data)
+        :raises IndexError: if index is not between 0 and the number of fields
         :raises TypeError: if value type doesn't fit to the requested type (id 0 and 1: bool, 2: str, 3: int, 4: QColor
         """
-        if not (0 <= index < len(self.__data)):
-            raise IndexError("Wrong key used")
-        if index in (0, 1) and not isinstance(value, bool):
-            raise TypeError("value must be of type bool")
-        if index == 2 and not isinstance(value, str):
-            raise TypeError("value must be of type str")
-        if index == 3 and not isinstance(value, int):
-            raise TypeError("value must be of type int")
-        if index == 4 and not isinstance(value, QColor):
-            raise TypeError("value must be of type QColor")
-        self.__data[index] = value
+        _check_value(index, value)
+        if index == 0:
+            self.__construct_unit = value
+        elif index == 1:
+            self.__base_unit = value
+        elif index == 2:
+            self.__name = value
+        elif index == 3:
+            self.__distance = value
+        else:
+            self.__rgba = value.rgba()
 
     # setter and getter
     @property
@@ -110,8 +134,7 @@ class UnitConstructionData:
         returns if the unit is the base unit
         :return: returns if the unit is the base unit
         """
-        # noinspection PyTypeChecker
-        return self.__data[1]
+        return self.__base_unit
 
     @base_unit.setter
     def base_unit(self, value: bool) -> None:
@@ -121,25 +144,24 @@ class UnitConstructionData:
         :return: Nothing
         :raises ValueError: if value cannot be converted to type bool
         """
-        self.__data[1] = bool(value)
+        self.__base_unit = bool(value)
 
     @property
     def color(self) -> QColor:
         """
-        returns the current color of the object
+        returns a new QColor object with the current color of the object
         :return: returns the current color of the object
         """
-        # noinspection PyTypeChecker
-        return self.__data[4]
+        return QColor.fromRgba(self.__rgba)
 
     @color.setter
     def color(self, value: QColor) -> None:
         """
-        Creates a new QColor object from the given value
+        Sets the color of the object from the given value
         :param value: new color of the object
         :return: Nothing
         """
-        self.__data[4] = QColor(value)
+        self.__rgba = QColor(value).rgba()
 
     @property
     def construct_unit(self) -> bool:
@@ -147,8 +169,7 @@ class UnitConstructionData:
         returns, if the unit should be constructed
         :return: returns, if the unit should be constructed
         """
-        # noinspection PyTypeChecker
-        return self.__data[0]
+        return self.__construct_unit
 
     @construct_unit.setter
     def construct_unit(self, value: bool) -> None:
@@ -158,7 +179,7 @@ class UnitConstructionData:
         :return: Nothing
         :raises ValueError: if value cannot be converted to bool
         """
-        self.__data[0] = bool(value)
+        self.__construct_unit = bool(value)
 
     @property
     def distance(self) -> int:
@@ -166,8 +187,7 @@ class UnitConstructionData:
         returns the distance to the next upper unit
         :return: returns the distance to the next upper unit
         """
-        # noinspection PyTypeChecker
-        return self.__data[3]
+        return self.__distance
 
     @distance.setter
     def distance(self, value: int) -> None:
@@ -176,7 +196,7 @@ class UnitConstructionData:
         :param value: distance to the next upper unit
         :return: Northing
         """
-        self.__data[3] = int(value)
+        self.__distance = int(value)
 
     @property
     def name(self) -> str:
@@ -184,8 +204,7 @@ class UnitConstructionData:
         returns the current name of the object
         :return: returns the current name of the object
         """
-        # noinspection PyTypeChecker
-        return self.__data[2]
+        return self.__name
 
     @name.setter
     def name(self, value: str) -> None:
@@ -194,7 +213,15 @@ class UnitConstructionData:
         :param value: new name of the object
         :return: Nothing
         """
-        self.__data[2] = str(value)
+        self.__name = str(value)
+
+    @property
+    def rgba(self) -> int:
+        """
+        returns the packed RGBA value of the color
+        :return: returns the color as QRgb value
+        """
+        return self.__rgba
 
     # class methods
     @classmethod
@@ -218,9 +245,46 @@ class UnitConstructionData:
         return ""
 
 
+def unit_table_from_json(data_loaded: dict) -> List[UnitConstructionData]:
+    """
+    Parses a unit table in the JSON format written by the save unit table button
+    :param data_loaded: parsed JSON dictionary with the row index as key and a dictionary of header names and values
+    :return: list of UnitConstructionData items sorted by the row index
+    :raises ValueError: if a key is unknown or cannot be converted to a row index
+    :raises TypeError: if a value has the wrong type
+    """
+    model_data = list()
+    keys = [int(i) for i in list(data_loaded.keys())]
+    keys.sort()
+    for i in keys:
+        i = str(i)
+        data = UnitConstructionData()
+        for j in data_loaded[i]:
+            index = UnitConstructionData.get_header_index(j)
+            value = data_loaded[i][j]
+            if j == "color":
+                value = QColor(value)
+            data[index] = value
+        model_data.append(data)
+    return model_data
+
+
+def read_unit_table(path: str) -> List[UnitConstructionData]:
+    """
+    Reads a unit table from a JSON file
+    :param path: path of the JSON file
+    :return: list of UnitConstructionData items sorted by the row index
+    :raises ValueError: if the file content cannot be parsed
+    """
+    with open(path) as data_file:
+        return unit_table_from_json(json.load(data_file))
+
+
 class UnitConstructionModel(QAbstractTableModel):
     """
-    Derived Table Model for the storage of UnitConstructionData
+    Derived Table Model for the storage of UnitConstructionData. The units are stored column wise: the flags and the
+    distances in NumPy arrays, the colors as packed RGBA values and the names in a list. The base unit is stored as
+    row index, so exactly one unit is the base unit.
     """
 
     def __init__(self, data: List[UnitConstructionData] = list(), parent: QWidget = None, *args) -> None:
@@ -230,19 +294,15 @@ class UnitConstructionModel(QAbstractTableModel):
         """
         # noinspection PyArgumentList
         QAbstractTableModel.__init__(self, parent, *args)
-        self.__data_list = data
-        bases = [x.base_unit for x in data]
-        if True not in bases and len(data) > 0:
-            self.__data_list[0][1] = True
-            self.__base_item = 0
-        elif len(data) > 0:
-            first = bases.index(True)
-            for dat in self.__data_list:
-                dat.base_unit = False
-            self.__data_list[first].base_unit = True
-            self.__base_item = first
+        self.__construct = np.array([unit.construct_unit for unit in data], dtype=bool)
+        self.__names = [unit.name for unit in data]
+        self.__distances = np.array([unit.distance for unit in data], dtype=np.int64)
+        self.__colors = np.array([unit.rgba for unit in data], dtype=np.uint32)
+        bases = [unit.base_unit for unit in data]
+        if True in bases:
+            self.__base_item = bases.index(True)
         else:
-            self.__base_item = -1
+            self.__base_item = 0 if len(data) > 0 else -1
 
         self.__header_labels = ["build", "base", "unit name", "distance", "color"]
 
@@ -267,6 +327,38 @@ class UnitConstructionModel(QAbstractTableModel):
         """
         return self.__base_item
 
+    @property
+    def colors(self) -> np.ndarray:
+        """
+        returns the packed RGBA colors of all units as read-only view, which is not copied
+        :return: uint32 array with the QRgb value of every unit
+        """
+        return self.__read_only(self.__colors)
+
+    @property
+    def construct_flags(self) -> np.ndarray:
+        """
+        returns the construct flags of all units as read-only view, which is not copied
+        :return: boolean array, True for every unit, which should be constructed
+        """
+        return self.__read_only(self.__construct)
+
+    @property
+    def distances(self) -> np.ndarray:
+        """
+        returns the distances of all units to their upper unit as read-only view, which is not copied
+        :return: int64 array with the distance of every unit
+        """
+        return self.__read_only(self.__distances)
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """
+        returns the names of all units
+        :return: tuple with the name of every unit
+        """
+        return tuple(self.__names)
+
     def columnCount(self, parent: QModelIndex = ...) -> int:
         """
         returns the current column count of the table model
@@ -286,7 +378,7 @@ class UnitConstructionModel(QAbstractTableModel):
         if not index.isValid():
             return QVariant()
         elif role in (Qt.DisplayRole, Qt.EditRole):
-            return QVariant(self.__data_list[index.row()][index.column()])
+            return QVariant(self.__value(index.row(), index.column()))
         elif index.column() == 3 and role == Qt.TextAlignmentRole:
             return Qt.AlignRight
         return QVariant()
@@ -314,8 +406,16 @@ class UnitConstructionModel(QAbstractTableModel):
         if row < 0:
             self.endInsertRows()
             return False
-        self.__data_list.insert(row, data)
-        self.__check_base(row)
+        row = min(row, self.rowCount())
+        self.__construct = np.insert(self.__construct, row, data.construct_unit)
+        self.__names.insert(row, data.name)
+        self.__distances = np.insert(self.__distances, row, data.distance)
+        self.__colors = np.insert(self.__colors, row, data.rgba)
+        # an inserted base unit replaces the previous one
+        if data.base_unit or self.__base_item == -1:
+            self.__base_item = row
+        elif self.__base_item >= row:
+            self.__base_item += 1
         self.endInsertRows()
         return True
 
@@ -327,8 +427,7 @@ class UnitConstructionModel(QAbstractTableModel):
         """
         if 0 < row < self.rowCount():
             self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), row - 1)
-            item = self.__data_list.pop(row)
-            self.__data_list.insert(row - 1, item)
+            self.__swap(row, row - 1)
             self.endMoveRows()
 
     def move_row_down(self, row: int) -> None:
@@ -339,18 +438,18 @@ class UnitConstructionModel(QAbstractTableModel):
         """
         if 0 <= row < self.rowCount() - 1:
             self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), row + 2)
-            item = self.__data_list.pop(row)
-            self.__data_list.insert(row + 1, item)
+            self.__swap(row, row + 1)
             self.endMoveRows()
 
     def row(self, index: int) -> UnitConstructionData or None:
         """
-        returns UnitConstructionData-item at given index
+        returns a UnitConstructionData-item with the values of the given row. The item is a copy, changes of the item
+        don't change the model.
         :param index: index of requested UnitConstructionData-item
         :return: returns the item at given index
         """
         if 0 <= index < self.rowCount():
-            return self.__data_list[index]
+            return UnitConstructionData(*[self.__value(index, column) for column in range(len(FIELD_TYPES))])
         return None
 
     def rowCount(self, parent: QModelIndex = ...) -> Any:
@@ -359,7 +458,7 @@ class UnitConstructionModel(QAbstractTableModel):
         :param parent: redundant parameter as this derived class isn't a tree model
         :return: returns the current row count of the table model
         """
-        return len(self.__data_list)
+        return len(self.__names)
 
     # noinspection PyMethodOverriding
     def removeRow(self, row: int) -> bool:
@@ -370,8 +469,15 @@ class UnitConstructionModel(QAbstractTableModel):
         """
         self.beginRemoveRows(QModelIndex(), row, row)
         if 0 <= row < self.rowCount():
-            del self.__data_list[row]
-            self.__check_base()
+            self.__construct = np.delete(self.__construct, row)
+            del self.__names[row]
+            self.__distances = np.delete(self.__distances, row)
+            self.__colors = np.delete(self.__colors, row)
+            # a removed base unit is replaced by the first unit
+            if self.__base_item == row:
+                self.__base_item = 0 if self.rowCount() > 0 else -1
+            elif self.__base_item > row:
+                self.__base_item -= 1
             self.endRemoveRows()
             return True
         self.endRemoveRows()
@@ -384,40 +490,97 @@ class UnitConstructionModel(QAbstractTableModel):
         :param value: new value to be set
         :param role: role of data
         :return: True, if the data was set successfully, else False
+        :raises TypeError: if value type doesn't fit to the column type
         """
         if not index.isValid():
             return False
         if role == Qt.EditRole:
-            self.__data_list[index.row()][index.column()] = value
-            if index.column() == 1:
-                self.__check_base(index.row())
+            row = index.row()
+            column = index.column()
+            _check_value(column, value)
+            if column == 0:
+                self.__construct[row] = value
+            elif column == 1:
+                # exactly one unit is the base unit, the first unit replaces an unset base unit
+                if value:
+                    self.__base_item = row
+                elif row == self.__base_item:
+                    self.__base_item = 0
+            elif column == 2:
+                self.__names[row] = value
+            elif column == 3:
+                self.__distances[row] = value
+            else:
+                self.__colors[row] = value.rgba()
             # noinspection PyUnresolvedReferences
             self.dataChanged.emit(index, index, [Qt.EditRole])
         return True
 
-    def __check_base(self, row: int = -1) -> None:
-        """
-        Ensures, that exactly one unit is a base unit. If more than one row is set, the given row index is preferred,
-        else the first set value. If now row is set as a base unit, the first unit will be set as base
-        :param row: last changed row index
+    def unit_columns(self, side: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculates the signed cumulative offset distance of every unit, which has to be constructed, with one
+        prefix sum per direction. Units above the base unit are returned first (upwards), followed by the base unit
+        and the units below (downwards).
+        :param side: construction side (1: in line direction left, -1: in line direction right)
+        :return: tuple of the row indices of the constructed units, their signed cumulative distance and the signed
+        distance of their lower boundary
+        """
+        base = self.__base_item
+        if base == -1:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        # upwards the distance of a unit is added before it is constructed, downwards afterwards
+        upwards = np.arange(base + 1, self.rowCount())
+        downwards = np.arange(base, -1, -1)
+        offsets = np.concatenate((np.cumsum(self.__distances[base + 1:]) * -side,
+                                  np.concatenate(([0], np.cumsum(self.__distances[base:0:-1]))) * side))
+        rows = np.concatenate((upwards, downwards))
+        selected = self.__construct[rows]
+        rows = rows[selected]
+        offsets = offsets[selected].astype(np.int64)
+        return rows, offsets, offsets + side * self.__distances[rows]
+
+    @staticmethod
+    def __read_only(array: np.ndarray) -> np.ndarray:
+        """
+        returns a read-only view of the array
+        :param array: column array
+        :return: view of the array, which cannot be written
+        """
+        view = array.view()
+        view.setflags(write=False)
+        return view
+
+    def __swap(self, first: int, second: int) -> None:
+        """
+        Swaps two rows, the base unit moves with its row
+        :param first: index of the first row
+        :param second: index of the second row
         :return: Nothing
         """
-        if self.rowCount() == 0 or not (0 <= row < self.rowCount()):
-            return
-
-        found = list()
-        for i in range(self.rowCount()):
-            if self.__data_list[i].base_unit:
-                found.append(i)
-                self.__data_list[i].base_unit = False
-
-        if len(found) == 0:
-            self.__data_list[0].base_unit = True
-            self.__base_item = 0
-            return
-        index = row if row in found else found[0]
-        self.__data_list[index].base_unit = True
-        self.__base_item = index
+        for column in (self.__construct, self.__distances, self.__colors):
+            column[[first, second]] = column[[second, first]]
+        self.__names[first], self.__names[second] = self.__names[second], self.__names[first]
+        if self.__base_item in (first, second):
+            self.__base_item = first + second - self.__base_item
+
+    def __value(self, row: int, column: int) -> Any:
+        """
+        returns the value of a unit field as Python object
+        :param row: row index of the unit
+        :param column: column index of the field
+        :return: bool, str, int or QColor value of the field
+        """
+        if column == 0:
+            return bool(self.__construct[row])
+        if column == 1:
+            return row == self.__base_item
+        if column == 2:
+            return self.__names[row]
+        if column == 3:
+            return int(self.__distances[row])
+        return QColor.fromRgba(int(self.__colors[row]))
 
 
 class UnitConstructionDelegate(QStyledItemDelegate):
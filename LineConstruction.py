@@ -17,19 +17,45 @@ email                : stephan@donndorf.info
  ***************************************************************************/
 """
 
-import sys
-import traceback
-from typing import List
+import hashlib
+import math
+import os
+from functools import partial
+from typing import Callable, Dict, List, Tuple
 
 import numpy as np
 from PyQt5.QtCore import QObject, QVariant, pyqtSignal
-from qgis.core import QgsGeometry, QgsCategorizedSymbolRenderer, QgsFeature, QgsField, QgsMapLayer, QgsMessageLog, \
-    QgsPoint, QgsPointXY, QgsProject, QgsRendererCategory, QgsSymbol, QgsVectorLayer, QgsWkbTypes
-from qgis.gui import QgisInterface, QgsMessageBar, QgsRubberBand
+from PyQt5.QtGui import QColor
+from qgis.core import QgsApplication, QgsGeometry, QgsCategorizedSymbolRenderer, QgsCoordinateReferenceSystem, \
+    QgsCoordinateTransform, QgsCsException, QgsField, QgsMapLayer, QgsPoint, QgsPointXY, QgsProject, QgsRectangle, \
+    QgsRendererCategory, QgsSymbol, QgsUnitTypes, QgsVectorLayer, QgsWkbTypes
+from qgis.gui import QgisInterface
 
+from .CrsTransforms import CrsTransforms, crs_key, transform_arrays
+from .FeatureWriter import FeatureWriter
+from .FileOutput import BAND_SUFFIX, FORMAT_FLATGEOBUF, FORMAT_GEOPACKAGE, FileOutputStream, band_path, color_text, \
+    file_path, geopackage_layer, output_matches, unique_path
 from .HorizonConstruct import UnitConstructionModel
+from .OffsetDiskCache import OffsetDiskCache, unit_table_hash
+from .OffsetEngine import DEFAULT_SEGMENTS, MultiPartOffsetEngine, OffsetCache, arc_segments, arrays_to_geometry, \
+    clip_coordinates, geometry_to_arrays, line_to_array, simplify_coordinates
+from .OffsetTask import BatchOffsetTask, ConstructionSnapshot, OffsetTask, freeze_coordinates
+from .OutputLayerRegistry import DEFAULT_OUTPUT_NAME, OutputLayerRegistry
+from .PluginLogger import LOG_DEBUG, LOGGER
+from .PreviewCanvasItem import PreviewCanvasItem
+from .PreviewScheduler import PreviewScheduler
+from .SegmentIndex import SegmentIndex, nearest_side
+from .StageTimer import StageTimer
+from .UnitBands import unit_bands
 from .parallel_line_construction_dockwidget import ParallelLineConstructionDockWidget
 
+# line width of the output symbols in millimeters
+SYMBOL_WIDTH = 0.4
+# maximum deviation of the preview lines from the exact offsets in pixels
+PREVIEW_TOLERANCE = 0.5
+# the preview is computed for the visible extent enlarged by this fraction, so short pans need no recomputation
+PREVIEW_WINDOW_SLACK = 0.5
+
 
 class LineConstruction(QObject):
     """
@@ -45,15 +71,54 @@ class LineConstruction(QObject):
         self.__iface = iface
         self.__active_fid = -1
         self.__active_geometry = None
+        self.__active_geometry_hash = None
+        self.__active_coords = None
+        self.__active_extent = None  # type: QgsRectangle or None
         self.__active_line = None
+        self.__batch_geometries = list()
+        self.__batch_ids = list()  # type: List[int]
+        self.__disk_cache = None  # type: OffsetDiskCache or None
         self.__dockwidget = dockwidget
+        # offset engines of the last finished tasks by kind, their loops are updated after an edit of the base line
+        self.__engines = dict()  # type: Dict[str, MultiPartOffsetEngine]
         self.__model = None
+        self.__offset_cache = OffsetCache()
+        # noinspection PyArgumentList
+        self.__outputs = OutputLayerRegistry(QgsProject.instance(), parent=self)
+        self.__preview = PreviewCanvasItem(iface.mapCanvas())
+        self.__preview_margin = 0.0
+        self.__preview_tolerance = 0.0
+        self.__preview_window = None  # type: QgsRectangle or None
+        self.__scheduler = PreviewScheduler(parent=self)
+        self.__segment_index = None
         self.__side = 0
+        self.__symbols = dict()  # type: Dict[Tuple[str, int, int], QgsSymbol]
+        self.__side_position = None
+        # reference system of the active layer, the active line is transformed into the working reference system
+        self.__source_crs = QgsCoordinateReferenceSystem()
+        self.__tasks = dict()  # type: Dict[str, OffsetTask]
+        self.__timings = StageTimer()
         self.__tmp_units = list()
+        # noinspection PyArgumentList
+        self.__transforms = CrsTransforms(QgsProject.instance().transformContext())
+        self.__workers = os.cpu_count() or 1
+        self.__working_crs = QgsCoordinateReferenceSystem()
 
+        # all invalidations are coalesced by the scheduler
+        # noinspection PyUnresolvedReferences
+        self.__scheduler.triggered.connect(self.__construct_frame_lines)
+        # noinspection PyUnresolvedReferences
+        self.side_changed.connect(self.__scheduler.request)
+        self.__dockwidget.line_join_style.currentIndexChanged.connect(self.__scheduler.request)
+        # the preview is re-simplified, if the zoom level changes, and extended, if the visible extent leaves the
+        # computed window
         # noinspection PyUnresolvedReferences
-        self.side_changed.connect(self.__construct_frame_lines)
-        self.__dockwidget.line_join_style.currentIndexChanged.connect(self.__construct_frame_lines)
+        self.__iface.mapCanvas().extentsChanged.connect(self.__on_extents_changed)
+        # noinspection PyUnresolvedReferences
+        self.__outputs.targets_changed.connect(self.__update_output_targets)
+        self.__update_output_targets()
+        # noinspection PyArgumentList,PyUnresolvedReferences
+        QgsProject.instance().transformContextChanged.connect(self.__on_transform_context_changed)
 
     # signals
     side_changed = pyqtSignal(name='side_changed')
@@ -98,6 +163,7 @@ class LineConstruction(QObject):
             raise TypeError("Parameter is not of type QgsGeometry")
 
         self.__active_geometry = geom
+        self.__active_geometry_hash = None
 
     @property
     def active_line(self) -> List[QgsPointXY]:
@@ -110,7 +176,8 @@ class LineConstruction(QObject):
     @active_line.setter
     def active_line(self, line: List[QgsPointXY] or None) -> None:
         """
-        Sets the currently active line as a list of Tuples with x, y coordinates
+        Sets the currently active line as a list of Tuples with x, y coordinates. If the active geometry is a
+        multi part geometry, the line is its first part and all parts are used for the construction.
         :param line: current active line
         :return: Nothing
         :raises TypeError: if parameter is not a list or parameter items not tuples
@@ -125,8 +192,81 @@ class LineConstruction(QObject):
                 raise TypeError("List item is not a QgsPointXY")
 
         self.__active_line = line
+
+        # all parts of the active geometry are constructed, the active line is the first one
+        parts = list()
+        if self.__active_geometry is not None:
+            parts = [part for part in geometry_to_arrays(self.__active_geometry) if len(part) > 1]
+        if len(parts) == 0:
+            parts = [line_to_array(line)]
+
+        # the offsets are computed in a projected working reference system
+        self.__working_crs = self.__transforms.working_crs(self.__source_crs, parts)
+        try:
+            parts = transform_arrays(parts, self.__transforms.get(self.__source_crs, self.__working_crs))
+        except QgsCsException as e:
+            LOGGER.warning("The line cannot be transformed into {}, it is constructed in {}: {}",
+                           self.__working_crs.authid(), self.__source_crs.authid(), str(e))
+            self.__working_crs = self.__source_crs
+        self.__active_coords = tuple(freeze_coordinates(part) for part in parts)
+        lower = np.min([part.min(axis=0) for part in parts], axis=0)
+        upper = np.max([part.max(axis=0) for part in parts], axis=0)
+        self.__active_extent = QgsRectangle(float(lower[0]), float(lower[1]), float(upper[0]), float(upper[1]))
+        try:
+            self.__segment_index = SegmentIndex(self.__active_coords)
+        except ValueError:
+            self.__segment_index = None
         self.side_changed.emit()
 
+    @property
+    def batch_geometries(self) -> List[QgsGeometry]:
+        """
+        Returns the geometries of all selected features, which are used for a batch construction
+        :return: Returns the geometries of all selected features
+        """
+        return self.__batch_geometries
+
+    @batch_geometries.setter
+    def batch_geometries(self, geometries: List[QgsGeometry]) -> None:
+        """
+        Sets the geometries of all selected features, which are used for a batch construction
+        :param geometries: list of line geometries
+        :return: Nothing
+        :raises TypeError: if parameter is not a list or parameter items are not of type QgsGeometry
+        """
+        if not isinstance(geometries, list):
+            raise TypeError("Parameter is not a list")
+        for geometry in geometries:
+            if not isinstance(geometry, QgsGeometry):
+                raise TypeError("List item is not a QgsGeometry")
+
+        self.__batch_geometries = geometries
+
+    @property
+    def batch_feature_ids(self) -> List[int]:
+        """
+        Returns the ids of all selected features in the order of the batch geometries, they are used to report
+        skipped features
+        :return: Returns the ids of all selected features
+        """
+        return self.__batch_ids
+
+    @batch_feature_ids.setter
+    def batch_feature_ids(self, ids: List[int]) -> None:
+        """
+        Sets the ids of all selected features in the order of the batch geometries
+        :param ids: list of feature ids
+        :return: Nothing
+        :raises TypeError: if parameter is not a list or parameter items are not of type int
+        """
+        if not isinstance(ids, list):
+            raise TypeError("Parameter is not a list")
+        for fid in ids:
+            if not isinstance(fid, int):
+                raise TypeError("List item is not of type int")
+
+        self.__batch_ids = ids
+
     @property
     def model(self) -> UnitConstructionModel:
         """
@@ -145,14 +285,58 @@ class LineConstruction(QObject):
         """
         if self.__model is not None:
             # noinspection PyUnresolvedReferences
-            self.__model.dataChanged.disconnect(self.__construct_frame_lines)
+            self.__model.dataChanged.disconnect(self.__scheduler.request)
         if model is None:
             self.__model = None
         if not isinstance(model, UnitConstructionModel):
             raise TypeError("Parameter is not of type HorizonConstructionModel")
         self.__model = model
         # noinspection PyUnresolvedReferences
-        self.__model.dataChanged.connect(self.__construct_frame_lines)
+        self.__model.dataChanged.connect(self.__scheduler.request)
+
+    @property
+    def disk_cache(self) -> OffsetDiskCache or None:
+        """
+        Returns the persistent cache of whole constructions
+        :return: Returns the disk cache or None, if the offsets are not cached on disk
+        """
+        return self.__disk_cache
+
+    @disk_cache.setter
+    def disk_cache(self, cache: OffsetDiskCache or None) -> None:
+        """
+        Sets the persistent cache of whole constructions
+        :param cache: disk cache or None to disable the disk cache
+        :return: Nothing
+        :raises TypeError: if cache is neither None nor of type OffsetDiskCache
+        """
+        if cache is not None and not isinstance(cache, OffsetDiskCache):
+            raise TypeError("Parameter is not of type OffsetDiskCache")
+        self.__disk_cache = cache
+
+    @property
+    def offset_cache(self) -> OffsetCache:
+        """
+        Returns the LRU cache of the offset geometries, including its hit and miss counters
+        :return: Returns the LRU cache of the offset geometries
+        """
+        return self.__offset_cache
+
+    @property
+    def outputs(self) -> OutputLayerRegistry:
+        """
+        Returns the registry of the output layers
+        :return: Returns the registry of the output layers
+        """
+        return self.__outputs
+
+    @property
+    def scheduler(self) -> PreviewScheduler:
+        """
+        Returns the scheduler, which coalesces the preview recomputations
+        :return: Returns the preview scheduler
+        """
+        return self.__scheduler
 
     @property
     def side(self) -> int:
@@ -179,160 +363,625 @@ class LineConstruction(QObject):
             # noinspection PyUnresolvedReferences
             self.side_changed.emit()
 
+    @property
+    def source_crs(self) -> QgsCoordinateReferenceSystem:
+        """
+        Returns the reference system of the active geometry and the batch geometries
+        :return: Returns the reference system of the active layer
+        """
+        return self.__source_crs
+
+    @source_crs.setter
+    def source_crs(self, crs: QgsCoordinateReferenceSystem) -> None:
+        """
+        Sets the reference system of the active geometry and the batch geometries. It has to be set before the
+        active line.
+        :param crs: reference system of the active layer
+        :return: Nothing
+        :raises TypeError: if crs is not of type QgsCoordinateReferenceSystem
+        """
+        if not isinstance(crs, QgsCoordinateReferenceSystem):
+            raise TypeError("Parameter is not of type QgsCoordinateReferenceSystem")
+        self.__source_crs = crs
+
+    @property
+    def timings(self) -> StageTimer:
+        """
+        returns the timing spans of the construction stages
+        :return: the stage timer of the construction
+        """
+        return self.__timings
+
+    @property
+    def transforms(self) -> CrsTransforms:
+        """
+        Returns the cache of the coordinate transforms
+        :return: Returns the cache of the coordinate transforms
+        """
+        return self.__transforms
+
+    @property
+    def workers(self) -> int:
+        """
+        Returns the number of worker threads used for the offset computation
+        :return: Returns the number of worker threads
+        """
+        return self.__workers
+
+    @workers.setter
+    def workers(self, workers: int) -> None:
+        """
+        Sets the number of worker threads used for the offset computation
+        :param workers: number of worker threads, 1 computes all offsets serially
+        :return: Nothing
+        :raises ValueError: if workers is smaller than 1
+        """
+        workers = int(workers)
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+        self.__workers = workers
+
+    @property
+    def working_crs(self) -> QgsCoordinateReferenceSystem:
+        """
+        Returns the projected reference system, in which the offsets of the active line are computed
+        :return: Returns the working reference system
+        """
+        return self.__working_crs
+
     #
     # private functions
     #
 
+    def __build_batch(self, snapshot: ConstructionSnapshot) -> None:
+        """
+        Constructs the units along all selected features. The offsets are computed in a background task and
+        streamed into the output layer in chunks.
+        :param snapshot: snapshot of the construction along the active feature, which defines the unit table
+        :return: Nothing
+        """
+        position = self.__side_position
+        per_feature = self.__dockwidget.batch_side_rule.currentIndex() == 0 and position is not None
+        to_working = self.__transforms.get(self.__source_crs, self.__working_crs)
+
+        # the unit table prefix sums are shared by all features, only the sign depends on the feature side
+        snapshots = list()
+        untransformed = list()
+        ids = self.__batch_ids if len(self.__batch_ids) == len(self.__batch_geometries) else \
+            [None] * len(self.__batch_geometries)
+        for fid, geometry in zip(ids, self.__batch_geometries):
+            parts = [part for part in geometry_to_arrays(geometry) if len(part) > 1]
+            try:
+                parts = transform_arrays(parts, to_working)
+            except QgsCsException:
+                untransformed.append(fid)
+                continue
+            # degenerated features without any part are counted as skipped by the task
+            coords = tuple(freeze_coordinates(part) for part in parts)
+            factor = 1
+            if per_feature:
+                try:
+                    factor = nearest_side(coords, position.x(), position.y()) * self.__side
+                except ValueError:
+                    # degenerated features are skipped by the task
+                    pass
+            distances = tuple(distance * factor for distance in snapshot.distances)
+            lower_distances = tuple(distance * factor for distance in snapshot.lower_distances)
+            snapshots.append(snapshot._replace(coordinates=coords, geometry_hash="", distances=distances,
+                                               lower_distances=lower_distances))
+        if len(untransformed) > 0:
+            LOGGER.warning("batch: {} features cannot be transformed into the working reference system, skipped: {}",
+                           len(untransformed), ", ".join(str(fid) for fid in untransformed))
+
+        output = self.__output()
+        if output is None:
+            return
+        writer, finish = output
+        band_output = None
+        if self.__dockwidget.band_polygons.isChecked():
+            band_output = self.__output(bands=True)
+            if band_output is None:
+                return
+        band_writer = None if band_output is None else band_output[0]
+
+        self.__cancel_task("build")
+        task = BatchOffsetTask("Parallel line construction ({} features)".format(len(snapshots)), snapshots,
+                               self.__workers, bands=band_output is not None)
+        self.__tasks["build"] = task
+        # noinspection PyUnresolvedReferences
+        task.chunk_ready.connect(lambda units, bands: self.__on_batch_chunk(task, writer, band_writer, units, bands))
+        # noinspection PyUnresolvedReferences
+        task.taskCompleted.connect(
+            lambda: self.__on_batch_completed(task, writer, finish, band_output, len(untransformed)))
+        # noinspection PyUnresolvedReferences
+        task.taskTerminated.connect(lambda: self.__on_task_terminated("build", task))
+        # noinspection PyArgumentList
+        QgsApplication.taskManager().addTask(task)
+
     def __build_lines(self) -> None:
         """
-        Save the current self.__tmp_units in an in-memory layer called 'Parallel Unit Lines'
-        Create a layer with the given name if it is not existing
+        Computes the offset lines of the current construction and saves them in the layer of the selected output
+        target. Offsets, which are not cached, are computed in a background task.
         :return: Nothing
         """
-        unit_list = list()
-        for unit in self.__tmp_units:
-            unit_list.append([unit[0], unit[1].asGeometry()])
+        # apply a pending preview recomputation first
+        self.__scheduler.flush()
 
-        layers = [lyr for lyr in self.__iface.mapCanvas().layers() if lyr.name() == "Parallel Unit Lines"]
-        if len(layers) == 0:
+        with self.__timings.span("build: snapshot"):
+            snapshot = self.__snapshot()
+        if snapshot is None:
+            return
+
+        if self.__dockwidget.batch_construction.isChecked() and len(self.__batch_geometries) > 1:
+            self.__build_batch(snapshot)
+        else:
+            self.__request_offsets("build", snapshot, self.__write_lines)
+
+    def __cancel_task(self, kind: str) -> None:
+        """
+        Cancels the running task of the given kind
+        :param kind: task kind ("preview" or "build")
+        :return: Nothing
+        """
+        task = self.__tasks.pop(kind, None)
+        if task is None:
+            return
+        try:
+            task.cancel()
+        except RuntimeError:
+            # the task manager already deleted the underlying C++ object
+            pass
+
+    # noinspection PyUnusedLocal
+    def __construct_frame_lines(self, *args: List[object]) -> None:
+        """
+        slot, which constructs the frame lines, based on the given UnitConstructionModel/-Data for further unit
+        construction
+        It includes 3 temporary parameters for different signal connections
+        :param args: optional arguments to enable the function to work as slot for different signals
+        :return: Nothing
+        """
+
+        with self.__timings.span("preview: snapshot"):
+            # first: reset existing preview lines
+            self.__reset_tmp_units()
+
+            snapshot = self.__snapshot()
+            if snapshot is None:
+                self.__cancel_task("preview")
+                return
+
+            # only the part of the line, which influences the visible offsets, is computed
+            self.__preview_margin = max(abs(distance) for distance in snapshot.distances)
+            self.__preview_tolerance = self.__lod_tolerance()
+            self.__preview_window = self.__viewport_window(self.__preview_margin)
+            window = None
+            if self.__preview_window is not None:
+                window = (self.__preview_window.xMinimum(), self.__preview_window.yMinimum(),
+                          self.__preview_window.xMaximum(), self.__preview_window.yMaximum())
+            segments = arc_segments(self.__preview_margin, self.__preview_tolerance)
+            snapshot = snapshot._replace(segments=segments, tolerance=self.__preview_tolerance, window=window)
+        self.__request_offsets("preview", snapshot, self.__show_preview)
+
+    def __finish_layer(self, vector_layer: QgsVectorLayer) -> QgsVectorLayer:
+        """
+        Finishes the output into a layer by updating the layer extent once
+        :param vector_layer: output layer
+        :return: the output layer
+        """
+        vector_layer.updateExtents()
+        return vector_layer
+
+    def __finish_stream(self, stream: FileOutputStream, writer: FeatureWriter) -> QgsVectorLayer:
+        """
+        Finishes the output into a new file and adds the file to the project
+        :param stream: file output stream
+        :param writer: bulk writer of the stream, it releases the file writer before the file is completed
+        :return: the layer of the written file
+        :raises IOError: if the written file cannot be opened
+        """
+        writer.close()
+        vector_layer = stream.close()
+        current_layer = self.__iface.mapCanvas().currentLayer()
+        # noinspection PyArgumentList
+        QgsProject.instance().addMapLayer(vector_layer)
+        self.__iface.mapCanvas().setCurrentLayer(current_layer)
+        return vector_layer
+
+    def __geometry_hash(self) -> str:
+        """
+        Returns the hash of the WKB representation of the active geometry and of the reference systems, which
+        determine the offsets in the project reference system. The WKB hash is only calculated once per active
+        geometry.
+        :return: hex digest of the active geometry WKB and the reference systems
+        """
+        if self.__active_geometry_hash is None:
+            self.__active_geometry_hash = hashlib.sha1(bytes(self.__active_geometry.asWkb())).hexdigest()
+        # noinspection PyArgumentList
+        keys = (self.__active_geometry_hash, crs_key(self.__source_crs), crs_key(self.__working_crs),
+                crs_key(QgsProject.instance().crs()))
+        return hashlib.sha1("\n".join(keys).encode('utf-8')).hexdigest()
+
+    def __lod_tolerance(self) -> float:
+        """
+        Returns the simplification tolerance of the preview for the current map scale. The tolerance is rounded down
+        to a power of two, so panning and small zoom steps keep the previous level of detail.
+        :return: the simplification tolerance in map units
+        """
+        tolerance = self.__iface.mapCanvas().mapUnitsPerPixel() * PREVIEW_TOLERANCE
+        if self.__working_crs.isValid():
+            # noinspection PyArgumentList
+            tolerance *= QgsUnitTypes.fromUnitToUnitFactor(self.__iface.mapCanvas().mapUnits(),
+                                                           self.__working_crs.mapUnits())
+        if not tolerance > 0 or math.isinf(tolerance):
+            return 0.0
+        return 2.0 ** math.floor(math.log2(tolerance))
+
+    def __on_batch_chunk(self, task: BatchOffsetTask, writer: FeatureWriter, band_writer: FeatureWriter or None,
+                         units: List[List], bands: List[List]) -> None:
+        """
+        Writes a chunk of batch results into the output layer, if the task is still the current build task
+        :param task: emitting batch task
+        :param writer: bulk writer of the output layer
+        :param band_writer: bulk writer of the band polygon output or None, if no band polygons are constructed
+        :param units: list of [name, geometry] pairs
+        :param bands: list of [name, polygon, colour] triples
+        :return: Nothing
+        """
+        if self.__tasks.get("build") is not task:
+            return
+        try:
+            with self.__timings.span("batch: feature write"):
+                writer.add(units)
+                if band_writer is not None:
+                    band_writer.add(bands)
+        except Exception as e:
+            task.cancel()
+            LOGGER.exception(e)
+
+    def __on_batch_completed(self, task: BatchOffsetTask, writer: FeatureWriter, finish: Callable[[], QgsVectorLayer],
+                             band_output: Tuple[FeatureWriter, Callable[[], QgsVectorLayer]] or None,
+                             untransformed: int) -> None:
+        """
+        Finishes a batch construction: writes the remaining features, finishes the output, updates the symbology once
+        and reports the result
+        :param task: finished batch task
+        :param writer: bulk writer of the output
+        :param finish: function, which finishes the output and returns the output layer
+        :param band_output: bulk writer and finish function of the band polygon output or None
+        :param untransformed: number of features, which were skipped, because they cannot be transformed into the
+        working reference system
+        :return: Nothing
+        """
+        if self.__tasks.get("build") is not task:
+            return
+        del self.__tasks["build"]
+        self.__timings.record("batch: offsets", task.elapsed)
+
+        try:
+            with self.__timings.span("batch: feature write"):
+                writer.flush()
+                vector_layer = finish()
+            with self.__timings.span("batch: renderer"):
+                self.__update_renderer(vector_layer, writer.extent)
+            text = "{} lines constructed, {} features written ({:.0f} features/s)". \
+                format(task.count, writer.count, writer.features_per_second)
+            if band_output is not None:
+                band_writer, band_finish = band_output
+                with self.__timings.span("batch: feature write"):
+                    band_writer.flush()
+                    band_layer = band_finish()
+                with self.__timings.span("batch: renderer"):
+                    self.__update_renderer(band_layer, band_writer.extent)
+                text += ", {} band polygons written".format(band_writer.count)
+                if task.bands_skipped > 0:
+                    LOGGER.warning("batch: {} band polygons skipped", task.bands_skipped)
+                    text += ", {} band polygons skipped (no constructed lower boundary)".format(task.bands_skipped)
+            if task.loops_removed > 0:
+                text += ", {} invalid offset loops removed".format(task.loops_removed)
+            if task.fallbacks > 0:
+                text += ", {} invalid offset lines replaced by the GEOS offset curve".format(task.fallbacks)
+            if task.skipped > 0:
+                text += ", {} features skipped (less than two distinct vertices)".format(task.skipped)
+            if untransformed > 0:
+                text += ", {} features skipped (not transformable into the working reference system, feature ids " \
+                        "in the log)".format(untransformed)
+            self.__iface.messageBar().pushInfo("Batch construction", text)
+        except Exception as e:
+            LOGGER.exception(e)
+        finally:
+            self.reset()
+
+    def __on_extents_changed(self) -> None:
+        """
+        slot, which recomputes the preview, if the level of detail changed with the map scale or if the visible
+        extent is not covered by the computed window
+        :return: Nothing
+        """
+        if len(self.__tmp_units) == 0 and "preview" not in self.__tasks:
+            return
+        if self.__lod_tolerance() != self.__preview_tolerance:
+            self.__scheduler.request()
+            return
+        if self.__preview_window is not None:
+            visible = self.__visible_extent()
+            if visible is None:
+                self.__scheduler.request()
+                return
+            visible.grow(self.__preview_margin)
+            if not self.__preview_window.contains(visible):
+                self.__scheduler.request()
+
+    def __on_transform_context_changed(self) -> None:
+        """
+        slot, which drops the cached coordinate transforms, if the datum transformations of the project changed
+        :return: Nothing
+        """
+        # noinspection PyArgumentList
+        self.__transforms.context = QgsProject.instance().transformContext()
+        self.__offset_cache.clear()
+        self.__scheduler.request()
+
+    def __on_task_completed(self, kind: str, task: OffsetTask, keys: List[Tuple], disk_key: str or None,
+                            geometries: List[QgsGeometry], callback: Callable) -> None:
+        """
+        Stores the results of a finished task inside the offset cache and the complete construction inside the disk
+        cache and passes them to the callback, if the task is still the current one of its kind. Results of outdated
+        tasks are dropped.
+        :param kind: task kind ("preview" or "build")
+        :param task: finished task
+        :param keys: cache keys of all snapshot units
+        :param disk_key: disk cache key of the snapshot, None if it is not cached on disk
+        :param geometries: list of all snapshot geometries, None for the ones computed by the task
+        :param callback: function called with the snapshot and the complete list of geometries
+        :return: Nothing
+        """
+        if self.__tasks.get(kind) is not task:
+            return
+        del self.__tasks[kind]
+        self.__timings.record("{}: offsets".format(kind), task.elapsed)
+        if task.engine is not None:
+            self.__engines[kind] = task.engine
+
+        if task.loops_removed > 0:
+            LOGGER.info("{}: {} invalid offset loops removed", kind, task.loops_removed)
+        if task.fallbacks > 0:
+            LOGGER.info("{}: {} invalid offset lines replaced by the GEOS offset curve", kind, task.fallbacks)
+        for index, geometry in zip(task.indices, task.geometries):
+            self.__offset_cache.put(keys[index], geometry)
+            geometries[index] = geometry
+        if disk_key is not None and self.__disk_cache is not None:
+            with self.__timings.span("{}: disk cache write".format(kind)):
+                try:
+                    self.__disk_cache.put(disk_key, geometries)
+                except OSError as e:
+                    LOGGER.warning("Offsets could not be written into the disk cache: {}", str(e))
+        callback(task.snapshot, geometries)
+
+    def __on_task_terminated(self, kind: str, task: OffsetTask) -> None:
+        """
+        Forgets a cancelled or failed task
+        :param kind: task kind ("preview" or "build")
+        :param task: terminated task
+        :return: Nothing
+        """
+        if self.__tasks.get(kind) is task:
+            del self.__tasks[kind]
+
+    def __output(self, bands: bool = False) -> Tuple[FeatureWriter, Callable[[], QgsVectorLayer]] or None:
+        """
+        Prepares the output of a build. GeoPackage and temporary outputs append to the layer of the selected output
+        target, FlatGeobuf outputs are streamed into a new file. Band polygons are written into a separate layer or
+        file, whose name has the BAND_SUFFIX appended.
+        :param bands: True for the band polygon output, False for the line output
+        :return: tuple of the bulk writer and a function, which finishes the output and returns the output layer, or
+        None, if the output cannot be used
+        """
+        multipart = self.__dockwidget.multipart_output.isChecked()
+        output_format = self.__dockwidget.output_format.currentIndex()
+        if output_format == FORMAT_FLATGEOBUF:
+            path = self.__output_file(output_format)
+            if path is None:
+                return None
+            if bands:
+                path = band_path(path)
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                # noinspection PyArgumentList
+                stream = FileOutputStream(unique_path(path), output_format, name, QgsProject.instance().crs(), bands)
+            except IOError as e:
+                self.__iface.messageBar().pushCritical("Output File", str(e))
+                return None
+            writer = FeatureWriter(stream.sink, stream.fields, stream.fields.indexOf("name"), True, multipart,
+                                   color_field_index=stream.fields.indexOf("color"))
+            return writer, partial(self.__finish_stream, stream, writer)
+
+        output = self.__output_layer(bands)
+        if output is None:
+            return None
+        vector_layer, name_field_index, color_field_index = output
+        vpr = vector_layer.dataProvider()
+        # noinspection PyArgumentList
+        multi_layer = QgsWkbTypes.isMultiType(vector_layer.wkbType())
+        writer = FeatureWriter(vpr, vpr.fields(), name_field_index, multi_layer, multipart,
+                               color_field_index=color_field_index)
+        return writer, partial(self.__finish_layer, vector_layer)
+
+    def __output_file(self, output_format: int) -> str or None:
+        """
+        Returns the path of the selected output file with the extension of the output format
+        :param output_format: output format
+        :return: the path of the output file or None, if no file is selected
+        """
+        path = self.__dockwidget.output_file.filePath().strip()
+        if path == "":
+            self.__iface.messageBar().pushCritical("Output File", "No output file selected")
+            return None
+        return file_path(path, output_format)
+
+    def __output_layer(self, bands: bool = False) -> Tuple[QgsVectorLayer, int, int] or None:
+        """
+        Returns the layer of the selected output target and the indices of its name and colour attribute
+        Create an in-memory layer or a GeoPackage table for the target if it is not existing or if its layer is not
+        stored in the selected output format and file
+        :param bands: True for the band polygon layer of the target, False for the line layer
+        :return: tuple of layer, name attribute index and colour attribute index (-1 for line layers) or None, if the
+        layer cannot be used
+        """
+        name = self.__dockwidget.output_target.currentText().strip()
+        if name == "":
+            name = DEFAULT_OUTPUT_NAME
+        if bands:
+            name += BAND_SUFFIX
+
+        output_format = self.__dockwidget.output_format.currentIndex()
+        path = ""
+        if output_format == FORMAT_GEOPACKAGE:
+            path = self.__output_file(output_format)
+            if path is None:
+                return None
+
+        vector_layer = self.__outputs.layer(name)
+        if vector_layer is not None and not output_matches(vector_layer, output_format, path, name):
+            # the target was written in another format or into another file before, it gets a new layer
+            vector_layer = None
+        if vector_layer is None:
             current_layer = self.__iface.mapCanvas().currentLayer()
             # noinspection PyArgumentList
-            crs = QgsProject.instance().crs().toWkt()
-            uri = "linestring?crs=wkt:{}&field=name:string(255)".format(crs)
-            vector_layer = QgsVectorLayer(uri, "Parallel Unit Lines", "memory")
+            crs = QgsProject.instance().crs()
+            if output_format == FORMAT_GEOPACKAGE:
+                try:
+                    vector_layer = geopackage_layer(path, name, crs, bands)
+                except IOError as e:
+                    self.__iface.messageBar().pushCritical("Output File", str(e))
+                    return None
+            elif bands:
+                uri = "multipolygon?crs=wkt:{}&field=name:string(255)&field=color:string(9)".format(crs.toWkt())
+                vector_layer = QgsVectorLayer(uri, name, "memory")
+            else:
+                uri = "multilinestring?crs=wkt:{}&field=name:string(255)".format(crs.toWkt())
+                vector_layer = QgsVectorLayer(uri, name, "memory")
             # noinspection PyArgumentList
             QgsProject.instance().addMapLayer(vector_layer)
             self.__iface.mapCanvas().setCurrentLayer(current_layer)
-        else:
-            vector_layer = layers[0]
+            if vector_layer.isValid():
+                self.__outputs.register(name, vector_layer)
 
-        if (not vector_layer.isValid()) or (vector_layer.type() != QgsMapLayer.VectorLayer):
+        geometry_type = QgsWkbTypes.PolygonGeometry if bands else QgsWkbTypes.LineGeometry
+        if (not vector_layer.isValid()) or (vector_layer.type() != QgsMapLayer.VectorLayer) or \
+                (vector_layer.geometryType() != geometry_type):
             self.__iface.messageBar(). \
                 pushCritical("Wrong Layer Type",
-                             "The layer \"Parallel Unit Lines\" cannot be created or has the wrong format")
-            return
+                             "The layer \"{}\" cannot be created or has the wrong format".format(name))
+            return None
 
         vpr = vector_layer.dataProvider()
         fields = [f.name() for f in vpr.fields().toList()]
         if "name" not in fields:
             # noinspection PyArgumentList
             vpr.addAttributes([QgsField("name", QVariant.String, len=255)])
+        if bands and "color" not in fields:
+            # noinspection PyArgumentList
+            vpr.addAttributes([QgsField("color", QVariant.String, len=9)])
 
         name_field_index = vpr.fields().indexOf("name")
         if vpr.fields()[name_field_index].typeName().lower() != "string":
             self.__iface.messageBar(). \
                 pushCritical("Wrong Attribute Type",
-                             "The name attribute of the layer \"Parallel Unit Lines\" is not of type \"String\"!")
-            return
+                             "The name attribute of the layer \"{}\" is not of type \"String\"!".format(name))
+            return None
 
-        try:
-            # adding the features to the layer
-            for unit in unit_list:
-                f = QgsFeature()
-                f.setGeometry(unit[1])
-                attr = list()
-                for _ in vpr.fields().toList():
-                    attr.append(None)
-                attr[name_field_index] = unit[0]
-                f.setAttributes(attr)
-                vpr.addFeatures([f])
-
-            vector_layer.updateExtents()
-
-            # at least: try to set symbology
-            symbology = list()
-            for index in range(self.model.rowCount()):
-                row = self.model.row(index)
-                # noinspection PyArgumentList
-                sym = QgsSymbol.defaultSymbol(vector_layer.geometryType())
-                sym.setColor(row.color)
-                sym.setWidth(0.4)
-                category = QgsRendererCategory(row.name, sym, row.name)
-                symbology.append(category)
-
-            renderer = QgsCategorizedSymbolRenderer("name", symbology)
-            vector_layer.setRenderer(renderer)
-            vector_layer.triggerRepaint()
+        color_field_index = vpr.fields().indexOf("color") if bands else -1
+        return vector_layer, name_field_index, color_field_index
 
-        except Exception as e:
-            _, _, exc_traceback = sys.exc_info()
-            text = "Error Message:\n{}\nTraceback:\n{}".format(str(e), '\n'.join(traceback.format_tb(exc_traceback)))
-            # noinspection PyTypeChecker,PyCallByClass
-            QgsMessageLog.logMessage(text, level=2)
-        finally:
-            self.reset()
-
-    # noinspection PyUnusedLocal
-    def __construct_frame_lines(self, *args: List[object]) -> None:
+    def __request_offsets(self, kind: str, snapshot: ConstructionSnapshot, callback: Callable) -> None:
         """
-        slot, which constructs the frame lines, based on the given UnitConstructionModel/-Data for further unit
-        construction
-        It includes 3 temporary parameters for different signal connections
-        :param args: optional arguments to enable the function to work as slot for different signals
+        Requests the offset geometries for the given snapshot. Cached geometries are used directly, the missing
+        ones are computed in a background task, which replaces (and cancels) the running task of the same kind.
+        :param kind: task kind ("preview" or "build")
+        :param snapshot: immutable snapshot of the construction
+        :param callback: function called with the snapshot and the list of geometries
         :return: Nothing
         """
+        self.__cancel_task(kind)
 
-        # first: reset existing rubberband
-        self.__reset_tmp_units()
-
-        if self.__side == 0 or self.active_geometry is None:
+        with self.__timings.span("{}: cache lookup".format(kind)):
+            keys = [OffsetCache.key(snapshot.geometry_hash, distance, snapshot.join_style, snapshot.segments,
+                                    snapshot.tolerance, snapshot.window) for distance in snapshot.distances]
+            geometries = [self.__offset_cache.get(key) for key in keys]
+            missing = [i for i, geometry in enumerate(geometries) if geometry is None]
+        if len(missing) == 0:
+            callback(snapshot, geometries)
             return
 
-        sum_distances = 0
-        join_style = self.__dockwidget.line_join_style.currentIndex() + 1
+        # the disk cache only stores whole exact constructions, previews are clipped and simplified after loading.
+        # Batch snapshots have no geometry hash.
+        disk_key = None
+        if self.__disk_cache is not None and snapshot.geometry_hash != "":
+            exact = snapshot.window is None and snapshot.tolerance == 0 and snapshot.segments == DEFAULT_SEGMENTS
+            with self.__timings.span("{}: disk cache lookup".format(kind)):
+                disk_key = OffsetDiskCache.key(snapshot.geometry_hash, unit_table_hash(snapshot.distances),
+                                               self.__side, snapshot.join_style, DEFAULT_SEGMENTS)
+                stored = self.__disk_cache.get(disk_key)
+                if stored is not None and len(stored) == len(keys) and not exact:
+                    stored = self.__reduce_stored(snapshot, stored)
+            if stored is not None and len(stored) == len(keys):
+                for key, geometry in zip(keys, stored):
+                    self.__offset_cache.put(key, geometry)
+                callback(snapshot, stored)
+                return
+            if not exact:
+                disk_key = None
 
-        # upwards
-        base_item_index = self.__model.base_item_index
-        QgsMessageLog.logMessage("base_item_index: {}".format(base_item_index), level=0)
-        QgsMessageLog.logMessage(str(self.model.row(base_item_index)), level=0)
+        # only the preview is recomputed after every edit of the base line
+        task = OffsetTask("Parallel line construction ({})".format(kind), snapshot, missing, self.__workers,
+                          keep_loops=kind == "preview", previous=self.__engines.get(kind))
+        self.__tasks[kind] = task
+        # noinspection PyUnresolvedReferences
+        task.taskCompleted.connect(lambda: self.__on_task_completed(kind, task, keys, disk_key, geometries, callback))
+        # noinspection PyUnresolvedReferences
+        task.taskTerminated.connect(lambda: self.__on_task_terminated(kind, task))
+        # noinspection PyArgumentList
+        QgsApplication.taskManager().addTask(task)
 
-        if base_item_index == -1:
-            return
-        for row_index in range(base_item_index + 1, self.__model.rowCount()):
-            row = self.__model.row(row_index)
-            sum_distances += row.distance * self.side * -1
-            QgsMessageLog.logMessage("row.name: {} - sum_distances: {} m".format(row.name, sum_distances), level=0)
-            if row.construct_unit:
-                geometry = self.active_geometry.offsetCurve(sum_distances, 8, join_style,
-                                                            10 * sum_distances * (-1 if sum_distances < 0 else 1))
-                rubberband = QgsRubberBand(self.__iface.mapCanvas(), QgsWkbTypes.LineGeometry)
-                color = row.color
-                color.setAlpha(150)
-                rubberband.setColor(color)
-                rubberband.setWidth(2)
-                rubberband.addGeometry(geometry)
-                rubberband.show()
-                self.__tmp_units.append([row.name, rubberband])
-
-        # downwards
-        sum_distances = 0
-        for row_index in range(base_item_index, -1, -1):
-            row = self.__model.row(row_index)
-            if row.construct_unit:
-                geometry = self.active_geometry.offsetCurve(sum_distances, 8, join_style,
-                                                            10 * sum_distances * (-1 if sum_distances < 0 else 1))
-                rubberband = QgsRubberBand(self.__iface.mapCanvas(), QgsWkbTypes.LineGeometry)
-                color = row.color
-                color.setAlpha(150)
-                rubberband.setColor(color)
-                rubberband.setWidth(2)
-                rubberband.addGeometry(geometry)
-                rubberband.show()
-                self.__tmp_units.append([row.name, rubberband])
-            sum_distances -= row.distance * self.side * -1
+    def __reduce_stored(self, snapshot: ConstructionSnapshot, geometries: List[QgsGeometry]) -> List[QgsGeometry]:
+        """
+        Reduces the stored geometries of a whole construction to the preview of the snapshot: the lines are clipped
+        to the computation window and simplified to the map scale. The stored geometries are in the project
+        reference system, so the window is transformed into it.
+        :param snapshot: snapshot of the preview
+        :param geometries: stored offset geometries of the whole construction
+        :return: the clipped and simplified geometries
+        """
+        window = None
+        if snapshot.window is not None:
+            try:
+                # noinspection PyArgumentList
+                rectangle = self.__transforms.transform_rectangle(QgsRectangle(*snapshot.window), self.__working_crs,
+                                                                  QgsProject.instance().crs())
+                window = (rectangle.xMinimum(), rectangle.yMinimum(), rectangle.xMaximum(), rectangle.yMaximum())
+            except QgsCsException:
+                window = None
+        tolerance = 0.0
+        if snapshot.tolerance > 0:
+            tolerance = self.__iface.mapCanvas().mapUnitsPerPixel() * PREVIEW_TOLERANCE
 
-        self.__dockwidget.construct.setEnabled(True)
-        self.__dockwidget.construct.clicked.connect(self.__build_lines)
+        reduced = list()
+        for geometry in geometries:
+            parts = geometry_to_arrays(geometry)
+            if window is not None:
+                parts = [piece for part in parts for piece in clip_coordinates(part, window)]
+            if tolerance > 0:
+                parts = [simplify_coordinates(part, tolerance) for part in parts]
+            reduced.append(arrays_to_geometry(parts) if len(parts) > 0 else QgsGeometry())
+        return reduced
 
     def __reset_tmp_units(self) -> None:
         """
-        Removes all constructed rubberbands from the current QGIS canvas
+        Removes all constructed preview lines from the current QGIS canvas
         :return: Nothing
         """
-        for band in self.__tmp_units:
-            band[1].hide()
-            del band[1]
-
+        self.__preview.clear()
         self.__tmp_units = list()
         self.__dockwidget.construct.setEnabled(False)
         try:
@@ -340,34 +989,224 @@ class LineConstruction(QObject):
         except TypeError:
             pass
 
+    def __show_preview(self, snapshot: ConstructionSnapshot, geometries: List[QgsGeometry]) -> None:
+        """
+        Shows the given geometries as preview lines on the map canvas and enables the construct button
+        :param snapshot: snapshot of the previewed construction
+        :param geometries: offset geometries, one per snapshot unit
+        :return: Nothing
+        """
+        with self.__timings.span("preview: drawing"):
+            self.__reset_tmp_units()
+
+            colors = list()
+            for name, rgba, geometry in zip(snapshot.names, snapshot.colors, geometries):
+                color = QColor.fromRgba(rgba)
+                color.setAlpha(150)
+                colors.append(color)
+                self.__tmp_units.append([name, geometry])
+            self.__preview.set_lines(geometries, colors)
+
+        self.__dockwidget.construct.setEnabled(True)
+        self.__dockwidget.construct.clicked.connect(self.__build_lines)
+
+    def __snapshot(self) -> ConstructionSnapshot or None:
+        """
+        Creates an immutable snapshot of the current construction, which can be processed in a background task
+        :return: the snapshot or None, if nothing has to be constructed
+        """
+        if self.__side == 0 or self.active_geometry is None or self.__model is None:
+            return None
+
+        base_item_index = self.__model.base_item_index
+        if base_item_index == -1:
+            return None
+        if LOGGER.enabled(LOG_DEBUG):
+            LOGGER.debug("base_item_index: {} - {}", base_item_index, self.__model.row(base_item_index))
+
+        rows, distances, lower_distances = self.__unit_offsets()
+        if len(rows) == 0:
+            return None
+        names = self.__model.names
+
+        join_style = self.__dockwidget.line_join_style.currentIndex() + 1
+        # every task gets its own copy of the transform back into the project reference system
+        # noinspection PyArgumentList
+        transform = self.__transforms.get(self.__working_crs, QgsProject.instance().crs())
+        return ConstructionSnapshot(coordinates=self.__active_coords, geometry_hash=self.__geometry_hash(),
+                                    join_style=join_style, segments=DEFAULT_SEGMENTS, tolerance=0.0, window=None,
+                                    transform=None if transform is None else QgsCoordinateTransform(transform),
+                                    names=tuple(names[row] for row in rows),
+                                    colors=tuple(self.__model.colors[rows].tolist()),
+                                    distances=tuple(distances.astype(float).tolist()),
+                                    lower_distances=tuple(lower_distances.astype(float).tolist()))
+
+    def __unit_offsets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculates the signed cumulative offset distance of every unit, which has to be constructed, from the unit
+        columns of the model
+        :return: tuple of the row indices of the constructed units, their signed cumulative distance and the signed
+        distance of their lower boundary
+        """
+        rows, distances, lower_distances = self.__model.unit_columns(self.side)
+        if LOGGER.enabled(LOG_DEBUG):
+            names = self.__model.names
+            for row, sum_distances in zip(rows, distances):
+                LOGGER.debug("row.name: {} - sum_distances: {} m", names[row], sum_distances)
+        return rows, distances, lower_distances
+
+    def __update_output_targets(self) -> None:
+        """
+        slot, which fills the output target combo box with the registered targets and keeps the current selection
+        :return: Nothing
+        """
+        combo = self.__dockwidget.output_target
+        current = combo.currentText()
+        # band polygon layers belong to the target without suffix
+        names = [name for name in self.__outputs.names if not name.endswith(BAND_SUFFIX)]
+        if DEFAULT_OUTPUT_NAME not in names:
+            names.insert(0, DEFAULT_OUTPUT_NAME)
+        combo.blockSignals(True)
+        combo.clear()
+        combo.addItems(names)
+        combo.setCurrentText(current if current != "" else DEFAULT_OUTPUT_NAME)
+        combo.blockSignals(False)
+
+    def __update_renderer(self, vector_layer: QgsVectorLayer, extent: QgsRectangle) -> None:
+        """
+        Adds a category for every unit of the model, which is not yet part of the categorized renderer of the layer.
+        Existing categories are kept. The layer is only repainted, if the renderer changed or the new features are
+        visible.
+        :param vector_layer: output layer
+        :param extent: extent of the newly added features
+        :return: Nothing
+        """
+        renderer = vector_layer.renderer()
+        changed = False
+        if not isinstance(renderer, QgsCategorizedSymbolRenderer) or renderer.classAttribute() != "name":
+            renderer = QgsCategorizedSymbolRenderer("name", list())
+            vector_layer.setRenderer(renderer)
+            changed = True
+
+        existing = set(category.value() for category in renderer.categories())
+        for name, rgba in zip(self.model.names, self.model.colors.tolist()):
+            if name in existing:
+                continue
+            key = (name, rgba, int(vector_layer.geometryType()))
+            symbol = self.__symbols.get(key)
+            if symbol is None:
+                # noinspection PyArgumentList
+                symbol = QgsSymbol.defaultSymbol(vector_layer.geometryType())
+                symbol.setColor(QColor.fromRgba(rgba))
+                if vector_layer.geometryType() == QgsWkbTypes.LineGeometry:
+                    symbol.setWidth(SYMBOL_WIDTH)
+                self.__symbols[key] = symbol
+            # the category takes the ownership of its symbol, the cached symbol is copied
+            renderer.addCategory(QgsRendererCategory(name, symbol.clone(), name))
+            existing.add(name)
+            changed = True
+
+        if changed or (not extent.isNull() and self.__iface.mapCanvas().extent().intersects(extent)):
+            vector_layer.triggerRepaint()
+
+    def __viewport_window(self, margin: float) -> QgsRectangle or None:
+        """
+        Returns the window of the preview computation in the working reference system: the visible extent enlarged
+        by the margin and the slack
+        :param margin: largest absolute offset distance of the construction
+        :return: the window or None, if the whole active line lies inside
+        """
+        window = self.__visible_extent()
+        if window is None:
+            return None
+        window.grow(margin + max(window.width(), window.height()) * PREVIEW_WINDOW_SLACK)
+        if window.contains(self.__active_extent):
+            return None
+        return window
+
+    def __visible_extent(self) -> QgsRectangle or None:
+        """
+        Returns the visible extent of the map canvas in the working reference system
+        :return: the visible extent or None, if it cannot be transformed
+        """
+        try:
+            # noinspection PyArgumentList
+            return self.__transforms.transform_rectangle(self.__iface.mapCanvas().extent(),
+                                                         QgsProject.instance().crs(), self.__working_crs)
+        except QgsCsException:
+            return None
+
+    def __write_lines(self, snapshot: ConstructionSnapshot, geometries: List[QgsGeometry]) -> None:
+        """
+        Save the given geometries in the selected output
+        :param snapshot: snapshot of the constructed units
+        :param geometries: offset geometries, one per snapshot unit
+        :return: Nothing
+        """
+        output = self.__output()
+        if output is None:
+            return
+        writer, finish = output
+        band_output = None
+        if self.__dockwidget.band_polygons.isChecked():
+            band_output = self.__output(bands=True)
+            if band_output is None:
+                return
+
+        try:
+            with self.__timings.span("build: feature write"):
+                writer.add(list(zip(snapshot.names, geometries)))
+                writer.flush()
+                vector_layer = finish()
+            with self.__timings.span("build: renderer"):
+                self.__update_renderer(vector_layer, writer.extent)
+            text = "{} features written ({:.0f} features/s)".format(writer.count, writer.features_per_second)
+            if band_output is not None:
+                # the bands are stitched from the offset lines of the construction, no offset is computed again
+                band_writer, band_finish = band_output
+                with self.__timings.span("build: band polygons"):
+                    polygons = unit_bands(transform_arrays(snapshot.coordinates, snapshot.transform),
+                                          snapshot.distances, snapshot.lower_distances, geometries)
+                    band_writer.add([[name, polygon, color_text(rgba)] for name, polygon, rgba in
+                                     zip(snapshot.names, polygons, snapshot.colors) if polygon is not None])
+                    band_writer.flush()
+                    band_layer = band_finish()
+                with self.__timings.span("build: renderer"):
+                    self.__update_renderer(band_layer, band_writer.extent)
+                text += ", {} band polygons written".format(band_writer.count)
+                skipped = sum(polygon is None for polygon in polygons)
+                if skipped > 0:
+                    LOGGER.warning("build: {} band polygons skipped", skipped)
+                    text += ", {} band polygons skipped (no constructed lower boundary)".format(skipped)
+            self.__iface.messageBar().pushInfo("Line construction", text)
+
+        except Exception as e:
+            LOGGER.exception(e)
+        finally:
+            self.reset()
+
     #
     # public functions
     #
 
     def calc_side(self, pos: QgsPoint) -> None:
         """
-        Calculates the direction of the line
+        Calculates the side of the point relative to the nearest segment of the active line
+        :param pos: position of the mouse pointer in the project reference system
         :return: Nothing
         """
-        if self.__active_line is None:
+        if self.__active_line is None or self.__segment_index is None:
             self.__side = 0
             return
-        vertex = np.array(self.__active_line[0])
-        vect = np.array(self.__active_line[-1])
-        vect -= vertex
-        normal = np.array((-1 * vect[1], vect[0]))
-        length = np.linalg.norm(normal)
-        if length != 0:
-            normal = normal / length
-
-            p = np.array((pos.x(), pos.y()))
-            d1 = np.dot(p, normal)
-            d2 = np.dot(self.active_line[0], normal)
-
-            side = np.sign(d1 - d2)
-            side = side if side != 0 else 1
-        else:
-            side = 1
+        with self.__timings.span("side detection"):
+            try:
+                # noinspection PyArgumentList
+                position = self.__transforms.transform_point(QgsPointXY(pos.x(), pos.y()),
+                                                             QgsProject.instance().crs(), self.__working_crs)
+            except QgsCsException:
+                return
+            self.__side_position = position
+            side = self.__segment_index.side(position.x(), position.y())
         if side != self.__side:
             self.__side = side
             # noinspection PyUnresolvedReferences
@@ -380,9 +1219,34 @@ class LineConstruction(QObject):
         """
         self.__active_fid = -1
         self.__active_geometry = None
+        self.__active_geometry_hash = None
+        self.__active_coords = None
+        self.__active_extent = None
         self.__active_line = None
+        self.__batch_geometries = list()
+        self.__batch_ids = list()
+        self.__engines.clear()
+        self.__preview_window = None
+        self.__segment_index = None
         self.__side = 1
+        self.__side_position = None
         self.__dockwidget.start_construction.setEnabled(False)
         self.__dockwidget.construct.setEnabled(False)
 
+        self.__scheduler.cancel()
+        for kind in list(self.__tasks.keys()):
+            self.__cancel_task(kind)
         self.__reset_tmp_units()
+
+    def unload(self) -> None:
+        """
+        Resets the object and removes the preview item from the map canvas
+        :return: Nothing
+        """
+        self.reset()
+        # noinspection PyUnresolvedReferences
+        self.__iface.mapCanvas().extentsChanged.disconnect(self.__on_extents_changed)
+        # noinspection PyArgumentList,PyUnresolvedReferences
+        QgsProject.instance().transformContextChanged.disconnect(self.__on_transform_context_changed)
+        self.__outputs.unload()
+        self.__iface.mapCanvas().scene().removeItem(self.__preview)
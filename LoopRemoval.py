@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import namedtuple
+from typing import Tuple
+
+import numpy as np
+
+from .SegmentIndex import SegmentIndex, grid_cover
+
+# maximum number of vertices per loop, which are tested against the base line
+LOOP_SAMPLES = 16
+# number of loops, whose sampled vertices are selected in one array operation
+LOOP_BLOCK = 65536
+# loops, whose vertices are closer to the base line than (1 - LOOP_TOLERANCE) * distance, are invalid
+LOOP_TOLERANCE = 1e-3
+# maximum deviation of the decimated base line used to speed up the distance tests, relative to the distance
+COARSE_TOLERANCE = LOOP_TOLERANCE / 4
+# number of bisection steps used to find the new end point of a trimmed line
+TRIM_STEPS = 16
+# maximum number of end vertices, which are tested at once while trimming a line
+TRIM_BLOCK = 1024
+# offset lines with more candidate segment pairs per vertex are too rough for the loop removal, smooth lines have less
+# than four pairs per vertex
+MAX_PAIRS_PER_VERTEX = 8
+# segments, which are longer than this number of grid cells, are split into pieces for the candidate search
+LONG_SEGMENT_CELLS = 4
+# loops of an offset line are only updated, if the changed window holds at most this fraction of the vertices
+MAX_WINDOW_FRACTION = 0.5
+
+
+def _grid_pairs(coords: np.ndarray, window: Tuple[int, int] or None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Covers the segments of a line with a uniform grid and returns the entries of every grid cell. Every entry is a
+    candidate pair with all following entries of the same cell.
+    :param coords: (n x 2) coordinate array of the line
+    :param window: range (start, end) of segment indices, only segments near this range are covered, None to cover
+    all segments
+    :return: tuple of the segment index of every entry, sorted by cell, and the number of following entries of the
+    same cell
+    """
+    starts = coords[:-1]
+    vectors = coords[1:] - starts
+    ids = np.arange(len(starts))
+    lower = np.minimum(starts, coords[1:])
+    upper = np.maximum(starts, coords[1:])
+    if window is not None:
+        # only the bounding box of the window can contain intersections with window segments
+        window_lower = lower[window[0]:window[1]].min(axis=0)
+        window_upper = upper[window[0]:window[1]].max(axis=0)
+        ids = np.flatnonzero(np.all((upper >= window_lower) & (lower <= window_upper), axis=1))
+        lower = np.maximum(lower[ids], window_lower)
+        upper = np.minimum(upper[ids], window_upper)
+    if len(ids) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    origin = lower.min(axis=0)
+    extent = upper.max(axis=0) - origin
+    # cells of the median segment extent hold only a few segments, the cell ids are sorted instead of being stored in
+    # a dense array, so the grid may have many more cells than segments
+    size = max(float(np.median(np.max(upper - lower, axis=1))), float(extent.max()) / len(ids), 1e-12)
+    width = int(np.floor(extent[0] / size)) + 1
+
+    # long segments (e.g. the spikes of sharp inner corners) are split into pieces, so they only cover the cells
+    # along the segment instead of all cells of their bounding box
+    pieces = np.ceil(np.max(np.abs(vectors[ids]), axis=1) / (LONG_SEGMENT_CELLS * size))
+    pieces = np.maximum(pieces, 1).astype(np.int64)
+    owner = np.arange(len(ids))
+    if len(ids) < pieces.sum():
+        owner = np.repeat(owner, pieces)
+        step = (np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[owner]
+        piece_starts = starts[ids[owner]] + vectors[ids[owner]] * step[:, np.newaxis]
+        piece_ends = piece_starts + vectors[ids[owner]] / pieces[owner, np.newaxis]
+        piece_lower = np.maximum(np.minimum(piece_starts, piece_ends), lower[owner])
+        piece_upper = np.minimum(np.maximum(piece_starts, piece_ends), upper[owner])
+        # pieces outside of the window bounding box
+        inside = np.all(piece_lower <= piece_upper, axis=1)
+        owner, lower, upper = owner[inside], piece_lower[inside], piece_upper[inside]
+    first = np.floor((lower - origin) / size).astype(np.int64)
+    last = np.floor((upper - origin) / size).astype(np.int64)
+    segment, cell = grid_cover(first, last, width)
+    segment = ids[owner[segment]]
+
+    order = np.lexsort((segment, cell))
+    segment = segment[order]
+    cell = cell[order]
+    group_end = np.concatenate((np.flatnonzero(np.diff(cell)) + 1, [len(cell)]))
+    sizes = np.diff(np.concatenate(([0], group_end)))
+    return segment, np.repeat(group_end, sizes) - np.arange(len(cell)) - 1
+
+
+def segment_intersections(coords: np.ndarray, closed: bool = False, max_pairs: int or None = None,
+                          window: Tuple[int, int] or None = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds all intersections between non adjacent segments of a line. Candidate pairs are collected with a uniform
+    grid, so only segments sharing a grid cell are tested.
+    :param coords: (n x 2) coordinate array of the line
+    :param closed: True, if the line is a closed ring (the first and the last segment are adjacent)
+    :param max_pairs: maximum number of candidate pairs, None for no limit
+    :param window: range (start, end) of segment indices, only intersections with a segment of this range are
+    searched, None to search all intersections
+    :return: tuple of the first segment indices, the second segment indices (always greater than the first ones) and
+    the (k x 2) array of intersection points, sorted by the first index and descending second index
+    :raises ValueError: if the line has more than max_pairs candidate pairs
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) < 4:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=float)
+    segment, partners = _grid_pairs(coords, window)
+    if max_pairs is not None and int(partners.sum()) > max_pairs:
+        raise ValueError("Line has more than {} candidate segment pairs".format(max_pairs))
+    return _intersections(coords, segment, partners, closed, window)
+
+
+def _intersections(coords: np.ndarray, segment: np.ndarray, partners: np.ndarray, closed: bool,
+                   window: Tuple[int, int] or None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Tests the candidate pairs of the grid cells for intersections, see segment_intersections
+    :param coords: (n x 2) coordinate array of the line
+    :param segment: segment index of every grid cell entry, sorted by cell
+    :param partners: number of following entries of the same cell
+    :param closed: True, if the line is a closed ring
+    :param window: range (start, end) of segment indices, only intersections with a segment of this range are
+    returned, None to return all intersections
+    :return: tuple of the first segment indices, the second segment indices and the intersection points
+    """
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=float))
+    starts = coords[:-1]
+    vectors = coords[1:] - starts
+    count = len(starts)
+    left = np.repeat(np.arange(len(segment)), partners)
+    right = left + 1 + np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+    a = segment[left]
+    b = segment[right]
+
+    keep = b - a > 1
+    if window is not None:
+        keep &= (a >= window[0]) & (a < window[1]) | (b >= window[0]) & (b < window[1])
+    if closed:
+        keep &= ~((a == 0) & (b == count - 1))
+    pairs = np.unique(a[keep] * count + b[keep])
+    if len(pairs) == 0:
+        return empty
+    a = pairs // count
+    b = pairs % count
+
+    # exact segment intersection test, parallel segments are ignored
+    r = vectors[a]
+    s = vectors[b]
+    qp = starts[b] - starts[a]
+    denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denominator
+        u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denominator
+    hit = (denominator != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    if not np.any(hit):
+        return empty
+
+    a, b, t = a[hit], b[hit], t[hit]
+    order = np.lexsort((-b, a))
+    a, b, t = a[order], b[order], t[order]
+    return a, b, starts[a] + vectors[a] * t[:, np.newaxis]
+
+
+def _loop_samples(first: np.ndarray, second: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Selects up to LOOP_SAMPLES evenly spaced vertices of every loop between two intersecting segments
+    :param first: first segment index of every loop
+    :param second: second segment index of every loop
+    :return: tuple of the (k x LOOP_SAMPLES) vertex index array and the mask of the used entries
+    """
+    length = second - first
+    count = np.minimum(length, LOOP_SAMPLES)
+    step = (length - 1) / np.maximum(count - 1, 1)
+    column = np.arange(LOOP_SAMPLES)
+    offsets = (column[np.newaxis] * step[:, np.newaxis]).astype(np.int64)
+    # the last sample is the last vertex of the loop, unused entries are clipped to it
+    offsets = np.where(column[np.newaxis] >= count[:, np.newaxis] - 1, (length - 1)[:, np.newaxis], offsets)
+    return first[:, np.newaxis] + 1 + offsets, column[np.newaxis] < count[:, np.newaxis]
+
+
+def _invalid(coords: np.ndarray, first: np.ndarray, second: np.ndarray, limit: float, base_index: SegmentIndex,
+             tolerance: float) -> np.ndarray:
+    """
+    Tests, if the vertices of the loops between two intersecting segments are mostly closer to the base line than the
+    limit. The sampled vertices of all loops are tested at once.
+    :param coords: (n x 2) coordinate array of the line
+    :param first: first segment index of every loop
+    :param second: second segment index of every loop
+    :param limit: minimum distance of valid vertices to the base line
+    :param base_index: segment index of the base line
+    :param tolerance: deviation of the decimated base line used for the distance tests
+    :return: boolean array, True for loops with more than half of the sampled vertices closer than the limit
+    """
+    if len(first) == 0:
+        return np.zeros(0, dtype=bool)
+    blocks = range(0, len(first), LOOP_BLOCK)
+    needed = np.zeros(len(coords), dtype=bool)
+    for start in blocks:
+        samples, used = _loop_samples(first[start:start + LOOP_BLOCK], second[start:start + LOOP_BLOCK])
+        needed[samples[used]] = True
+    close = np.zeros(len(coords), dtype=bool)
+    close[needed] = base_index.closer_than(coords[needed], limit, tolerance)
+
+    result = np.zeros(len(first), dtype=bool)
+    for start in blocks:
+        samples, used = _loop_samples(first[start:start + LOOP_BLOCK], second[start:start + LOOP_BLOCK])
+        result[start:start + LOOP_BLOCK] = 2 * np.count_nonzero(close[samples] & used, axis=1) > used.sum(axis=1)
+    return result
+
+
+def _valid_start(coords: np.ndarray, limit: float, base_index: SegmentIndex, tolerance: float) -> \
+        Tuple[int, np.ndarray or None]:
+    """
+    Finds the first vertex of an open line, which is not closer to the base line than the limit. The new start point
+    is placed on the segment, which leaves the invalid zone.
+    :param coords: (n x 2) coordinate array of the offset line
+    :param limit: minimum distance of valid vertices to the base line
+    :param base_index: segment index of the base line
+    :param tolerance: deviation of the decimated base line used for the distance tests
+    :return: tuple of the index of the first valid vertex (n, if no vertex is valid) and the new start point, None if
+    the start is valid
+    """
+    # most ends are valid, so the block size starts with a single vertex
+    start = 0
+    size = 1
+    while start < len(coords):
+        valid = np.flatnonzero(~base_index.closer_than(coords[start:start + size], limit, tolerance))
+        if len(valid) > 0:
+            start += int(valid[0])
+            break
+        start += size
+        size = min(2 * size, TRIM_BLOCK)
+    if start == 0 or start >= len(coords):
+        return min(start, len(coords)), None
+
+    # bisection between an invalid and a valid vertex
+    inner, outer = coords[start - 1], coords[start]
+    for _ in range(TRIM_STEPS):
+        middle = (inner + outer) / 2
+        if not base_index.closer_than(middle, limit, tolerance)[0]:
+            outer = middle
+        else:
+            inner = middle
+    return start, outer
+
+
+def _trim(coords: np.ndarray, limit: float, base_index: SegmentIndex, tolerance: float,
+          previous: 'LoopState' or None = None, changed: Tuple[np.ndarray, np.ndarray] or None = None) -> \
+        Tuple[np.ndarray, int, np.ndarray, np.ndarray]:
+    """
+    Removes the start and the end of an open line, as long as the vertices are closer to the base line than the
+    limit. The new end points are placed on the segment, which leaves the invalid zone.
+    The ends of a previous version of the line are reused, if their vertices did not change and are outside of the
+    changed region.
+    :param coords: (n x 2) coordinate array of the offset line
+    :param limit: minimum distance of valid vertices to the base line
+    :param base_index: segment index of the base line
+    :param tolerance: deviation of the decimated base line used for the distance tests
+    :param previous: loops of the previous version of the line, None to trim both ends again
+    :param changed: lower and upper corner of the region, in which the validity of the vertices may have changed
+    :return: tuple of the trimmed coordinate array, the number of trimmed ends and the vertices up to the first and
+    from the last kept vertex
+    """
+    ends = list()
+    for line, known, point in ((coords, None, None), (coords[::-1], None, None)) if previous is None else \
+            ((coords, previous.head, previous.coords[0]), (coords[::-1], previous.tail[::-1], previous.coords[-1])):
+        if known is not None and 0 < len(known) <= len(line) and np.array_equal(line[:len(known)], known) and \
+                (changed is None or np.any(known.min(axis=0) > changed[1]) or np.any(known.max(axis=0) < changed[0])):
+            ends.append((len(known) - 1, point if len(known) > 1 else None))
+        else:
+            ends.append(_valid_start(line, limit, base_index, tolerance))
+    (start, start_point), (end, end_point) = ends
+    end = len(coords) - 1 - end
+    if start > end:
+        if previous is not None:
+            return _trim(coords, limit, base_index, tolerance)
+        return coords[:0], 2, coords, coords
+
+    pieces = [coords[start:end + 1]]
+    if start_point is not None:
+        pieces.insert(0, start_point[np.newaxis])
+    if end_point is not None:
+        pieces.append(end_point[np.newaxis])
+    trimmed = int(start_point is not None) + int(end_point is not None)
+    return np.concatenate(pieces) if trimmed > 0 else coords, trimmed, coords[:start + 1], coords[end:]
+
+
+def _limits(distance: float) -> Tuple[float, float]:
+    """
+    Calculates the distance limit of valid vertices and the deviation of the decimated base line for an offset
+    distance
+    :param distance: signed offset distance
+    :return: tuple of the limit and the tolerance
+    """
+    return abs(distance) * (1 - LOOP_TOLERANCE), abs(distance) * COARSE_TOLERANCE
+
+
+def changed_range(old: np.ndarray, new: np.ndarray) -> Tuple[int, int, int] or None:
+    """
+    Compares two coordinate arrays and finds the range between their common start and their common end
+    :param old: (n x 2) coordinate array
+    :param new: (m x 2) coordinate array
+    :return: tuple of the first changed index and the end of the changed ranges in the old and in the new array, None
+    if both arrays are equal
+    """
+    count = min(len(old), len(new))
+    equal = np.all(old[:count] == new[:count], axis=1)
+    start = count if np.all(equal) else int(np.argmin(equal))
+    if start == len(old) == len(new):
+        return None
+    count -= start
+    equal = np.all(old[len(old) - count:][::-1] == new[len(new) - count:][::-1], axis=1)
+    suffix = count if np.all(equal) else int(np.argmin(equal))
+    return start, len(old) - suffix, len(new) - suffix
+
+
+LoopState = namedtuple("LoopState", ["coords", "first", "second", "points", "invalid", "trimmed", "head", "tail"])
+LoopState.__doc__ = """
+Loops of an offset line: the trimmed coordinate array, the first and second segment index and the point of every
+intersection between two non adjacent segments (sorted like segment_intersections), the invalid flag of the loop
+between both segments, the number of trimmed ends and the untrimmed vertices up to the first and from the last kept
+vertex (empty for closed lines)
+"""
+
+
+def find_loops(coords: np.ndarray, distance: float, base_index: SegmentIndex, closed: bool = False,
+               rough_check: bool = False) -> LoopState:
+    """
+    Trims the invalid ends of an offset line and finds all its loops, see remove_loops
+    :param coords: (n x 2) coordinate array of the offset line
+    :param distance: signed offset distance
+    :param base_index: segment index of the base line
+    :param closed: True, if the offset line is a closed ring
+    :param rough_check: if True, lines with more than MAX_PAIRS_PER_VERTEX candidate segment pairs per vertex are
+    rejected before the loops are searched
+    :return: the loops of the offset line
+    :raises ValueError: if rough_check is set and the line is too rough
+    """
+    limit, tolerance = _limits(distance)
+    trimmed = 0
+    head = tail = coords[:0]
+    if not closed:
+        coords, trimmed, head, tail = _trim(coords, limit, base_index, tolerance)
+    max_pairs = MAX_PAIRS_PER_VERTEX * len(coords) if rough_check else None
+    first, second, points = segment_intersections(coords, closed, max_pairs)
+    invalid = _invalid(coords, first, second, limit, base_index, tolerance)
+    return LoopState(coords, first, second, points, invalid, trimmed, head, tail)
+
+
+def update_loops(previous: LoopState, coords: np.ndarray, distance: float, base_index: SegmentIndex, closed: bool,
+                 old_base: np.ndarray, new_base: np.ndarray, rough_check: bool = False) -> LoopState or None:
+    """
+    Updates the loops of an offset line after a local change of its base line. Only the intersections of the
+    changed window of the offset line are searched again. The window contains all vertices, whose distance to the
+    changed base segments is within the limit of valid vertices, so only loops crossing the window are tested again.
+    The loops are equal to the loops found by find_loops. The rough check of find_loops depends on the whole line,
+    it is only repeated for the window, so a line, which passed the check, keeps passing it for smooth changes.
+    :param previous: loops of the offset line of the previous base line
+    :param coords: (n x 2) coordinate array of the new offset line
+    :param distance: signed offset distance
+    :param base_index: segment index of the new base line
+    :param closed: True, if the offset line is a closed ring
+    :param old_base: (k x 2) coordinate array of the previous base line
+    :param new_base: (m x 2) coordinate array of the new base line
+    :param rough_check: if True, changes with more than MAX_PAIRS_PER_VERTEX candidate segment pairs per segment
+    crossing the window are not updated
+    :return: the loops of the new offset line or None, if the change is not local or too rough
+    """
+    if len(previous.coords) < 2:
+        return None
+    limit, tolerance = _limits(distance)
+
+    # vertices within the limit of the changed base segments may have changed their validity
+    base_change = changed_range(old_base, new_base)
+    changed = None
+    if base_change is not None:
+        start, old_stop, new_stop = base_change
+        corners = np.concatenate((old_base[max(start - 1, 0):old_stop + 1], new_base[max(start - 1, 0):new_stop + 1]))
+        changed = (corners.min(axis=0) - limit, corners.max(axis=0) + limit)
+
+    head, tail = previous.head, previous.tail
+    trimmed = 0
+    if not closed:
+        coords, trimmed, head, tail = _trim(coords, limit, base_index, tolerance, previous, changed)
+    if len(coords) < 2:
+        return None
+    change = changed_range(previous.coords, coords)
+    dirty = list()
+    if change is not None:
+        dirty.append(np.array([change[0], change[2]]))
+    if changed is not None:
+        dirty.append(np.flatnonzero(np.all((coords >= changed[0]) & (coords <= changed[1]), axis=1)))
+    dirty = np.concatenate(dirty) if len(dirty) > 0 else np.empty(0, dtype=np.int64)
+    if len(dirty) == 0:
+        return previous._replace(trimmed=trimmed, head=head, tail=tail)
+
+    # window of changed vertices [low, high), its segments are [low - 1, high)
+    low = max(int(dirty.min()), 0)
+    high = min(int(dirty.max()) + 1, len(coords))
+    shift = len(coords) - len(previous.coords)
+    if (high - low) > MAX_WINDOW_FRACTION * len(coords) or high - shift < low:
+        return None
+    window = (max(low - 1, 0), min(high, len(coords) - 1))
+
+    # unchanged intersections before and behind the window, loops across the window are tested again
+    first, second = previous.first, previous.second
+    before = first < low - 1
+    behind = second >= high - shift
+    across = before & behind
+    kept = before & (second < low - 1) | (first >= high - shift) | across
+    first = np.where(first >= high - shift, first + shift, first)[kept]
+    second = np.where(behind, second + shift, second)[kept]
+    points = previous.points[kept]
+    invalid = previous.invalid[kept]
+    across = across[kept]
+
+    # intersections of the window segments with all segments crossing the window
+    segment, partners = _grid_pairs(coords, window)
+    if rough_check and int(partners.sum()) > MAX_PAIRS_PER_VERTEX * len(np.unique(segment)):
+        return None
+    window_first, window_second, window_points = _intersections(coords, segment, partners, closed, window)
+    first = np.concatenate((first, window_first))
+    second = np.concatenate((second, window_second))
+    points = np.concatenate((points, window_points))
+    tested = np.concatenate((across, np.ones(len(window_first), dtype=bool)))
+    invalid = np.concatenate((invalid, np.zeros(len(window_first), dtype=bool)))
+    invalid[tested] = _invalid(coords, first[tested], second[tested], limit, base_index, tolerance)
+
+    order = np.lexsort((-second, first))
+    return LoopState(coords, first[order], second[order], points[order], invalid[order], trimmed, head, tail)
+
+
+def cut_loops(state: LoopState) -> Tuple[np.ndarray, int]:
+    """
+    Replaces the invalid loops of an offset line by the intersection points of their segments. Loops inside of an
+    already removed loop are skipped.
+    :param state: loops of the offset line
+    :return: tuple of the cleaned coordinate array and the number of removed loops and end pieces
+    """
+    coords = state.coords
+    pieces = list()
+    cursor = 0
+    removed = 0
+    invalid = np.flatnonzero(state.invalid)
+    for a, b, point in zip(state.first[invalid], state.second[invalid], state.points[invalid]):
+        if a < cursor:
+            continue
+        # the loop is replaced by the intersection point
+        pieces.append(coords[cursor:a + 1])
+        pieces.append(point[np.newaxis])
+        cursor = b + 1
+        removed += 1
+
+    if removed == 0:
+        return coords, state.trimmed
+    pieces.append(coords[cursor:])
+    return np.concatenate(pieces), removed + state.trimmed
+
+
+def remove_loops(coords: np.ndarray, distance: float, base_index: SegmentIndex, closed: bool = False,
+                 rough_check: bool = False) -> Tuple[np.ndarray, int]:
+    """
+    Removes the invalid local loops of an offset line. A loop between two intersecting segments is invalid, if its
+    vertices are mostly closer to the base line than the offset distance. Valid loops, e.g. of a self crossing base
+    line, are kept. Invalid start and end pieces of open lines, which are closer to the base line than the offset
+    distance, are trimmed.
+    :param coords: (n x 2) coordinate array of the offset line
+    :param distance: signed offset distance
+    :param base_index: segment index of the base line
+    :param closed: True, if the offset line is a closed ring
+    :param rough_check: if True, lines with more than MAX_PAIRS_PER_VERTEX candidate segment pairs per vertex are
+    rejected before the loops are searched
+    :return: tuple of the cleaned coordinate array and the number of removed loops and end pieces
+    :raises ValueError: if rough_check is set and the line is too rough
+    """
+    return cut_loops(find_loops(coords, distance, base_index, closed, rough_check))
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import os
+import struct
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from qgis.core import QgsGeometry
+
+from .OffsetEngine import arrays_to_geometry, geometry_to_arrays
+
+# default maximum size of all cache files in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# file name extension of the cache entries
+ENTRY_SUFFIX = ".plc"
+# magic number and version of the entry format
+ENTRY_MAGIC = b"PLC1"
+# header of an entry: magic number, number of geometries, number of parts, number of vertices
+ENTRY_HEADER = struct.Struct('<4sQQQ')
+
+
+def unit_table_hash(distances: Sequence[float]) -> str:
+    """
+    Returns the hash of the unit table content, which determines the offset geometries
+    :param distances: signed cumulative distance of every constructed unit
+    :return: the hex digest of the distances
+    """
+    return hashlib.sha1(np.ascontiguousarray(distances, dtype='<f8').tobytes()).hexdigest()
+
+
+class OffsetDiskCache:
+    """
+    Persistent cache for the offset geometries of whole constructions. Every construction is stored in a single file,
+    which contains all vertex coordinates as one binary float array and the part and vertex counts needed to split
+    them again. The key is a hash of the base geometry WKB hash, the unit table content hash, the side, the join style
+    and the remaining offset parameters.
+    The total size of all files is bounded, the least recently used files are deleted first. The recent use is
+    tracked by the modification time of the files, so it survives QGIS sessions.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        """
+        Initialization of the class
+        :param directory: directory of the cache files, it is created on the first write
+        :param max_bytes: maximum size of all cache files in bytes
+        :raises ValueError: if max_bytes is smaller than 1
+        """
+        if max_bytes < 1:
+            raise ValueError("Cache size must be at least 1 byte")
+        self.__directory = directory
+        self.__max_bytes = int(max_bytes)
+        self.__hits = 0
+        self.__misses = 0
+
+    # setter and getter
+    @property
+    def directory(self) -> str:
+        """
+        returns the directory of the cache files
+        :return: the cache directory
+        """
+        return self.__directory
+
+    @property
+    def hits(self) -> int:
+        """
+        returns the number of cache hits
+        :return: the number of cache hits
+        """
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """
+        returns the number of cache misses
+        :return: the number of cache misses
+        """
+        return self.__misses
+
+    @property
+    def max_bytes(self) -> int:
+        """
+        returns the maximum size of all cache files in bytes
+        :return: the maximum cache size
+        """
+        return self.__max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        """
+        Sets the maximum size of all cache files and deletes the least recently used files, if necessary
+        :param value: new maximum cache size in bytes
+        :return: Nothing
+        :raises ValueError: if value is smaller than 1
+        """
+        if int(value) < 1:
+            raise ValueError("Cache size must be at least 1 byte")
+        self.__max_bytes = int(value)
+        self.__evict()
+
+    #
+    # private functions
+    #
+
+    def __entries(self) -> List[Tuple[float, int, str]]:
+        """
+        Lists all cache files
+        :return: list of (modification time, size, path) tuples, the least recently used file first
+        """
+        entries = list()
+        try:
+            with os.scandir(self.__directory) as iterator:
+                for entry in iterator:
+                    if entry.is_file() and entry.name.endswith(ENTRY_SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return list()
+        entries.sort()
+        return entries
+
+    def __evict(self, reserved: int = 0) -> None:
+        """
+        Deletes the least recently used files, until the cache size plus the reserved bytes fits into the maximum
+        :param reserved: number of bytes, which are going to be written
+        :return: Nothing
+        """
+        entries = self.__entries()
+        total = sum(size for _, size, _ in entries) + reserved
+        for _, size, path in entries:
+            if total <= self.__max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def __path(self, key: str) -> str:
+        """
+        returns the path of the cache file of the key
+        :param key: cache key
+        :return: the file path
+        """
+        return os.path.join(self.__directory, key + ENTRY_SUFFIX)
+
+    #
+    # public functions
+    #
+
+    @staticmethod
+    def key(geometry_hash: str, table_hash: str, side: int, join_style: int, segments: int) -> str:
+        """
+        Creates a cache key from the given values. Only whole exact constructions are stored, previews are clipped
+        and simplified after loading, so the key does not depend on the visible window or the map scale.
+        :param geometry_hash: hash of the WKB of the base geometry
+        :param table_hash: hash of the unit table content, see unit_table_hash
+        :param side: side of the construction (-1 or 1)
+        :param join_style: join style of the offset
+        :param segments: number of segments per quarter circle
+        :return: returns the cache key, which is also the name of the cache file
+        """
+        values = (geometry_hash, table_hash, int(side), int(join_style), int(segments))
+        return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+    def clear(self) -> None:
+        """
+        Deletes all cache files and resets the hit / miss counters
+        :return: Nothing
+        """
+        for _, _, path in self.__entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key: str) -> List[QgsGeometry] or None:
+        """
+        returns the geometries stored for the given key and marks the entry as recently used
+        :param key: cache key
+        :return: list of the stored geometries or None, if the key is not cached or the file is unreadable
+        """
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            magic, geometry_count, part_count, vertex_count = ENTRY_HEADER.unpack_from(data)
+            offset = ENTRY_HEADER.size
+            if magic != ENTRY_MAGIC or len(data) != offset + 8 * (geometry_count + part_count + 2 * vertex_count):
+                raise ValueError("Invalid cache file: {}".format(path))
+            parts = np.frombuffer(data, dtype='<i8', count=geometry_count, offset=offset)
+            offset += 8 * geometry_count
+            sizes = np.frombuffer(data, dtype='<i8', count=part_count, offset=offset)
+            offset += 8 * part_count
+            coords = np.frombuffer(data, dtype='<f8', count=2 * vertex_count, offset=offset).reshape(-1, 2)
+            os.utime(path)
+        except (OSError, ValueError, struct.error):
+            self.__misses += 1
+            return None
+
+        geometries = list()
+        part = 0
+        vertex = 0
+        for count in parts:
+            pieces = list()
+            for size in sizes[part:part + count]:
+                pieces.append(coords[vertex:vertex + size])
+                vertex += size
+            part += count
+            geometries.append(arrays_to_geometry(pieces) if count > 0 else QgsGeometry())
+        self.__hits += 1
+        return geometries
+
+    def put(self, key: str, geometries: Sequence[QgsGeometry]) -> None:
+        """
+        Stores the geometries for the given key and deletes the least recently used files, if the cache is full.
+        Entries larger than the whole cache are not stored. The file is written completely before it replaces an
+        existing entry, so readers never see a partial file.
+        :param key: cache key
+        :param geometries: offset geometries of a construction
+        :return: Nothing
+        :raises OSError: if the cache directory or the file cannot be written
+        """
+        arrays = [geometry_to_arrays(geometry) for geometry in geometries]
+        parts = np.array([len(part_arrays) for part_arrays in arrays], dtype='<i8')
+        sizes = np.array([len(part) for part_arrays in arrays for part in part_arrays], dtype='<i8')
+        vertex_count = int(sizes.sum())
+        size = ENTRY_HEADER.size + 8 * (len(parts) + len(sizes) + 2 * vertex_count)
+        if size > self.__max_bytes:
+            return
+
+        os.makedirs(self.__directory, exist_ok=True)
+        path = self.__path(key)
+        self.__evict(size)
+        temporary = path + ".tmp"
+        with open(temporary, 'wb') as file:
+            file.write(ENTRY_HEADER.pack(ENTRY_MAGIC, len(parts), len(sizes), vertex_count))
+            file.write(parts.tobytes())
+            file.write(sizes.tobytes())
+            for part_arrays in arrays:
+                for part in part_arrays:
+                    file.write(np.ascontiguousarray(part, dtype='<f8').tobytes())
+        os.replace(temporary, path)
@@ -0,0 +1,977 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+import struct
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from qgis.core import QgsGeometry
+
+from .LoopRemoval import LoopState, changed_range, cut_loops, find_loops, update_loops
+from .SegmentIndex import SegmentIndex
+
+# join styles, identical to the QGIS values (line_join_style combo box index + 1)
+JOIN_STYLE_ROUND = 1
+JOIN_STYLE_MITER = 2
+JOIN_STYLE_BEVEL = 3
+
+# number of segments used to approximate a quarter circle
+DEFAULT_SEGMENTS = 8
+# offsets are computed from the base line simplified by this fraction of the offset distance (like the input
+# simplification of the GEOS buffer), so the vertex count of an offset line depends on its distance and not on the
+# resolution of the base line
+SIMPLIFY_FACTOR = 0.01
+# simplified base lines, which keep more than this fraction of the vertices, are not used
+MAX_SIMPLIFIED_FRACTION = 0.5
+# maximum number of offset line vertices per engine, whose loops and lines are kept for the update after a base line
+# change
+MAX_KEPT_POINTS = 4000000
+# cleaned offset lines, which are not simple or have a vertex closer to the base line than
+# (1 - VALID_TOLERANCE) * distance, are replaced by the GEOS offset curve. The tolerance is larger than the
+# simplification of the base line, so offsets of the simplified base line pass the test.
+VALID_TOLERANCE = 2 * SIMPLIFY_FACTOR
+
+_Previous = namedtuple("_Previous", ["coords", "corners", "indices", "templates", "lines", "loops"])
+_Previous.__doc__ = """
+Arrays of a finished engine, which the engine of the edited base line reuses outside of the changed vertices: the base
+line, its corner flags (None for all vertices), the indices of its vertices in the unsimplified base line (None, if it
+is not simplified), the templates by sign, the raw and the cleaned valid offset lines by distance and the kept loops
+by distance
+"""
+
+
+def line_to_array(line: Sequence) -> np.ndarray:
+    """
+    Converts a list of QgsPointXY (or any sequence of x, y pairs) into a (n x 2) float array
+    :param line: list of points
+    :return: returns a (n x 2) numpy array with the x and y coordinates
+    """
+    if isinstance(line, np.ndarray):
+        return np.asarray(line, dtype=float).reshape(-1, 2)
+    return np.array([(point[0], point[1]) for point in line], dtype=float).reshape(-1, 2)
+
+
+def remove_duplicate_vertices(coords: np.ndarray) -> np.ndarray:
+    """
+    Removes consecutive duplicate vertices from the given coordinate array
+    :param coords: (n x 2) coordinate array
+    :return: returns the coordinate array without consecutive duplicates
+    """
+    if len(coords) < 2:
+        return coords
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    return coords[keep]
+
+
+def clip_coordinates(coords: np.ndarray, window: Tuple[float, float, float, float]) -> List[np.ndarray]:
+    """
+    Clips the coordinate array to a rectangular window. Every segment, whose bounding box intersects the window, is
+    kept completely, so the pieces may reach beyond the window.
+    :param coords: (n x 2) coordinate array
+    :param window: window as tuple of x minimum, y minimum, x maximum and y maximum
+    :return: returns a list of coordinate arrays, one per connected piece inside the window
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if len(coords) < 2:
+        return list()
+
+    lower = np.minimum(coords[:-1], coords[1:])
+    upper = np.maximum(coords[:-1], coords[1:])
+    inside = (upper[:, 0] >= window[0]) & (upper[:, 1] >= window[1]) & \
+             (lower[:, 0] <= window[2]) & (lower[:, 1] <= window[3])
+    if np.all(inside):
+        return [coords]
+
+    # start and end of every run of consecutive segments inside the window
+    changes = np.diff(np.concatenate(([0], inside.astype(np.int8), [0])))
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1)
+    return [coords[start:end + 1] for start, end in zip(starts, ends)]
+
+
+def simplify_coordinates(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplifies the coordinate array with the Douglas-Peucker algorithm. The first and the last vertex are kept.
+    :param coords: (n x 2) coordinate array
+    :param tolerance: maximum distance of a removed vertex to the simplified line
+    :return: returns the simplified coordinate array
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return coords[simplify_indices(coords, tolerance)]
+
+
+def simplify_indices(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Returns the indices of the vertices, which the Douglas-Peucker simplification keeps, see simplify_coordinates
+    :param coords: (n x 2) coordinate array
+    :param tolerance: maximum distance of a removed vertex to the simplified line
+    :return: returns the ascending indices of the kept vertices
+    """
+    if len(coords) < 3 or tolerance <= 0:
+        return np.arange(len(coords))
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while len(stack) > 0:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        chord = coords[last] - coords[first]
+        relative = coords[first + 1:last] - coords[first]
+        length = math.hypot(chord[0], chord[1])
+        if length == 0:
+            # closed ring: the distance to the start vertex is used
+            distances = np.hypot(relative[:, 0], relative[:, 1])
+        else:
+            distances = np.abs(relative[:, 0] * chord[1] - relative[:, 1] * chord[0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def arc_segments(distance: float, tolerance: float, maximum: int = DEFAULT_SEGMENTS) -> int:
+    """
+    Calculates the number of quarter circle segments, which approximate an arc with the given radius within the
+    given tolerance
+    :param distance: arc radius
+    :param tolerance: maximum distance between the arc and its approximation
+    :param maximum: upper bound of the number of segments
+    :return: returns the number of segments (at least 1)
+    """
+    distance = abs(distance)
+    if tolerance <= 0:
+        return maximum
+    if distance <= tolerance:
+        return 1
+    angle = 2 * math.acos(1 - tolerance / distance)
+    return int(min(max(math.ceil(math.pi / 2 / angle), 1), maximum))
+
+
+def array_to_geometry(coords: np.ndarray) -> QgsGeometry:
+    """
+    Creates a line string geometry from the given coordinate array. The geometry is built from WKB to avoid the
+    creation of a QgsPointXY object per vertex.
+    :param coords: (n x 2) coordinate array
+    :return: returns a QgsGeometry line string
+    """
+    coords = np.ascontiguousarray(coords, dtype='<f8')
+    wkb = struct.pack('<BII', 1, 2, len(coords)) + coords.tobytes()
+    geometry = QgsGeometry()
+    geometry.fromWkb(wkb)
+    return geometry
+
+
+def arrays_to_geometry(parts: Sequence[np.ndarray]) -> QgsGeometry:
+    """
+    Creates a line string geometry from a single coordinate array or a multi line string geometry from several ones
+    :param parts: list of (n x 2) coordinate arrays
+    :return: returns a QgsGeometry line string or multi line string
+    """
+    if len(parts) == 1:
+        return array_to_geometry(parts[0])
+    wkb = [struct.pack('<BII', 1, 5, len(parts))]
+    for part in parts:
+        part = np.ascontiguousarray(part, dtype='<f8')
+        wkb.append(struct.pack('<BII', 1, 2, len(part)) + part.tobytes())
+    geometry = QgsGeometry()
+    geometry.fromWkb(b''.join(wkb))
+    return geometry
+
+
+def geometry_to_arrays(geometry: QgsGeometry) -> List[np.ndarray]:
+    """
+    Extracts the coordinates of all parts of a line geometry. 2D line strings and multi line strings are read directly
+    from the WKB.
+    :param geometry: line or multi line geometry
+    :return: list with one (n x 2) coordinate array per part
+    """
+    if geometry is None or geometry.isEmpty():
+        return list()
+
+    wkb = bytes(geometry.asWkb())
+    byte_order = '<' if wkb[0] == 1 else '>'
+    wkb_type, count = struct.unpack(byte_order + 'II', wkb[1:9])
+    if wkb_type == 2 and len(wkb) == 9 + 16 * count:
+        return [np.frombuffer(wkb, dtype=byte_order + 'f8', offset=9).reshape(-1, 2).astype(float)]
+    if wkb_type == 5:
+        parts = list()
+        offset = 9
+        for _ in range(count):
+            if len(wkb) < offset + 9 or wkb[offset] != wkb[0]:
+                break
+            part_type, vertices = struct.unpack(byte_order + 'II', wkb[offset + 1:offset + 9])
+            if part_type != 2 or len(wkb) < offset + 9 + 16 * vertices:
+                break
+            part = np.frombuffer(wkb, dtype=byte_order + 'f8', count=2 * vertices, offset=offset + 9)
+            parts.append(part.reshape(-1, 2).astype(float))
+            offset += 9 + 16 * vertices
+        else:
+            if offset == len(wkb):
+                return parts
+
+    if geometry.isMultipart():
+        return [line_to_array(part) for part in geometry.asMultiPolyline()]
+    return [line_to_array(geometry.asPolyline())]
+
+
+class OffsetEngine:
+    """
+    Batch offset engine. The segment normals and join vectors of the base line are calculated once, afterwards all
+    offset lines are created from the distance vector as one (units x vertices) array operation.
+    """
+
+    def __init__(self, line: Sequence, join_style: int = JOIN_STYLE_MITER, segments: int = DEFAULT_SEGMENTS,
+                 miter_limit: float = 10.0, max_block_points: int = 4000000, simplify: bool = True,
+                 keep_loops: bool = False, previous: 'OffsetEngine' or None = None,
+                 corners: np.ndarray or None = None) -> None:
+        """
+        Initialization of the class
+        :param line: base line as list of QgsPointXY or (n x 2) array
+        :param join_style: join style (1: round, 2: mitered, 3: beveled)
+        :param segments: number of segments used to approximate a quarter circle for rounded joins
+        :param miter_limit: maximum ratio between miter length and offset distance, longer miters are clipped
+        :param max_block_points: maximum number of points computed in one array operation
+        :param simplify: if True, the geometries are computed from the base line simplified by
+        SIMPLIFY_FACTOR * distance
+        :param keep_loops: if True, the loops, the templates and the valid offset lines are kept, so an engine of the
+        changed base line can update them
+        :param previous: finished engine of the previous version of the base line. Only the offsets of the changed
+        vertices are calculated again and spliced into its kept offset lines, its kept loops are updated instead of
+        searching all loops of the offset lines again.
+        :param corners: boolean array with one value per vertex of the line, only vertices set to True get the join
+        style, the others are rounded. None for all vertices.
+        :raises ValueError: if the line has less than two distinct vertices or the join style is unknown
+        """
+        if join_style not in (JOIN_STYLE_ROUND, JOIN_STYLE_MITER, JOIN_STYLE_BEVEL):
+            raise ValueError("Unknown join style: {}".format(join_style))
+
+        coords = remove_duplicate_vertices(line_to_array(line))
+        if len(coords) < 2:
+            raise ValueError("Line has less than two distinct vertices")
+
+        self.__coords = coords
+        self.__join_style = join_style
+        self.__segments = max(int(segments), 1)
+        self.__miter_limit = float(miter_limit)
+        self.__max_block_points = max(int(max_block_points), 1)
+        self.__closed = len(coords) > 3 and bool(np.all(coords[0] == coords[-1]))
+        self.__corners = None if corners is None or len(corners) != len(coords) else np.asarray(corners, dtype=bool)
+        self.__templates = dict()  # type: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+        # rows of the template, which replace rows of the previous template, by sign, see __template
+        self.__windows = dict()  # type: Dict[int, Tuple[int, int, int]]
+        # indices of the vertices in the unsimplified base line, None for the unsimplified base line
+        self.__indices = None  # type: np.ndarray or None
+        self.__index = None  # type: SegmentIndex or None
+        self.__loops_removed = 0
+        self.__fallbacks = 0
+        # engines of the simplified base line by simplification tolerance (None, if the simplification keeps too many
+        # vertices), None if the base line is not simplified
+        self.__simplified = dict() if simplify else None  # type: Dict[float, OffsetEngine or None] or None
+        # kept loops and raw and cleaned valid offset lines by distance, None if they are not kept
+        self.__loops = dict() if keep_loops else None  # type: Dict[float, LoopState] or None
+        self.__lines = dict() if keep_loops else None  # type: Dict[float, Tuple[np.ndarray, np.ndarray]] or None
+        self.__kept_points = 0
+
+        vectors = np.diff(coords, axis=0)
+        lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+        tangents = vectors / lengths[:, np.newaxis]
+        self.__normals = np.column_stack((-tangents[:, 1], tangents[:, 0]))
+
+        # kept arrays of the previous engine and of its simplified engines by simplification tolerance, only the arrays
+        # are referenced, not the engines themselves
+        self.__previous = None  # type: _Previous or None
+        self.__previous_simplified = dict()  # type: Dict[float, _Previous]
+        # changed vertices compared with the previous base line, see __set_previous
+        self.__changed = None  # type: Tuple[int, int, int] or None
+        if previous is not None and previous.__loops is not None and previous.__closed == self.__closed and \
+                (previous.__join_style, previous.__segments, previous.__miter_limit) == \
+                (join_style, self.__segments, self.__miter_limit):
+            self.__set_previous(previous.__kept())
+            for tolerance, engine in (previous.__simplified or dict()).items():
+                if engine is not None:
+                    self.__previous_simplified[tolerance] = engine.__kept()
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """
+        returns the cleaned coordinates of the base line
+        :return: (n x 2) coordinate array of the base line
+        """
+        return self.__coords
+
+    @property
+    def fallbacks(self) -> int:
+        """
+        returns the number of offset lines, which failed the validity test and were replaced by the GEOS offset curve
+        :return: the number of replaced offset lines
+        """
+        return self.__fallbacks
+
+    @property
+    def join_style(self) -> int:
+        """
+        returns the join style of the engine
+        :return: the join style of the engine
+        """
+        return self.__join_style
+
+    @property
+    def loops_removed(self) -> int:
+        """
+        returns the number of invalid loops and end pieces removed from the offset lines, including the loops of the
+        lines replaced by the GEOS offset curve
+        :return: the number of removed loops and end pieces
+        """
+        return self.__loops_removed
+
+    @property
+    def segments(self) -> int:
+        """
+        returns the number of segments per quarter circle
+        :return: the number of segments per quarter circle
+        """
+        return self.__segments
+
+    #
+    # private functions
+    #
+
+    def __base_index(self) -> SegmentIndex:
+        """
+        Returns the segment index of the base line. The index is created on first use.
+        :return: the segment index of the base line
+        """
+        if self.__index is None:
+            self.__index = SegmentIndex([self.__coords])
+        return self.__index
+
+    def __kept(self) -> _Previous:
+        """
+        Returns the arrays, which the engine of the edited base line reuses
+        :return: the kept arrays of this engine
+        """
+        return _Previous(self.__coords, self.__corners, self.__indices, self.__templates, self.__lines, self.__loops)
+
+    def __set_previous(self, previous: _Previous or None) -> None:
+        """
+        Sets the kept arrays of the previous engine and finds the changed vertices of the base line as tuple of the
+        first changed vertex and the ends of the changed vertices in the previous and in this base line, see
+        changed_range. Changes of a closed line, which touch its closing vertex, change the whole line.
+        :param previous: kept arrays of the previous engine or None
+        """
+        self.__previous = previous
+        if previous is None:
+            return
+        old, new = previous.coords, self.__coords
+        if previous.corners is not None and self.__corners is not None:
+            # a changed corner flag changes the join like a moved vertex
+            old = np.column_stack((old, previous.corners))
+            new = np.column_stack((new, self.__corners))
+        changed = changed_range(old, new)
+        if changed is None:
+            changed = (len(new), len(new), len(new))
+        elif self.__closed and changed[1] > len(old) - 2:
+            changed = (0, len(old), len(new))
+        self.__changed = changed
+
+    def __adjacent_normals(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the vertices, which get an offset point, with the normals of their incoming and outgoing segment. The
+        end vertices of an open line use the normal of their only segment twice.
+        :return: tuple of the (v x 2) vertices, incoming normals and outgoing normals
+        """
+        if self.__closed:
+            # the last vertex equals the first one, every vertex has an incoming and an outgoing segment
+            return self.__coords[:-1], np.roll(self.__normals, 1, axis=0), self.__normals
+        return self.__coords, np.vstack((self.__normals[:1], self.__normals)), \
+            np.vstack((self.__normals, self.__normals[-1:]))
+
+    def __engine(self, distance: float) -> 'OffsetEngine':
+        """
+        Returns the engine, which computes the offset line of the given distance: the engine of the base line
+        simplified by SIMPLIFY_FACTOR * distance or this engine, if the base line is not simplified
+        :param distance: signed offset distance
+        :return: the engine of the offset line
+        """
+        if self.__simplified is None or distance == 0:
+            return self
+        # power of two tolerances, so near distances share the simplified engine
+        tolerance = 2.0 ** math.floor(math.log2(abs(distance) * SIMPLIFY_FACTOR))
+        if tolerance not in self.__simplified:
+            self.__simplified[tolerance] = self.__simplify(tolerance)
+        return self.__simplified[tolerance] or self
+
+    def __simplify(self, tolerance: float) -> 'OffsetEngine' or None:
+        """
+        Creates the engine of the simplified base line. The simplified line keeps the end segments, so the ends of
+        the offset lines stay perpendicular to the base line. Its vertices replace bends of several vertices, they
+        are rounded, only the corners of the base line (vertices, whose join differs from a round join) keep the join
+        style. An edited base line keeps the simplification of the previous base line outside of the changed vertices.
+        :param tolerance: simplification tolerance
+        :return: the engine of the simplified base line or None, if the simplification keeps too many vertices
+        """
+        coords = self.__coords
+        previous = self.__previous_simplified.get(tolerance)
+        indices = None
+        if previous is not None:
+            start, old_end, end = self.__changed
+            before = previous.indices[previous.indices < start]
+            after = previous.indices[previous.indices >= old_end] + (end - old_end)
+            if len(before) > 0 and len(after) > 0:
+                # only the vertices between the last kept vertex before and the first kept vertex after the changed
+                # vertices are simplified again
+                middle = before[-1] + simplify_indices(coords[before[-1]:after[0] + 1], tolerance)
+                indices = np.concatenate((before[:-1], middle, after[1:]))
+            elif start == len(previous.coords) == len(coords):
+                indices = previous.indices
+        if indices is None:
+            indices = simplify_indices(coords, tolerance)
+        if not self.__closed:
+            indices = np.union1d(indices, [1, len(coords) - 2])
+        if len(indices) > MAX_SIMPLIFIED_FRACTION * len(coords) or (self.__closed and len(indices) < 5):
+            return None
+
+        _, n_in, n_out = self.__adjacent_normals()
+        angles = np.abs(np.arctan2(n_in[:, 0] * n_out[:, 1] - n_in[:, 1] * n_out[:, 0],
+                                   np.sum(n_in * n_out, axis=1)))
+        corners = angles > math.pi / 2 / self.__segments
+        if self.__closed:
+            corners = np.append(corners, corners[:1])
+        if self.__corners is not None:
+            corners &= self.__corners
+
+        engine = OffsetEngine(coords[indices], self.__join_style, self.__segments, self.__miter_limit,
+                              self.__max_block_points, simplify=False, keep_loops=self.__loops is not None,
+                              corners=corners[indices])
+        engine.__indices = indices
+        engine.__set_previous(previous)
+        return engine
+
+    def __geometries(self, distances: List[float]) -> Tuple[List[QgsGeometry], int, int]:
+        """
+        Serial implementation of geometries
+        :param distances: list of signed offset distances
+        :return: tuple of the QgsGeometry line strings in the order of the given distances, the number of removed
+        loops and the number of lines replaced by the GEOS offset curve
+        """
+        result = list()
+        loops = 0
+        fallbacks = 0
+        base_geometry = None
+        # raw offset lines of all distances, one array operation per engine
+        engines = [self.__engine(distance) for distance in distances]
+        lines = [None] * len(distances)  # type: List[np.ndarray]
+        for engine in dict.fromkeys(engines):
+            indices = [i for i, other in enumerate(engines) if other is engine]
+            for i, line in zip(indices, engine.offset([distances[i] for i in indices])):
+                lines[i] = line
+
+        for distance, engine, line in zip(distances, engines, lines):
+            if distance == 0:
+                result.append(array_to_geometry(self.__coords))
+                continue
+
+            coords, removed, raw = engine.__clean(line, distance)
+            # the loops of replaced lines are counted as well, the GEOS offset curve removes them too
+            loops += removed
+            geometry = array_to_geometry(coords)
+            previous = engine.__previous.lines.get(distance) if engine.__previous is not None else None
+            if self.__valid(coords, raw, geometry, distance, None if previous is None else previous[1]):
+                engine.__keep(engine.__lines, distance, (line, coords), len(line) + len(coords))
+            else:
+                if base_geometry is None:
+                    base_geometry = array_to_geometry(self.__coords)
+                geometry = base_geometry.offsetCurve(distance, self.__segments, self.__join_style,
+                                                     self.__miter_limit)
+                fallbacks += 1
+            result.append(geometry)
+        return result, loops, fallbacks
+
+    def __clean(self, coords: np.ndarray, distance: float) -> Tuple[np.ndarray, int, np.ndarray]:
+        """
+        Removes the duplicate vertices and the invalid loops of an offset line. If the previous engine kept the loops
+        of this distance, only the loops around the changed part of the base line are searched again.
+        :param coords: (n x 2) coordinate array of the offset line
+        :param distance: signed offset distance
+        :return: tuple of the cleaned coordinate array, the number of removed loops and the raw offset line, from
+        which the loops were removed
+        """
+        coords = remove_duplicate_vertices(coords)
+        state = None
+        if self.__previous is not None and distance in self.__previous.loops:
+            state = update_loops(self.__previous.loops[distance], coords, distance, self.__base_index(), self.__closed,
+                                 self.__previous.coords, self.__coords, True)
+        if state is None:
+            state = find_loops(coords, distance, self.__base_index(), self.__closed)
+        self.__keep(self.__loops, distance, state, len(state.coords))
+        return cut_loops(state) + (state.coords,)
+
+    def __keep(self, kept: Dict or None, distance: float, value, points: int) -> None:
+        """
+        Keeps the loops or the lines of a distance for the engine of the edited base line, as long as the engine keeps
+        at most MAX_KEPT_POINTS vertices
+        :param kept: dictionary of the kept loops or lines by distance, None if they are not kept
+        :param distance: signed offset distance
+        :param value: kept loops or lines
+        :param points: number of vertices of the kept loops or lines
+        """
+        if kept is not None and self.__kept_points + points <= MAX_KEPT_POINTS:
+            kept[distance] = value
+            self.__kept_points += points
+
+    def __valid(self, coords: np.ndarray, raw: np.ndarray, geometry: QgsGeometry, distance: float,
+                previous: np.ndarray or None = None) -> bool:
+        """
+        Tests the cleaned offset line: it has to be a simple line and all its vertices taken from the raw offset line
+        have to keep the offset distance (within VALID_TOLERANCE) to the base line. Loops, which the loop removal
+        missed or cut at the wrong intersection, fail the test. The cut and trim points are not tested, they lie on
+        the raw offset segments, which are closer to the base line along beveled and coarse rounded joins.
+        :param coords: (n x 2) coordinate array of the cleaned offset line
+        :param raw: (m x 2) coordinate array of the raw offset line, from which the loops were removed
+        :param geometry: line string geometry of the cleaned offset line
+        :param distance: signed offset distance
+        :param previous: valid cleaned offset line of the previous base line or None. Only the vertices, which are not
+        vertices of the previous line or are near the changed vertices of the base line, are tested.
+        :return: True, if the offset line is valid
+        """
+        if len(coords) < 2:
+            return False
+        limit = abs(distance) * (1 - VALID_TOLERANCE)
+        if previous is None:
+            # valid vertices keep the full distance, so a decimated base line, which deviates half the tolerance,
+            # decides them without the exact segments
+            close = self.__base_index().closer_than(coords, limit, abs(distance) * VALID_TOLERANCE / 2)
+        else:
+            # the other vertices keep their distance to the unchanged base segments
+            start, _, end = self.__changed
+            changed = self.__coords[max(start - 1, 0):end + 1]
+            near = np.all((coords >= changed.min(axis=0) - limit) & (coords <= changed.max(axis=0) + limit), axis=1)
+            tested = np.flatnonzero(near | ~np.isin(coords @ np.array([1, 1j]), previous @ np.array([1, 1j])))
+            close = np.zeros(len(coords), dtype=bool)
+            close[tested] = self.__base_index().closer_than(coords[tested], limit)
+        if np.any(close):
+            # the points are compared as complex numbers
+            if np.any(np.isin(coords[close] @ np.array([1, 1j]), raw @ np.array([1, 1j]))):
+                return False
+        return geometry.isSimple()
+
+    def __template(self, sign: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the offset template for the given side. Each offset point of a line on this side is calculated as
+        base + distance * direction. The template of an edited base line is spliced: only the rows of the changed
+        vertices and their neighbours are calculated again, the other rows are taken from the template of the previous
+        engine.
+        :param sign: 1 for offsets to the left, -1 for offsets to the right
+        :return: tuple with the base points and direction vectors as (p x 2) arrays and the first row of every vertex
+        followed by the number of rows without the closing row of a closed line
+        """
+        if sign in self.__templates:
+            return self.__templates[sign]
+
+        count = len(self.__coords) - 1 if self.__closed else len(self.__coords)
+        first, last = 0, count
+        previous = self.__previous.templates.get(sign) if self.__previous is not None else None
+        if previous is not None:
+            start, old_end, end = self.__changed
+            # the rows of a vertex depend on the vertex and on its adjacent segments
+            first = min(max(start - 1, 0), count)
+            last = min(end + 1, count)
+            old_last = min(old_end + 1, len(previous[2]) - 1)
+
+        base, directions, counts = self.__template_rows(sign, first, last)
+        starts = np.concatenate(([0], np.cumsum(counts)))
+        if previous is not None:
+            old_base, old_directions, old_starts = previous
+            rows, old_rows = int(old_starts[first]), int(old_starts[old_last])
+            base = np.concatenate((old_base[:rows], base, old_base[old_rows:old_starts[-1]]))
+            directions = np.concatenate((old_directions[:rows], directions, old_directions[old_rows:old_starts[-1]]))
+            starts = np.concatenate((old_starts[:first], rows + starts[:-1],
+                                     old_starts[old_last:] - old_rows + rows + starts[-1]))
+            # rows of the previous offset lines, which are replaced by the rows of the changed vertices
+            self.__windows[sign] = (rows, old_rows, int(starts[last]))
+
+        if self.__closed:
+            base = np.vstack((base, base[:1]))
+            directions = np.vstack((directions, directions[:1]))
+
+        self.__templates[sign] = (base, directions, starts)
+        return self.__templates[sign]
+
+    def __template_rows(self, sign: int, first: int, last: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculates the template rows of a range of vertices, see __template
+        :param sign: 1 for offsets to the left, -1 for offsets to the right
+        :param first: index of the first vertex
+        :param last: index after the last vertex
+        :return: tuple with the base points and direction vectors as (p x 2) arrays and the number of rows of every
+        vertex
+        """
+        vertices, n_in, n_out = self.__adjacent_normals()
+        vertices, n_in, n_out = vertices[first:last], n_in[first:last], n_out[first:last]
+        if len(vertices) == 0:
+            return vertices, n_in, np.zeros(0, dtype=np.int64)
+
+        dot = np.clip(np.sum(n_in * n_out, axis=1), -1.0, 1.0)
+        cross = n_in[:, 0] * n_out[:, 1] - n_in[:, 1] * n_out[:, 0]
+        reversal = (1.0 + dot) < 1e-12
+
+        # outer vertices get a join, inner vertices the intersection of the adjacent offset segments
+        outer = ((sign * cross) < -1e-12) | reversal
+        if not self.__closed:
+            # the end vertices get no join
+            if first == 0:
+                outer[0] = False
+            if last == len(self.__coords):
+                outer[-1] = False
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            miter = (n_in + n_out) / (1.0 + dot)[:, np.newaxis]
+        miter[reversal] = n_in[reversal]
+
+        delta = np.arctan2(cross, dot)
+        delta[reversal] = -sign * math.pi
+
+        # vertices, which are no corners, are rounded
+        rounded = np.full(len(vertices), self.__join_style == JOIN_STYLE_ROUND)
+        if self.__corners is not None:
+            rounded |= ~self.__corners[first:last]
+
+        counts = np.ones(len(vertices), dtype=np.int64)
+        step = math.pi / 2.0 / self.__segments
+        arc = np.maximum(np.ceil(np.abs(delta) / step - 1e-9), 1).astype(np.int64)
+        counts[outer & rounded] = arc[outer & rounded] + 1
+        if self.__join_style == JOIN_STYLE_MITER:
+            too_long = np.hypot(miter[:, 0], miter[:, 1]) > self.__miter_limit
+            counts[outer & ~rounded & (too_long | reversal)] = 2
+        else:
+            counts[outer & ~rounded] = 2
+
+        index = np.repeat(np.arange(len(vertices)), counts)
+        local = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        directions = miter[index]
+        multi = counts[index] > 1
+        clipped = multi & ~rounded[index] if self.__join_style == JOIN_STYLE_MITER else np.zeros_like(multi)
+        if np.any(clipped):
+            # miter clipped at the miter limit, perpendicular to the bisector of the join
+            t_in = np.column_stack((n_in[:, 1], -n_in[:, 0]))
+            t_out = np.column_stack((n_out[:, 1], -n_out[:, 0]))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bisector = miter / np.hypot(miter[:, 0], miter[:, 1])[:, np.newaxis]
+                bisector[reversal] = t_in[reversal]
+                a = (self.__miter_limit - np.sum(n_in * bisector, axis=1)) / np.sum(t_in * bisector, axis=1)
+                c = (self.__miter_limit - np.sum(n_out * bisector, axis=1)) / -np.sum(t_out * bisector, axis=1)
+            vertex = index[clipped]
+            directions[clipped] = np.where((local[clipped] == 0)[:, np.newaxis],
+                                           n_in[vertex] + a[vertex, np.newaxis] * t_in[vertex],
+                                           n_out[vertex] - c[vertex, np.newaxis] * t_out[vertex])
+        # rounded and beveled joins (a bevel is an arc of one segment)
+        multi &= ~clipped
+        if np.any(multi):
+            vertex = index[multi]
+            fraction = local[multi] / (counts[vertex] - 1)
+            angle = np.arctan2(n_in[vertex, 1], n_in[vertex, 0]) + delta[vertex] * fraction
+            directions[multi] = np.column_stack((np.cos(angle), np.sin(angle)))
+
+        return vertices[index], directions, counts
+
+    #
+    # public functions
+    #
+
+    def geometries(self, distances: Sequence[float], workers: int = 1) -> List[QgsGeometry]:
+        """
+        Calculates the offset lines for all given distances as QgsGeometry objects. Every offset line is computed
+        from the base line simplified by SIMPLIFY_FACTOR * distance, distances with the same simplification tolerance
+        share the simplified base line and are computed in one array operation. The invalid local loops of the raw
+        offset lines are removed, lines, which are still invalid afterwards, are replaced by the GEOS offset curve. The
+        loops of replaced lines are counted as well. With more than one worker, the distances are split into
+        contiguous chunks, which are processed by a thread pool. The result is identical to the serial computation.
+        :param distances: list of signed offset distances
+        :param workers: number of worker threads
+        :return: list of QgsGeometry line strings in the order of the given distances
+        """
+        distances = [float(distance) for distance in distances]
+        workers = max(1, min(int(workers), len(distances)))
+        if workers == 1:
+            geometries, loops, fallbacks = self.__geometries(distances)
+            self.__loops_removed += loops
+            self.__fallbacks += fallbacks
+            return geometries
+
+        # create the shared simplified engines, their templates and the base line indices before the workers start
+        for distance in set(distances) - {0}:
+            engine = self.__engine(distance)
+            engine.__template(int(np.sign(distance)))
+            engine.__base_index()
+        self.__base_index()
+
+        size = int(math.ceil(len(distances) / workers))
+        chunks = [distances[start:start + size] for start in range(0, len(distances), size)]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            results = list(executor.map(self.__geometries, chunks))
+        self.__loops_removed += sum(loops for _, loops, _ in results)
+        self.__fallbacks += sum(fallbacks for _, _, fallbacks in results)
+        return [geometry for geometries, _, _ in results for geometry in geometries]
+
+    def offset(self, distances: Sequence[float]) -> List[np.ndarray]:
+        """
+        Calculates the raw offset lines for all given distances. Positive distances are left of the line direction,
+        negative distances right of it. Distances with the same sign are calculated in one array operation. The lines of
+        an edited base line, which the previous engine kept, are spliced: only the rows of the changed vertices and
+        their neighbours are calculated again.
+        :param distances: list of signed offset distances
+        :return: list of (p x 2) coordinate arrays in the order of the given distances
+        """
+        distances = np.asarray(distances, dtype=float).reshape(-1)
+        result = [None] * len(distances)  # type: List[np.ndarray]
+
+        for i in np.flatnonzero(distances == 0):
+            result[i] = self.__coords.copy()
+
+        for sign in (1, -1):
+            indices = np.flatnonzero(np.sign(distances) == sign)
+            if len(indices) == 0:
+                continue
+            base, directions, _ = self.__template(sign)
+            if sign in self.__windows:
+                # the kept lines of the previous engine are spliced, only the rows of the changed vertices are new
+                first, old_last, last = self.__windows[sign]
+                spliced = [i for i in indices if distances[i] in self.__previous.lines]
+                for i in spliced:
+                    line = self.__previous.lines[distances[i]][0]
+                    result[i] = np.concatenate((line[:first], base[first:last] + distances[i] * directions[first:last],
+                                                line[old_last:]))
+                    if self.__closed:
+                        result[i][-1] = result[i][0]
+                indices = np.setdiff1d(indices, spliced)
+            block = max(self.__max_block_points // len(base), 1)
+            for start in range(0, len(indices), block):
+                chunk = indices[start:start + block]
+                lines = base[np.newaxis, :, :] + distances[chunk, np.newaxis, np.newaxis] * directions[np.newaxis, :, :]
+                for i, line in zip(chunk, lines):
+                    result[i] = line
+
+        return result
+
+
+class OffsetCache:
+    """
+    Bounded LRU cache for offset geometries. The key is a tuple of the base geometry WKB hash, the signed cumulative
+    distance, the join style and the segment count.
+    """
+
+    def __init__(self, max_size: int = 512) -> None:
+        """
+        Initialization of the class
+        :param max_size: maximum number of stored geometries
+        :raises ValueError: if max_size is smaller than 1
+        """
+        if max_size < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.__max_size = int(max_size)
+        self.__items = OrderedDict()  # type: OrderedDict
+        self.__hits = 0
+        self.__misses = 0
+
+    def __contains__(self, key: Tuple) -> bool:
+        """
+        returns, if the key is stored inside the cache. Doesn't change the hit / miss counters.
+        :param key: cache key
+        :return: True, if the key is stored inside the cache, else False
+        """
+        return key in self.__items
+
+    def __len__(self) -> int:
+        """
+        returns the number of stored geometries
+        :return: the number of stored geometries
+        """
+        return len(self.__items)
+
+    @staticmethod
+    def key(geometry_hash: str, distance: float, join_style: int, segments: int, tolerance: float = 0.0,
+            window: Tuple[float, float, float, float] or None = None) -> Tuple:
+        """
+        Creates a cache key from the given values
+        :param geometry_hash: hash of the WKB of the base geometry
+        :param distance: signed cumulative offset distance
+        :param join_style: join style of the offset
+        :param segments: number of segments per quarter circle
+        :param tolerance: simplification tolerance of the base geometry, 0 for the exact geometry
+        :param window: clipping window of the base geometry, None for the whole geometry
+        :return: returns the cache key
+        """
+        return geometry_hash, float(distance), int(join_style), int(segments), float(tolerance), window
+
+    @property
+    def hits(self) -> int:
+        """
+        returns the number of cache hits
+        :return: the number of cache hits
+        """
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """
+        returns the number of cache misses
+        :return: the number of cache misses
+        """
+        return self.__misses
+
+    @property
+    def max_size(self) -> int:
+        """
+        returns the maximum number of stored geometries
+        :return: the maximum number of stored geometries
+        """
+        return self.__max_size
+
+    @max_size.setter
+    def max_size(self, value: int) -> None:
+        """
+        Sets the maximum number of stored geometries and evicts the least recently used items, if necessary
+        :param value: new maximum number of stored geometries
+        :return: Nothing
+        :raises ValueError: if value is smaller than 1
+        """
+        if int(value) < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.__max_size = int(value)
+        while len(self.__items) > self.__max_size:
+            self.__items.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes all stored geometries and resets the hit / miss counters
+        :return: Nothing
+        """
+        self.__items.clear()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key: Tuple) -> QgsGeometry or None:
+        """
+        returns the geometry stored for the given key and marks it as recently used
+        :param key: cache key
+        :return: the stored geometry or None, if the key is not cached
+        """
+        geometry = self.__items.get(key)
+        if geometry is None:
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        self.__items.move_to_end(key)
+        return geometry
+
+    def put(self, key: Tuple, geometry: QgsGeometry) -> None:
+        """
+        Stores the geometry for the given key and evicts the least recently used item, if the cache is full
+        :param key: cache key
+        :param geometry: offset geometry
+        :return: Nothing
+        """
+        self.__items[key] = geometry
+        self.__items.move_to_end(key)
+        if len(self.__items) > self.__max_size:
+            self.__items.popitem(last=False)
+
+
+class MultiPartOffsetEngine:
+    """
+    Offset engine for all parts of a (multi part) line. Every part has its own OffsetEngine, all parts share the
+    same distance vector. The offsets of one distance are combined to one (multi) line geometry.
+    """
+
+    def __init__(self, parts: Sequence[np.ndarray], join_style: int = JOIN_STYLE_MITER,
+                 segments: int = DEFAULT_SEGMENTS, keep_loops: bool = False,
+                 previous: 'MultiPartOffsetEngine' or None = None) -> None:
+        """
+        Initialization of the class
+        :param parts: list of (n x 2) coordinate arrays, one per part
+        :param join_style: join style (1: round, 2: mitered, 3: beveled)
+        :param segments: number of segments used to approximate a quarter circle for rounded joins
+        :param keep_loops: if True, the loops of the offset lines are kept, see OffsetEngine
+        :param previous: finished engine of the previous version of the line, its part engines are passed to the
+        part engines with the same index
+        :raises ValueError: if no part has at least two distinct vertices
+        """
+        previous_engines = list() if previous is None else previous.engines
+        self.__engines = list()  # type: List[OffsetEngine]
+        for part in parts:
+            index = len(self.__engines)
+            try:
+                self.__engines.append(OffsetEngine(
+                    part, join_style, segments, keep_loops=keep_loops,
+                    previous=previous_engines[index] if index < len(previous_engines) else None))
+            except ValueError:
+                continue
+        if len(self.__engines) == 0:
+            raise ValueError("No part has at least two distinct vertices")
+
+    @property
+    def engines(self) -> List[OffsetEngine]:
+        """
+        returns the offset engines of all usable parts
+        :return: the offset engines of all usable parts
+        """
+        return self.__engines
+
+    @property
+    def loops_removed(self) -> int:
+        """
+        returns the number of invalid loops and end pieces removed from the offset lines of all parts
+        :return: the number of removed loops and end pieces
+        """
+        return sum(engine.loops_removed for engine in self.__engines)
+
+    @property
+    def fallbacks(self) -> int:
+        """
+        returns the number of offset lines of all parts, which were replaced by the GEOS offset curve
+        :return: the number of replaced offset lines
+        """
+        return sum(engine.fallbacks for engine in self.__engines)
+
+    def geometries(self, distances: Sequence[float], workers: int = 1) -> List[QgsGeometry]:
+        """
+        Calculates the offset lines of all parts for all given distances
+        :param distances: list of signed offset distances
+        :param workers: number of worker threads
+        :return: list of QgsGeometry (multi) line strings in the order of the given distances
+        """
+        if len(self.__engines) == 1:
+            return self.__engines[0].geometries(distances, workers)
+
+        per_part = [engine.geometries(distances, workers) for engine in self.__engines]
+        result = list()
+        for geometries in zip(*per_part):
+            result.append(arrays_to_geometry([part for geometry in geometries
+                                              for part in geometry_to_arrays(geometry)]))
+        return result
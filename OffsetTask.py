@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+from collections import namedtuple
+from typing import List, Sequence
+
+import numpy as np
+from PyQt5.QtCore import pyqtSignal
+from qgis.core import QgsGeometry, QgsTask
+
+from .CrsTransforms import transform_geometries
+from .FileOutput import color_text
+from .OffsetEngine import MultiPartOffsetEngine, clip_coordinates, simplify_coordinates
+from .PluginLogger import LOGGER
+from .UnitBands import unit_bands
+
+ConstructionSnapshot = namedtuple("ConstructionSnapshot", ["coordinates", "geometry_hash", "join_style", "segments",
+                                                           "tolerance", "window", "transform", "names", "colors",
+                                                           "distances", "lower_distances"])
+ConstructionSnapshot.__doc__ = """
+Immutable snapshot of a construction: the base line coordinates in the working reference system (tuple of read-only
+arrays, one per part) and its hash, the join style, the segment count, the simplification tolerance of the base line
+(0 for the exact geometry), the clipping window (x minimum, y minimum, x maximum, y maximum or None for the whole
+line), the transform of the offsets into the output reference system (a copy owned by the snapshot, None if no
+transform is needed) and one name, RGBA colour, signed cumulative distance and signed distance of the lower unit
+boundary per constructed unit
+"""
+
+
+def freeze_coordinates(coords: np.ndarray) -> np.ndarray:
+    """
+    Returns a read-only copy of the given coordinate array, which can safely be shared with background tasks
+    :param coords: (n x 2) coordinate array
+    :return: read-only copy of the coordinate array
+    """
+    coords = np.array(coords, dtype=float)
+    coords.setflags(write=False)
+    return coords
+
+
+class OffsetTask(QgsTask):
+    """
+    Background task, which computes the offset geometries of a construction snapshot
+    """
+
+    def __init__(self, description: str, snapshot: ConstructionSnapshot, indices: Sequence[int],
+                 workers: int = 1, chunk_size: int = 16, keep_loops: bool = False,
+                 previous: MultiPartOffsetEngine or None = None) -> None:
+        """
+        Initialization of the class
+        :param description: task description shown in the QGIS task manager
+        :param snapshot: immutable snapshot of the construction
+        :param indices: indices of the snapshot units, which have to be computed
+        :param workers: number of worker threads used for the offsets
+        :param chunk_size: number of units per worker computed between two cancellation checks
+        :param keep_loops: if True, the offset engine keeps the loops and the offset lines, see OffsetEngine
+        :param previous: offset engine of a finished task of the previous version of the line, whose offset lines
+        and loops are updated around the changed vertices instead of computing them again
+        """
+        super().__init__(description, QgsTask.CanCancel)
+        self.__snapshot = snapshot
+        self.__indices = tuple(indices)
+        self.__workers = max(int(workers), 1)
+        self.__chunk_size = max(int(chunk_size), 1) * self.__workers
+        self.__keep_loops = keep_loops
+        self.__previous = previous
+        self.__engine = None  # type: MultiPartOffsetEngine or None
+        self.__geometries = list()  # type: List[QgsGeometry]
+        self.__loops_removed = 0
+        self.__fallbacks = 0
+        self.__elapsed = 0.0
+        self.__exception = None
+
+    @property
+    def elapsed(self) -> float:
+        """
+        returns the time spent in run
+        :return: the elapsed time in seconds
+        """
+        return self.__elapsed
+
+    @property
+    def engine(self) -> MultiPartOffsetEngine or None:
+        """
+        returns the offset engine of the finished task, which can be passed to the task of the next version of the
+        line
+        :return: the offset engine or None, if the engine does not keep its loops or no offset was computed
+        """
+        return self.__engine
+
+    @property
+    def geometries(self) -> List[QgsGeometry]:
+        """
+        returns the computed geometries in the order of the requested indices
+        :return: the computed geometries
+        """
+        return self.__geometries
+
+    @property
+    def indices(self) -> Sequence[int]:
+        """
+        returns the indices of the computed snapshot units
+        :return: the indices of the computed snapshot units
+        """
+        return self.__indices
+
+    @property
+    def fallbacks(self) -> int:
+        """
+        returns the number of computed geometries, which were replaced by the GEOS offset curve
+        :return: the number of replaced geometries
+        """
+        return self.__fallbacks
+
+    @property
+    def loops_removed(self) -> int:
+        """
+        returns the number of invalid loops and end pieces removed from the computed geometries
+        :return: the number of removed loops and end pieces
+        """
+        return self.__loops_removed
+
+    @property
+    def snapshot(self) -> ConstructionSnapshot:
+        """
+        returns the construction snapshot of the task
+        :return: the construction snapshot of the task
+        """
+        return self.__snapshot
+
+    def run(self) -> bool:
+        """
+        Computes the offset geometries. Runs in a background thread and must not access the GUI or the model.
+        :return: True, if all geometries were computed, else False
+        """
+        start = time.perf_counter()
+        try:
+            snapshot = self.__snapshot
+            coordinates = snapshot.coordinates
+            if snapshot.window is not None:
+                coordinates = [piece for part in coordinates for piece in clip_coordinates(part, snapshot.window)]
+                if len(coordinates) == 0:
+                    # the line does not touch the window
+                    self.__geometries = [QgsGeometry() for _ in self.__indices]
+                    return True
+            if snapshot.tolerance > 0:
+                coordinates = [simplify_coordinates(part, snapshot.tolerance) for part in coordinates]
+            engine = MultiPartOffsetEngine(coordinates, snapshot.join_style, snapshot.segments, self.__keep_loops,
+                                           self.__previous)
+            distances = [snapshot.distances[i] for i in self.__indices]
+            for offset in range(0, len(distances), self.__chunk_size):
+                if self.isCanceled():
+                    return False
+                chunk = distances[offset:offset + self.__chunk_size]
+                self.__geometries.extend(transform_geometries(engine.geometries(chunk, self.__workers),
+                                                              snapshot.transform))
+                self.__loops_removed = engine.loops_removed
+                self.__fallbacks = engine.fallbacks
+                self.setProgress(100.0 * len(self.__geometries) / len(distances))
+            if self.__keep_loops:
+                self.__engine = engine
+            return not self.isCanceled()
+        except Exception as e:
+            self.__exception = e
+            return False
+        finally:
+            self.__elapsed = time.perf_counter() - start
+
+    def finished(self, result: bool) -> None:
+        """
+        Called in the main thread after run returned. Logs exceptions raised inside the background thread.
+        :param result: return value of run
+        :return: Nothing
+        """
+        if self.__exception is not None:
+            LOGGER.exception(self.__exception)
+
+
+class BatchOffsetTask(QgsTask):
+    """
+    Background task, which computes the offset geometries for a list of construction snapshots (one per feature).
+    The results are streamed in chunks through the chunk_ready signal.
+    """
+
+    def __init__(self, description: str, snapshots: Sequence[ConstructionSnapshot], workers: int = 1,
+                 chunk_size: int = 1000, bands: bool = False) -> None:
+        """
+        Initialization of the class
+        :param description: task description shown in the QGIS task manager
+        :param snapshots: immutable construction snapshots, one per feature
+        :param workers: number of worker threads used for the offsets
+        :param chunk_size: minimum number of geometries per emitted chunk
+        :param bands: True, if the band polygons of the units are created, too
+        """
+        super().__init__(description, QgsTask.CanCancel)
+        self.__snapshots = tuple(snapshots)
+        self.__workers = max(int(workers), 1)
+        self.__chunk_size = max(int(chunk_size), 1)
+        self.__bands = bands
+        self.__bands_skipped = 0
+        self.__count = 0
+        self.__skipped = 0
+        self.__loops_removed = 0
+        self.__fallbacks = 0
+        self.__elapsed = 0.0
+        self.__exception = None
+
+    # signals
+    chunk_ready = pyqtSignal(list, list, name='chunk_ready')
+
+    @property
+    def bands_skipped(self) -> int:
+        """
+        returns the number of units, whose band polygon could not be created
+        :return: the number of skipped band polygons
+        """
+        return self.__bands_skipped
+
+    @property
+    def count(self) -> int:
+        """
+        returns the number of computed geometries
+        :return: the number of computed geometries
+        """
+        return self.__count
+
+    @property
+    def elapsed(self) -> float:
+        """
+        returns the time spent in run
+        :return: the elapsed time in seconds
+        """
+        return self.__elapsed
+
+    @property
+    def fallbacks(self) -> int:
+        """
+        returns the number of computed geometries, which were replaced by the GEOS offset curve
+        :return: the number of replaced geometries
+        """
+        return self.__fallbacks
+
+    @property
+    def loops_removed(self) -> int:
+        """
+        returns the number of invalid loops and end pieces removed from the computed geometries
+        :return: the number of removed loops and end pieces
+        """
+        return self.__loops_removed
+
+    @property
+    def skipped(self) -> int:
+        """
+        returns the number of skipped features, which have no part with at least two distinct vertices
+        :return: the number of skipped features
+        """
+        return self.__skipped
+
+    def run(self) -> bool:
+        """
+        Computes the offset geometries of all snapshots and emits them in chunks of [name, geometry] pairs. If band
+        polygons are requested, every chunk contains the [name, polygon, colour] triples of the bands, too.
+        Runs in a background thread and must not access the GUI or the model.
+        :return: True, if all geometries were computed, else False
+        """
+        start = time.perf_counter()
+        try:
+            units = list()
+            bands = list()
+            for index, snapshot in enumerate(self.__snapshots):
+                if self.isCanceled():
+                    return False
+                try:
+                    engine = MultiPartOffsetEngine(snapshot.coordinates, snapshot.join_style, snapshot.segments)
+                except ValueError:
+                    self.__skipped += 1
+                    continue
+                geometries = engine.geometries(snapshot.distances, self.__workers)
+                self.__loops_removed += engine.loops_removed
+                self.__fallbacks += engine.fallbacks
+                # the bands are stitched in the working reference system, both outputs are transformed afterwards
+                if self.__bands:
+                    polygons = unit_bands(snapshot.coordinates, snapshot.distances, snapshot.lower_distances,
+                                          geometries)
+                    self.__bands_skipped += sum(polygon is None for polygon in polygons)
+                    polygons = transform_geometries(polygons, snapshot.transform)
+                    bands.extend([name, polygon, color_text(rgba)] for name, polygon, rgba in
+                                 zip(snapshot.names, polygons, snapshot.colors) if polygon is not None)
+                geometries = transform_geometries(geometries, snapshot.transform)
+                units.extend([name, geometry] for name, geometry in zip(snapshot.names, geometries))
+                self.__count += len(geometries)
+                if len(units) + len(bands) >= self.__chunk_size:
+                    # noinspection PyUnresolvedReferences
+                    self.chunk_ready.emit(units, bands)
+                    units = list()
+                    bands = list()
+                self.setProgress(100.0 * (index + 1) / len(self.__snapshots))
+            if len(units) + len(bands) > 0:
+                # noinspection PyUnresolvedReferences
+                self.chunk_ready.emit(units, bands)
+            return not self.isCanceled()
+        except Exception as e:
+            self.__exception = e
+            return False
+        finally:
+            self.__elapsed = time.perf_counter() - start
+
+    def finished(self, result: bool) -> None:
+        """
+        Called in the main thread after run returned. Logs exceptions raised inside the background thread.
+        :param result: return value of run
+        :return: Nothing
+        """
+        if self.__exception is not None:
+            LOGGER.exception(self.__exception)
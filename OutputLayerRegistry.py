@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+from typing import Dict, List
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from qgis.core import QgsMapLayer, QgsProject, QgsVectorLayer
+
+# name of the default output target
+DEFAULT_OUTPUT_NAME = "Parallel Unit Lines"
+
+
+class OutputLayerRegistry(QObject):
+    """
+    Keeps track of the output layers of the plugin. Every named output target is mapped to a layer ID, the mapping is
+    stored as a project entry and therefore saved with the project. Layers are resolved by ID, so hidden, renamed or
+    duplicated layers do not affect the lookup.
+    """
+
+    SCOPE = "ParallelLineConstruction"
+    KEY = "output_layers"
+
+    def __init__(self, project: QgsProject, parent: QObject = None) -> None:
+        """
+        Initialization of the class
+        :param project: project, which stores the output targets
+        :param parent: parent QObject
+        """
+        super().__init__(parent)
+        self.__project = project
+        self.__targets = dict()  # type: Dict[str, str]
+        self.__load()
+
+        # noinspection PyUnresolvedReferences
+        self.__project.layersRemoved.connect(self.__on_layers_removed)
+        # noinspection PyUnresolvedReferences
+        self.__project.readProject.connect(self.__load)
+        # noinspection PyUnresolvedReferences
+        self.__project.cleared.connect(self.__load)
+
+    # signals
+    targets_changed = pyqtSignal(name='targets_changed')
+
+    @property
+    def names(self) -> List[str]:
+        """
+        returns the names of all registered output targets
+        :return: the sorted names of all registered output targets
+        """
+        return sorted(self.__targets.keys())
+
+    #
+    # private functions
+    #
+
+    # noinspection PyUnusedLocal
+    def __load(self, *args: List[object]) -> None:
+        """
+        slot, which reads the output targets from the project
+        :param args: optional arguments to enable the function to work as slot for different signals
+        :return: Nothing
+        """
+        text, ok = self.__project.readEntry(self.SCOPE, self.KEY, "")
+        targets = dict()
+        if ok and text != "":
+            try:
+                targets = json.loads(text)
+            except ValueError:
+                targets = dict()
+        if not isinstance(targets, dict):
+            targets = dict()
+        self.__targets = {str(name): str(layer_id) for name, layer_id in targets.items()}
+        # noinspection PyUnresolvedReferences
+        self.targets_changed.emit()
+
+    def __on_layers_removed(self, layer_ids: List[str]) -> None:
+        """
+        slot, which removes the targets of deleted layers
+        :param layer_ids: IDs of the removed layers
+        :return: Nothing
+        """
+        removed = set(layer_ids)
+        names = [name for name, layer_id in self.__targets.items() if layer_id in removed]
+        if len(names) == 0:
+            return
+        for name in names:
+            del self.__targets[name]
+        self.__save()
+
+    def __save(self) -> None:
+        """
+        Writes the output targets to the project
+        :return: Nothing
+        """
+        self.__project.writeEntry(self.SCOPE, self.KEY, json.dumps(self.__targets, sort_keys=True))
+        # noinspection PyUnresolvedReferences
+        self.targets_changed.emit()
+
+    #
+    # public functions
+    #
+
+    def layer(self, name: str) -> QgsVectorLayer or None:
+        """
+        Returns the output layer of the given target. Projects without registered target are searched once for a
+        vector layer with the target name, which is registered afterwards.
+        :param name: name of the output target
+        :return: the output layer or None, if the target has no layer
+        """
+        layer_id = self.__targets.get(name)
+        if layer_id is not None:
+            layer = self.__project.mapLayer(layer_id)
+            if layer is not None:
+                return layer
+            # the layer was removed without notification, e.g. while the registry was not connected
+            self.unregister(name)
+            return None
+
+        layers = [lyr for lyr in self.__project.mapLayersByName(name) if lyr.type() == QgsMapLayer.VectorLayer]
+        if len(layers) == 0:
+            return None
+        self.register(name, layers[0])
+        return layers[0]
+
+    def register(self, name: str, layer: QgsVectorLayer) -> None:
+        """
+        Registers the layer as output layer of the given target
+        :param name: name of the output target
+        :param layer: output layer
+        :return: Nothing
+        :raises ValueError: if the name is empty
+        """
+        name = str(name).strip()
+        if name == "":
+            raise ValueError("Output target name must not be empty")
+        self.__targets[name] = layer.id()
+        self.__save()
+
+    def unload(self) -> None:
+        """
+        Disconnects the registry from the project signals
+        :return: Nothing
+        """
+        # noinspection PyUnresolvedReferences
+        self.__project.layersRemoved.disconnect(self.__on_layers_removed)
+        # noinspection PyUnresolvedReferences
+        self.__project.readProject.disconnect(self.__load)
+        # noinspection PyUnresolvedReferences
+        self.__project.cleared.disconnect(self.__load)
+
+    def unregister(self, name: str) -> None:
+        """
+        Removes the given output target. The layer itself is not changed.
+        :param name: name of the output target
+        :return: Nothing
+        """
+        if name in self.__targets:
+            del self.__targets[name]
+            self.__save()
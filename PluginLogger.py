@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import traceback
+
+from qgis.core import QgsGeometry, QgsMessageLog
+
+# log levels, the levels from LOG_INFO on are the QgsMessageLog levels (debug messages are logged as info)
+LOG_DEBUG = -1
+LOG_INFO = 0
+LOG_WARNING = 1
+LOG_CRITICAL = 2
+# names of the log levels, in the order of the log level combo box
+LOG_LEVELS = ((LOG_DEBUG, "Debug"), (LOG_INFO, "Info"), (LOG_WARNING, "Warning"), (LOG_CRITICAL, "Critical"))
+
+# tab of the plugin messages in the QGIS log panel
+LOG_TAG = "Parallel Line Construction"
+# maximum number of vertices written by a geometry dump
+DUMP_VERTICES = 20
+
+
+class PluginLogger:
+    """
+    Level gated logger of the plugin. Messages are format strings, which are only formatted with their arguments, if
+    the level is enabled, so disabled levels cost a single comparison. Geometry dumps are disabled by default and
+    only write the first vertices of a geometry.
+    """
+
+    def __init__(self, tag: str = LOG_TAG, level: int = LOG_INFO) -> None:
+        """
+        Initialization of the class
+        :param tag: tab of the messages in the QGIS log panel
+        :param level: minimum level of logged messages
+        """
+        self.__tag = tag
+        self.__level = int(level)
+        self.__dump_geometries = False
+
+    # setter and getter
+    @property
+    def dump_geometries(self) -> bool:
+        """
+        returns, if geometry dumps are logged
+        :return: True, if geometry dumps are logged
+        """
+        return self.__dump_geometries
+
+    @dump_geometries.setter
+    def dump_geometries(self, value: bool) -> None:
+        """
+        Enables or disables the geometry dumps
+        :param value: True to log geometry dumps
+        :return: Nothing
+        """
+        self.__dump_geometries = bool(value)
+
+    @property
+    def level(self) -> int:
+        """
+        returns the minimum level of logged messages
+        :return: the minimum log level
+        """
+        return self.__level
+
+    @level.setter
+    def level(self, value: int) -> None:
+        """
+        Sets the minimum level of logged messages
+        :param value: new minimum log level
+        :return: Nothing
+        :raises ValueError: if the level is unknown
+        """
+        value = int(value)
+        if value not in [level for level, _ in LOG_LEVELS]:
+            raise ValueError("Unknown log level: {}".format(value))
+        self.__level = value
+
+    #
+    # public functions
+    #
+
+    def enabled(self, level: int) -> bool:
+        """
+        Tests, if messages of the given level are logged. Loops, which only create log messages, should be guarded
+        with this function.
+        :param level: log level
+        :return: True, if messages of the level are logged
+        """
+        return level >= self.__level
+
+    def log(self, level: int, message: str, *args: object) -> None:
+        """
+        Logs the message, if the level is enabled
+        :param level: log level
+        :param message: message or format string, which is formatted with the arguments
+        :param args: format arguments
+        :return: Nothing
+        """
+        if level < self.__level:
+            return
+        if len(args) > 0:
+            message = message.format(*args)
+        # noinspection PyTypeChecker,PyCallByClass,PyArgumentList
+        QgsMessageLog.logMessage(message, self.__tag, level=max(level, LOG_INFO))
+
+    def debug(self, message: str, *args: object) -> None:
+        """
+        Logs a debug message, see log
+        :param message: message or format string
+        :param args: format arguments
+        :return: Nothing
+        """
+        self.log(LOG_DEBUG, message, *args)
+
+    def info(self, message: str, *args: object) -> None:
+        """
+        Logs an info message, see log
+        :param message: message or format string
+        :param args: format arguments
+        :return: Nothing
+        """
+        self.log(LOG_INFO, message, *args)
+
+    def warning(self, message: str, *args: object) -> None:
+        """
+        Logs a warning, see log
+        :param message: message or format string
+        :param args: format arguments
+        :return: Nothing
+        """
+        self.log(LOG_WARNING, message, *args)
+
+    def critical(self, message: str, *args: object) -> None:
+        """
+        Logs a critical message, see log
+        :param message: message or format string
+        :param args: format arguments
+        :return: Nothing
+        """
+        self.log(LOG_CRITICAL, message, *args)
+
+    def exception(self, e: Exception) -> None:
+        """
+        Logs the message and the traceback of an exception as critical message
+        :param e: exception
+        :return: Nothing
+        """
+        self.critical("Error Message:\n{}\nTraceback:\n{}", str(e), '\n'.join(traceback.format_tb(e.__traceback__)))
+
+    def geometry(self, geometry: QgsGeometry, message: str, *args: object) -> None:
+        """
+        Logs a debug dump of a geometry, if geometry dumps are enabled. Only the first DUMP_VERTICES vertices are
+        written, the geometry is never serialized completely.
+        :param geometry: geometry to dump
+        :param message: message or format string, which precedes the dump
+        :param args: format arguments
+        :return: Nothing
+        """
+        if not self.__dump_geometries or not self.enabled(LOG_DEBUG):
+            return
+        if len(args) > 0:
+            message = message.format(*args)
+        if geometry.isNull():
+            self.debug("{}: empty geometry", message)
+            return
+
+        count = geometry.constGet().nVertices()
+        vertices = list()
+        for index in range(min(count, DUMP_VERTICES)):
+            vertex = geometry.vertexAt(index)
+            vertices.append("{} {}".format(vertex.x(), vertex.y()))
+        if count > DUMP_VERTICES:
+            vertices.append("... {} more".format(count - DUMP_VERTICES))
+        self.debug("{}: {} with {} vertices ({})", message, geometry.constGet().geometryType(), count,
+                   ", ".join(vertices))
+
+
+# logger shared by all modules of the plugin
+LOGGER = PluginLogger()
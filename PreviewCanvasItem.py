@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import List
+
+import numpy as np
+from PyQt5.QtCore import QPointF, Qt
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygonF
+from qgis.core import QgsGeometry, QgsRectangle
+from qgis.gui import QgsMapCanvas, QgsMapCanvasItem
+
+from .OffsetEngine import geometry_to_arrays
+
+
+class PreviewCanvasItem(QgsMapCanvasItem):
+    """
+    Canvas item, which draws all preview lines of a construction in one paint pass. The lines are stored as packed
+    coordinate arrays with one colour per unit, updating the preview never allocates new canvas items.
+    """
+
+    def __init__(self, canvas: QgsMapCanvas, width: int = 2) -> None:
+        """
+        Initialization of the class
+        :param canvas: map canvas, on which the preview is drawn
+        :param width: pen width of the preview lines in pixels
+        """
+        super().__init__(canvas)
+        self.__canvas = canvas
+        self.__width = width
+        self.__coords = np.empty((0, 2), dtype=float)
+        self.__part_offsets = np.zeros(1, dtype=np.int64)
+        self.__part_units = np.empty(0, dtype=np.int64)
+        self.__colors = np.empty(0, dtype=np.uint32)
+        self.__extent = QgsRectangle()
+        self.setZValue(100)
+
+    def __len__(self) -> int:
+        """
+        returns the number of stored units
+        :return: the number of stored units
+        """
+        return len(self.__colors)
+
+    #
+    # private functions
+    #
+
+    def __padded_extent(self) -> QgsRectangle:
+        """
+        Returns the extent of all stored lines, enlarged by the pen width at the current map scale
+        :return: the padded extent of all stored lines
+        """
+        padding = self.__width * self.__canvas.mapUnitsPerPixel()
+        extent = QgsRectangle(self.__extent)
+        extent.setXMinimum(extent.xMinimum() - padding)
+        extent.setYMinimum(extent.yMinimum() - padding)
+        extent.setXMaximum(extent.xMaximum() + padding)
+        extent.setYMaximum(extent.yMaximum() + padding)
+        return extent
+
+    #
+    # public functions
+    #
+
+    def clear(self) -> None:
+        """
+        Removes all lines from the buffers and repaints the item
+        :return: Nothing
+        """
+        self.set_lines(list(), list())
+
+    def set_lines(self, geometries: List[QgsGeometry], colors: List[QColor]) -> None:
+        """
+        Replaces the stored lines with the given geometries. Only the coordinate buffers are updated.
+        :param geometries: list of line geometries, one per unit
+        :param colors: list of colours, one per unit
+        :return: Nothing
+        :raises ValueError: if the number of geometries and colours differs
+        """
+        if len(geometries) != len(colors):
+            raise ValueError("Number of geometries and colours differs")
+
+        parts = list()
+        units = list()
+        for unit, geometry in enumerate(geometries):
+            for part in geometry_to_arrays(geometry):
+                if len(part) > 1:
+                    parts.append(part)
+                    units.append(unit)
+
+        self.__colors = np.array([color.rgba() for color in colors], dtype=np.uint32)
+        self.__part_units = np.array(units, dtype=np.int64)
+        self.__part_offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        if len(parts) > 0:
+            self.__part_offsets[1:] = np.cumsum([len(part) for part in parts])
+            self.__coords = np.concatenate(parts)
+            minimum = self.__coords.min(axis=0)
+            maximum = self.__coords.max(axis=0)
+            self.__extent = QgsRectangle(minimum[0], minimum[1], maximum[0], maximum[1])
+        else:
+            self.__coords = np.empty((0, 2), dtype=float)
+            self.__extent = QgsRectangle()
+
+        self.setRect(self.__padded_extent())
+        self.update()
+
+    def paint(self, painter: QPainter, option: object = None, widget: object = None) -> None:
+        """
+        Draws all stored lines in one pass. The map to pixel transformation is applied to the whole coordinate
+        buffer at once.
+        :param painter: QPainter for the drawing
+        :param option: unused style option
+        :param widget: unused widget
+        :return: Nothing
+        """
+        if len(self.__coords) == 0:
+            return
+
+        # derive the affine map to pixel transformation around the extent center to preserve precision
+        map_to_pixel = self.__canvas.getCoordinateTransform()
+        center = self.__extent.center()
+        origin = map_to_pixel.transform(center.x(), center.y())
+        x_axis = map_to_pixel.transform(center.x() + 1, center.y())
+        y_axis = map_to_pixel.transform(center.x(), center.y() + 1)
+        matrix = np.array(((x_axis.x() - origin.x(), x_axis.y() - origin.y()),
+                           (y_axis.x() - origin.x(), y_axis.y() - origin.y())))
+        position = self.pos()
+        translation = np.array((origin.x() - position.x(), origin.y() - position.y()))
+        pixels = (self.__coords - (center.x(), center.y())) @ matrix + translation
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        pens = [QPen(QColor.fromRgba(int(rgba)), self.__width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+                for rgba in self.__colors]
+        for part, unit in enumerate(self.__part_units):
+            start, end = self.__part_offsets[part], self.__part_offsets[part + 1]
+            polygon = QPolygonF()
+            polygon.fill(QPointF(), int(end - start))
+            buffer = polygon.data()
+            buffer.setsize(int(end - start) * 2 * 8)
+            np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)[:] = pixels[start:end]
+            painter.setPen(pens[unit])
+            painter.drawPolyline(polygon)
+        painter.restore()
+
+    def updatePosition(self) -> None:
+        """
+        Updates the position of the item after map extent changes. Derived function.
+        :return: Nothing
+        """
+        self.setRect(self.__padded_extent())
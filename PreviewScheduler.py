@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import List
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class PreviewScheduler(QObject):
+    """
+    Coalesces invalidation requests. All requests arriving inside the configured window are merged into a single
+    emission of the triggered signal, which is delivered by the event loop.
+    """
+
+    def __init__(self, interval: int = 30, parent: QObject = None) -> None:
+        """
+        Initialization of the class
+        :param interval: merge window in milliseconds
+        :param parent: parent QObject
+        """
+        super().__init__(parent)
+        self.__pending = False
+        self.__requests = 0
+        self.__runs = 0
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(max(int(interval), 0))
+        # noinspection PyUnresolvedReferences
+        self.__timer.timeout.connect(self.__run)
+
+    # signals
+    triggered = pyqtSignal(name='triggered')
+
+    # setter and getter
+    @property
+    def interval(self) -> int:
+        """
+        returns the merge window in milliseconds
+        :return: the merge window in milliseconds
+        """
+        return self.__timer.interval()
+
+    @interval.setter
+    def interval(self, value: int) -> None:
+        """
+        Sets the merge window in milliseconds
+        :param value: new merge window in milliseconds
+        :return: Nothing
+        :raises ValueError: if value is negative
+        """
+        value = int(value)
+        if value < 0:
+            raise ValueError("Interval must not be negative")
+        self.__timer.setInterval(value)
+
+    @property
+    def pending(self) -> bool:
+        """
+        returns, if a run is scheduled
+        :return: True, if a run is scheduled, else False
+        """
+        return self.__pending
+
+    @property
+    def requests(self) -> int:
+        """
+        returns the number of received requests
+        :return: the number of received requests
+        """
+        return self.__requests
+
+    @property
+    def runs(self) -> int:
+        """
+        returns the number of emitted triggered signals
+        :return: the number of emitted triggered signals
+        """
+        return self.__runs
+
+    #
+    # private functions
+    #
+
+    def __run(self) -> None:
+        """
+        Emits the triggered signal, if a request is still pending
+        :return: Nothing
+        """
+        if not self.__pending:
+            return
+        self.__pending = False
+        self.__runs += 1
+        # noinspection PyUnresolvedReferences
+        self.triggered.emit()
+
+    #
+    # public functions
+    #
+
+    # noinspection PyUnusedLocal
+    def request(self, *args: List[object]) -> None:
+        """
+        slot, which schedules a run. The timer is not restarted by further requests, so continuous invalidations
+        are still processed once per window.
+        :param args: optional arguments to enable the function to work as slot for different signals
+        :return: Nothing
+        """
+        self.__requests += 1
+        self.__pending = True
+        if not self.__timer.isActive():
+            self.__timer.start()
+
+    def cancel(self) -> None:
+        """
+        Drops a pending run
+        :return: Nothing
+        """
+        self.__pending = False
+        self.__timer.stop()
+
+    def flush(self) -> None:
+        """
+        Runs a pending request immediately
+        :return: Nothing
+        """
+        self.__timer.stop()
+        self.__run()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from typing import Any, Dict
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QVariant
+from PyQt5.QtGui import QIcon
+from qgis.core import QgsField, QgsFields, QgsProcessing, \
+    QgsProcessingAlgorithm, QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback, \
+    QgsProcessingParameterBoolean, QgsProcessingParameterEnum, QgsProcessingParameterFeatureSink, \
+    QgsProcessingParameterFeatureSource, QgsProcessingParameterFile, QgsProcessingProvider, QgsCsException, \
+    QgsWkbTypes
+
+from .CrsTransforms import CrsTransforms, transform_arrays, transform_geometries
+from .FeatureWriter import FeatureWriter
+from .HorizonConstruct import UnitConstructionModel, read_unit_table
+from .OffsetEngine import DEFAULT_SEGMENTS, MultiPartOffsetEngine, geometry_to_arrays
+
+
+class ParallelLineConstructionAlgorithm(QgsProcessingAlgorithm):
+    """
+    Processing algorithm, which constructs a unit table along every feature of a line layer
+    """
+
+    INPUT = "INPUT"
+    UNIT_TABLE = "UNIT_TABLE"
+    SIDE = "SIDE"
+    JOIN_STYLE = "JOIN_STYLE"
+    MULTIPART = "MULTIPART"
+    OUTPUT = "OUTPUT"
+
+    # number of features written with one addFeatures call
+    CHUNK_SIZE = 1000
+
+    # noinspection PyMethodMayBeStatic
+    def tr(self, message: str) -> str:
+        """
+        Get the translation for a string using Qt translation API.
+        :param message: String for translation.
+        :return: Translated version of message.
+        """
+        # noinspection PyTypeChecker,PyArgumentList,PyCallByClass
+        return QCoreApplication.translate('ParallelLineConstruction', message)
+
+    def createInstance(self) -> QgsProcessingAlgorithm:
+        """
+        returns a new instance of the algorithm. Derived function.
+        :return: a new instance of the algorithm
+        """
+        return ParallelLineConstructionAlgorithm()
+
+    def name(self) -> str:
+        """
+        returns the unique algorithm name. Derived function.
+        :return: the unique algorithm name
+        """
+        return "parallellineconstruction"
+
+    def displayName(self) -> str:
+        """
+        returns the translated algorithm name. Derived function.
+        :return: the translated algorithm name
+        """
+        return self.tr("Construct parallel unit lines")
+
+    def shortHelpString(self) -> str:
+        """
+        returns the help text of the algorithm. Derived function.
+        :return: the help text of the algorithm
+        """
+        return self.tr("Constructs the units of a unit table as parallel lines along every feature of the input "
+                       "layer. The unit table is a JSON file as written by the \"Save unit table\" button of the "
+                       "plugin. The side has the same meaning as the side clicked on the map: the base unit and the "
+                       "units below it are constructed on this side, the units above it on the opposite side. "
+                       "Lines in a geographic reference system are constructed in the WGS 84 / UTM zone of the "
+                       "layer center, so the distances are always applied in meters.")
+
+    def initAlgorithm(self, config: Dict[str, Any] = None) -> None:
+        """
+        Defines the inputs and outputs of the algorithm. Derived function.
+        :param config: optional configuration
+        :return: Nothing
+        """
+        # noinspection PyArgumentList
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, self.tr("Input line layer"),
+                                                              [QgsProcessing.TypeVectorLine]))
+        # noinspection PyArgumentList
+        self.addParameter(QgsProcessingParameterFile(self.UNIT_TABLE, self.tr("Unit table (JSON)"),
+                                                     extension="json"))
+        # noinspection PyArgumentList
+        self.addParameter(QgsProcessingParameterEnum(self.SIDE, self.tr("Construction side"),
+                                                     [self.tr("Left of the line direction"),
+                                                      self.tr("Right of the line direction")], defaultValue=0))
+        # noinspection PyArgumentList
+        self.addParameter(QgsProcessingParameterEnum(self.JOIN_STYLE, self.tr("Line join style"),
+                                                     [self.tr("Use rounded joins"), self.tr("Use mitered joins"),
+                                                      self.tr("Use beveled joins")], defaultValue=1))
+        # noinspection PyArgumentList
+        self.addParameter(QgsProcessingParameterBoolean(self.MULTIPART,
+                                                        self.tr("Create multipart features for multipart lines"),
+                                                        defaultValue=False))
+        # noinspection PyArgumentList
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Parallel Unit Lines"),
+                                                            QgsProcessing.TypeVectorLine))
+
+    def processAlgorithm(self, parameters: Dict[str, Any], context: QgsProcessingContext,
+                         feedback: QgsProcessingFeedback) -> Dict[str, Any]:
+        """
+        Constructs the unit lines for every input feature and streams them into the sink. Derived function.
+        :param parameters: algorithm parameters
+        :param context: processing context
+        :param feedback: feedback object for progress reports and cancellation
+        :return: dictionary with the output layer
+        :raises QgsProcessingException: if the input or the unit table are invalid
+        """
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+
+        path = self.parameterAsFile(parameters, self.UNIT_TABLE, context)
+        try:
+            model = UnitConstructionModel(read_unit_table(path))
+        except Exception as e:
+            raise QgsProcessingException(self.tr("Cannot read the unit table: {}").format(str(e)))
+
+        side = 1 if self.parameterAsEnum(parameters, self.SIDE, context) == 0 else -1
+        join_style = self.parameterAsEnum(parameters, self.JOIN_STYLE, context) + 1
+        multipart = self.parameterAsBool(parameters, self.MULTIPART, context)
+
+        # the unit table prefix sums are shared by all features
+        rows, offsets, _ = model.unit_columns(side)
+        unit_names = model.names
+        names = [unit_names[row] for row in rows]
+        distances = offsets.astype(float).tolist()
+
+        fields = QgsFields()
+        # noinspection PyArgumentList
+        fields.append(QgsField("name", QVariant.String, len=255))
+        wkb_type = QgsWkbTypes.MultiLineString if multipart else QgsWkbTypes.LineString
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, fields, wkb_type,
+                                             source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        if len(rows) == 0:
+            feedback.pushInfo(self.tr("The unit table contains no unit to construct."))
+            return {self.OUTPUT: dest_id}
+
+        # the offsets are computed in a projected working reference system, which is selected for the whole layer
+        transforms = CrsTransforms(context.transformContext())
+        extent = source.sourceExtent()
+        corners = [np.array([[extent.xMinimum(), extent.yMinimum()], [extent.xMaximum(), extent.yMaximum()]])]
+        working_crs = transforms.working_crs(source.sourceCrs(), corners)
+        to_working = transforms.get(source.sourceCrs(), working_crs)
+        to_source = transforms.get(working_crs, source.sourceCrs())
+
+        total = 100.0 / source.featureCount() if source.featureCount() > 0 else 0
+        writer = FeatureWriter(sink, fields, 0, multipart, multipart, self.CHUNK_SIZE)
+        skipped = 0
+        empty = 0
+        for current, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+
+            try:
+                parts = transform_arrays(geometry_to_arrays(feature.geometry()), to_working)
+                engine = MultiPartOffsetEngine(parts, join_style, DEFAULT_SEGMENTS)
+                geometries = transform_geometries(engine.geometries(distances), to_source)
+            except (ValueError, QgsCsException):
+                skipped += 1
+                continue
+
+            lines = [(name, geometry) for name, geometry in zip(names, geometries)
+                     if geometry is not None and not geometry.isEmpty()]
+            empty += len(geometries) - len(lines)
+            writer.add(lines)
+            feedback.setProgress(int((current + 1) * total))
+
+        writer.flush()
+        feedback.pushInfo(self.tr("{} features written ({:.0f} features/s)").format(writer.count,
+                                                                                   writer.features_per_second))
+        if skipped > 0:
+            feedback.reportError(self.tr("{} features skipped (no part with at least two distinct vertices or not "
+                                         "transformable)")
+                                 .format(skipped))
+        if empty > 0:
+            feedback.reportError(self.tr("{} unit lines not written (no valid offset line remains)").format(empty))
+
+        return {self.OUTPUT: dest_id}
+
+
+class ParallelLineConstructionProvider(QgsProcessingProvider):
+    """
+    Processing provider of the plugin
+    """
+
+    def loadAlgorithms(self) -> None:
+        """
+        Adds the algorithms of the provider. Derived function.
+        :return: Nothing
+        """
+        self.addAlgorithm(ParallelLineConstructionAlgorithm())
+
+    def id(self) -> str:
+        """
+        returns the unique provider id. Derived function.
+        :return: the unique provider id
+        """
+        return "parallellineconstruction"
+
+    def name(self) -> str:
+        """
+        returns the provider name. Derived function.
+        :return: the provider name
+        """
+        return "Parallel Line Construction"
+
+    def icon(self) -> QIcon:
+        """
+        returns the provider icon. Derived function.
+        :return: the provider icon
+        """
+        return QIcon(':/plugins/parallel_line_construction/icon.png')
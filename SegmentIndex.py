@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+
+def _segments(parts: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Collects the segments of all parts. Zero length segments are removed.
+    :param parts: list of (n x 2) coordinate arrays
+    :return: tuple of start points, end points, index of the previous and of the next segment (-1 if none)
+    """
+    starts = list()
+    ends = list()
+    for part in parts:
+        part = np.asarray(part, dtype=float).reshape(-1, 2)
+        if len(part) < 2:
+            continue
+        keep = np.ones(len(part), dtype=bool)
+        keep[1:] = np.any(part[1:] != part[:-1], axis=1)
+        part = part[keep]
+        if len(part) < 2:
+            continue
+        starts.append(part[:-1])
+        ends.append(part[1:])
+
+    if len(starts) == 0:
+        raise ValueError("No part has at least two distinct vertices")
+
+    lengths = np.array([len(start) for start in starts])
+    offsets = np.cumsum(lengths) - lengths
+    count = int(lengths.sum())
+    previous = np.arange(count) - 1
+    following = np.arange(count) + 1
+    previous[offsets] = -1
+    following[offsets + lengths - 1] = -1
+
+    # closed parts: the first and the last segment are connected
+    for offset, length, start, end in zip(offsets, lengths, starts, ends):
+        if length > 2 and np.all(start[0] == end[-1]):
+            previous[offset] = offset + length - 1
+            following[offset + length - 1] = offset
+
+    return np.concatenate(starts), np.concatenate(ends), previous, following
+
+
+def grid_cover(first: np.ndarray, last: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Expands every segment to all grid cells covered by its bounding box
+    :param first: (n x 2) array with the index of the lower left cell of every segment
+    :param last: (n x 2) array with the index of the upper right cell of every segment
+    :param width: number of grid cells in x direction
+    :return: tuple of segment indices and cell indices, one entry per covered cell
+    """
+    spans = last - first + 1
+    counts = spans[:, 0] * spans[:, 1]
+    segment = np.repeat(np.arange(len(first)), counts)
+    local = np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = first[segment, 0] + local % spans[segment, 0]
+    cell_y = first[segment, 1] + local // spans[segment, 0]
+    return segment, cell_y * width + cell_x
+
+
+def decimation_error(part: np.ndarray, step: int) -> float:
+    """
+    Calculates the largest distance between the vertices of a line and the line, which keeps only every step-th
+    vertex (and the last one). This is also the Hausdorff distance between both lines.
+    :param part: (n x 2) coordinate array
+    :param step: decimation step
+    :return: the largest distance
+    """
+    count = len(part)
+    kept = np.append(np.arange(0, count - 1, step), count - 1)
+    chord = np.minimum(np.arange(count) // step, len(kept) - 2)
+    a = part[kept[chord]]
+    vectors = part[kept[chord + 1]] - a
+    relative = part - a
+    squared = np.sum(vectors * vectors, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(squared > 0, np.sum(relative * vectors, axis=1) / squared, 0.0)
+    nearest = relative - vectors * np.clip(t, 0.0, 1.0)[:, np.newaxis]
+    return float(np.max(np.hypot(nearest[:, 0], nearest[:, 1])))
+
+
+def _nearest(starts: np.ndarray, ends: np.ndarray, previous: np.ndarray, following: np.ndarray,
+             candidates: np.ndarray, x: float, y: float) -> Tuple[float, int]:
+    """
+    Finds the nearest of the candidate segments and returns the distance and the side of the point
+    :param starts: start points of all segments
+    :param ends: end points of all segments
+    :param previous: index of the previous segment of every segment
+    :param following: index of the next segment of every segment
+    :param candidates: indices of the candidate segments
+    :param x: x coordinate of the point
+    :param y: y coordinate of the point
+    :return: tuple of the distance to the nearest segment and the side (1: left, -1: right)
+    """
+    a = starts[candidates]
+    vectors = ends[candidates] - a
+    relative = np.array((x, y)) - a
+    t = np.clip(np.sum(relative * vectors, axis=1) / np.sum(vectors * vectors, axis=1), 0.0, 1.0)
+    nearest = relative - vectors * t[:, np.newaxis]
+    distances = np.hypot(nearest[:, 0], nearest[:, 1])
+
+    best = int(np.argmin(distances))
+    segment = int(candidates[best])
+    vector = vectors[best]
+    normal = np.array((-vector[1], vector[0])) / math.hypot(vector[0], vector[1])
+
+    # if the nearest point is a shared vertex, the side is decided by the bisector of both segment normals
+    neighbour = -1
+    if t[best] == 0.0:
+        neighbour = previous[segment]
+    elif t[best] == 1.0:
+        neighbour = following[segment]
+    if neighbour != -1:
+        other = ends[neighbour] - starts[neighbour]
+        normal = normal + np.array((-other[1], other[0])) / math.hypot(other[0], other[1])
+
+    side = np.sign(np.dot(relative[best] - vector * t[best], normal))
+    return float(distances[best]), int(side) if side != 0 else 1
+
+
+def nearest_side(parts: Sequence[np.ndarray], x: float, y: float) -> int:
+    """
+    Calculates the side of a point relative to the nearest segment of the line without building an index.
+    Use SegmentIndex for repeated queries on the same line.
+    :param parts: list of (n x 2) coordinate arrays
+    :param x: x coordinate of the point
+    :param y: y coordinate of the point
+    :return: 1, if the point is left of the nearest segment, else -1
+    """
+    starts, ends, previous, following = _segments(parts)
+    return _nearest(starts, ends, previous, following, np.arange(len(starts)), x, y)[1]
+
+
+class SegmentIndex:
+    """
+    Uniform grid index over the segments of a (multi part) line. The segment arrays are computed once, queries for
+    the nearest segment only examine the grid cells around the query point. Distance tests with a tolerance use a
+    coarse index of the decimated line first.
+    """
+
+    def __init__(self, parts: Sequence[np.ndarray], segments_per_cell: float = 2.0) -> None:
+        """
+        Initialization of the class
+        :param parts: list of (n x 2) coordinate arrays
+        :param segments_per_cell: average number of segments per grid cell
+        :raises ValueError: if no part has at least two distinct vertices
+        """
+        self.__parts = [np.asarray(part, dtype=float).reshape(-1, 2) for part in parts]
+        self.__parts = [part for part in self.__parts if len(part) > 1]
+        self.__levels = dict()  # type: Dict[int, Tuple[SegmentIndex or None, float]]
+        self.__starts, self.__ends, self.__previous, self.__following = _segments(self.__parts)
+        count = len(self.__starts)
+        vectors = self.__ends - self.__starts
+        self.__start_x = self.__starts[:, 0].copy()
+        self.__start_y = self.__starts[:, 1].copy()
+        self.__vector_x = vectors[:, 0].copy()
+        self.__vector_y = vectors[:, 1].copy()
+        self.__inverse_squared = 1 / np.sum(vectors * vectors, axis=1)
+
+        lower = np.minimum(self.__starts, self.__ends)
+        upper = np.maximum(self.__starts, self.__ends)
+        self.__origin = lower.min(axis=0)
+        extent = upper.max(axis=0) - self.__origin
+
+        # the cell size is at least the median segment extent, so most segments cover only a few cells
+        cells = max(count / max(segments_per_cell, 1e-6), 1.0)
+        size = math.sqrt(max(extent[0], 1e-12) * max(extent[1], 1e-12) / cells)
+        size = max(size, float(np.median(np.max(upper - lower, axis=1))), float(extent.max()) / 4096, 1e-12)
+        self.__cell_size = size
+        self.__shape = (np.floor(extent / size).astype(np.int64) + 1)
+
+        first = np.floor((lower - self.__origin) / size).astype(np.int64)
+        last = np.floor((upper - self.__origin) / size).astype(np.int64)
+        segment, cell = grid_cover(first, last, int(self.__shape[0]))
+
+        order = np.argsort(cell, kind='stable')
+        self.__cell_segments = segment[order]
+        self.__cell_start = np.searchsorted(cell[order], np.arange(self.__shape[0] * self.__shape[1] + 1))
+
+    def __len__(self) -> int:
+        """
+        returns the number of indexed segments
+        :return: the number of indexed segments
+        """
+        return len(self.__starts)
+
+    #
+    # private functions
+    #
+
+    def __level(self, tolerance: float) -> Tuple['SegmentIndex', float]:
+        """
+        Returns the coarsest decimated index, which deviates less than the tolerance from the line. Every second,
+        fourth, eighth... vertex is kept, the levels are created on first use.
+        :param tolerance: maximum deviation
+        :return: tuple of the index (self, if no decimation is possible) and its deviation
+        """
+        best = (self, 0.0)
+        step = 2
+        longest = max(len(part) for part in self.__parts)
+        while step < longest:
+            level = self.__levels.get(step)
+            if level is None:
+                level = (None, max(decimation_error(part, step) for part in self.__parts))
+            if level[1] >= tolerance:
+                self.__levels[step] = level
+                break
+            if level[0] is None:
+                parts = [np.append(part[:-1:step], part[-1:], axis=0) for part in self.__parts]
+                level = (SegmentIndex(parts), level[1])
+            self.__levels[step] = level
+            best = level
+            step *= 2
+        return best
+
+    def __distances(self, points: np.ndarray, limit: float, max_cells: int) -> np.ndarray:
+        """
+        Calculates the distance of many points to the nearest segment within the limit. Only the segments of the grid
+        cells within the limit are examined.
+        :param points: (m x 2) array of points
+        :param limit: distance limit
+        :param max_cells: maximum number of grid cells examined in one array operation
+        :return: array with the distance of every point, infinite for points without a segment within the limit
+        """
+        result = np.full(len(points), np.inf)
+        if len(points) == 0:
+            return result
+
+        radius = int(math.ceil(limit / self.__cell_size))
+        offsets = np.arange(-radius, radius + 1)
+        window = len(offsets) * len(offsets)
+        block = max(max_cells // window, 1)
+        for start in range(0, len(points), block):
+            chunk = points[start:start + block]
+            cell = np.floor((chunk - self.__origin) / self.__cell_size).astype(np.int64)
+            xs = (cell[:, 0, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]).repeat(len(offsets), 1)
+            ys = (cell[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]).repeat(len(offsets), 2)
+            owner = np.repeat(np.arange(len(chunk)), window)
+            xs = xs.reshape(-1)
+            ys = ys.reshape(-1)
+            valid = (xs >= 0) & (xs < self.__shape[0]) & (ys >= 0) & (ys < self.__shape[1])
+            cells = ys[valid] * self.__shape[0] + xs[valid]
+            owner = owner[valid]
+
+            # gather the segments of all cells
+            first = self.__cell_start[cells]
+            counts = self.__cell_start[cells + 1] - first
+            owner = np.repeat(owner, counts)
+            if len(owner) == 0:
+                continue
+            local = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+            segment = self.__cell_segments[np.repeat(first, counts) + local]
+
+            # squared distances with separate coordinate arrays, the square root is only taken of the minima
+            x = chunk[owner, 0] - self.__start_x[segment]
+            y = chunk[owner, 1] - self.__start_y[segment]
+            vector_x = self.__vector_x[segment]
+            vector_y = self.__vector_y[segment]
+            t = np.clip((x * vector_x + y * vector_y) * self.__inverse_squared[segment], 0.0, 1.0)
+            x -= vector_x * t
+            y -= vector_y * t
+            squared = x * x + y * y
+
+            # the owners are sorted, so the minimum of every point is reduced over its run of candidates
+            runs = np.flatnonzero(np.concatenate(([True], owner[1:] != owner[:-1])))
+            result[start + owner[runs]] = np.minimum.reduceat(squared, runs)
+        result = np.sqrt(result)
+        result[result >= limit] = np.inf
+        return result
+
+    def __ring(self, center_x: int, center_y: int, radius: int) -> np.ndarray:
+        """
+        Returns the segments of all cells on the ring with the given Chebyshev radius around the center cell
+        :param center_x: x index of the center cell
+        :param center_y: y index of the center cell
+        :param radius: ring radius in cells
+        :return: array of segment indices, may contain duplicates
+        """
+        if radius == 0:
+            xs = np.array([center_x])
+            ys = np.array([center_y])
+        else:
+            side = np.arange(-radius, radius + 1)
+            inner = np.arange(-radius + 1, radius)
+            xs = center_x + np.concatenate((side, side, np.full(len(inner), -radius), np.full(len(inner), radius)))
+            ys = center_y + np.concatenate((np.full(len(side), -radius), np.full(len(side), radius), inner, inner))
+
+        valid = (xs >= 0) & (xs < self.__shape[0]) & (ys >= 0) & (ys < self.__shape[1])
+        cells = ys[valid] * self.__shape[0] + xs[valid]
+        if len(cells) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.__cell_segments[self.__cell_start[c]:self.__cell_start[c + 1]] for c in cells])
+
+    #
+    # public functions
+    #
+
+    def closer_than(self, points: np.ndarray, limit: float, tolerance: float = 0.0,
+                    max_cells: int = 1000000) -> np.ndarray:
+        """
+        Tests for many points at once, if any segment is closer to the point than the limit. Only the segments of the
+        grid cells within the limit are examined.
+        With a tolerance, the points are tested against a decimated line first. Only the points, whose distance to the
+        decimated line is within its deviation from the limit, are tested against the exact segments. The result is
+        exact in both cases.
+        :param points: (m x 2) array of points
+        :param limit: distance limit
+        :param tolerance: maximum deviation of the decimated line, 0 for the exact test only
+        :param max_cells: maximum number of grid cells examined in one array operation
+        :return: boolean array, True for points closer to the line than the limit
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) == 0 or limit <= 0:
+            return np.zeros(len(points), dtype=bool)
+
+        if tolerance > 0:
+            coarse, error = self.__level(tolerance)
+            if coarse is not self:
+                distances = coarse.__distances(points, limit + error, max_cells)
+                result = distances < limit - error
+                undecided = np.flatnonzero(~result & (distances < limit + error))
+                result[undecided] = self.__distances(points[undecided], limit, max_cells) < limit
+                return result
+        return self.__distances(points, limit, max_cells) < limit
+
+    def nearest(self, x: float, y: float) -> Tuple[float, int]:
+        """
+        Finds the nearest segment of the point
+        :param x: x coordinate of the point
+        :param y: y coordinate of the point
+        :return: tuple of the distance to the nearest segment and the side of the point (1: left, -1: right)
+        """
+        cell = np.floor((np.array((x, y)) - self.__origin) / self.__cell_size).astype(np.int64)
+
+        # rings before the grid are empty, start at the first ring touching the grid
+        outside = np.maximum(np.maximum(-cell, cell - (self.__shape - 1)), 0)
+        radius = int(outside.max())
+        max_radius = int(max(abs(cell[0]), abs(cell[1]), abs(cell[0] - self.__shape[0] + 1),
+                             abs(cell[1] - self.__shape[1] + 1)))
+
+        best = None
+        while radius <= max_radius:
+            ring = self.__ring(int(cell[0]), int(cell[1]), radius)
+            if len(ring) > 0:
+                result = _nearest(self.__starts, self.__ends, self.__previous, self.__following, np.unique(ring), x, y)
+                if best is None or result[0] < best[0]:
+                    best = result
+            # all segments on later rings are at least radius cells away
+            if best is not None and best[0] <= radius * self.__cell_size:
+                return best
+            radius += 1
+
+        return best
+
+    def side(self, x: float, y: float) -> int:
+        """
+        Calculates the side of the point relative to the nearest segment
+        :param x: x coordinate of the point
+        :param y: y coordinate of the point
+        :return: 1, if the point is left of the nearest segment, else -1
+        """
+        return self.nearest(x, y)[1]
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import datetime
+import json
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List
+
+import numpy as np
+
+# number of most recent spans per stage, which are aggregated into the percentiles
+ROLLING_WINDOW = 200
+# percentiles reported for every stage
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimer:
+    """
+    Collects the durations of named construction stages. The most recent spans of every stage are kept in a rolling
+    window and aggregated into percentiles on request, so recording a span only appends a number.
+    All spans have to be recorded from the main thread, background tasks report their elapsed time after they
+    finished.
+    """
+
+    def __init__(self, window: int = ROLLING_WINDOW) -> None:
+        """
+        Initialization of the class
+        :param window: number of most recent spans per stage used for the percentiles
+        """
+        self.__window = max(int(window), 1)
+        self.__spans = OrderedDict()  # type: Dict[str, Deque[float]]
+        self.__counts = dict()  # type: Dict[str, int]
+        self.__revision = 0
+
+    # setter and getter
+    @property
+    def revision(self) -> int:
+        """
+        returns a counter, which changes with every recorded span, so views only refresh after changes
+        :return: the revision counter
+        """
+        return self.__revision
+
+    @property
+    def stages(self) -> List[str]:
+        """
+        returns the names of all recorded stages in the order of their first span
+        :return: list of stage names
+        """
+        return list(self.__spans.keys())
+
+    @property
+    def window(self) -> int:
+        """
+        returns the number of most recent spans per stage used for the percentiles
+        :return: the rolling window size
+        """
+        return self.__window
+
+    #
+    # public functions
+    #
+
+    def clear(self) -> None:
+        """
+        Removes all recorded spans
+        :return: Nothing
+        """
+        self.__spans.clear()
+        self.__counts.clear()
+        self.__revision += 1
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Records the duration of a stage
+        :param stage: name of the stage
+        :param seconds: duration in seconds
+        :return: Nothing
+        """
+        spans = self.__spans.get(stage)
+        if spans is None:
+            spans = deque(maxlen=self.__window)
+            self.__spans[stage] = spans
+            self.__counts[stage] = 0
+        spans.append(float(seconds))
+        self.__counts[stage] += 1
+        self.__revision += 1
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """
+        Context manager, which records the duration of the enclosed block as span of the stage. The span is recorded
+        even if the block raises an exception.
+        :param stage: name of the stage
+        :return: Nothing
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Aggregates the rolling window of every stage. All durations are returned in milliseconds.
+        :return: dictionary by stage name with the total number of spans ("count"), the last duration ("last_ms"),
+        the percentiles ("p50_ms", "p90_ms", "p99_ms") and the maximum ("max_ms") of the rolling window
+        """
+        result = OrderedDict()
+        for stage, spans in self.__spans.items():
+            values = np.array(spans) * 1000.0
+            entry = OrderedDict([("count", self.__counts[stage]), ("last_ms", float(values[-1]))])
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                entry["p{}_ms".format(percentile)] = float(value)
+            entry["max_ms"] = float(values.max())
+            result[stage] = entry
+        return result
+
+    def to_json(self) -> str:
+        """
+        Exports the summary of all stages as JSON document
+        :return: the JSON document
+        """
+        document = OrderedDict([("created", datetime.datetime.now().isoformat()), ("window", self.__window),
+                                ("stages", self.summary())])
+        return json.dumps(document, indent=2, separators=(',', ': '))
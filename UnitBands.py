@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import struct
+from typing import List, Sequence
+
+import numpy as np
+from qgis.core import QgsGeometry
+
+from .OffsetEngine import geometry_to_arrays
+
+# relative tolerance used to match the lower boundary distance of a unit with the distance of a constructed line
+DISTANCE_TOLERANCE = 1e-9
+
+
+def _is_ring(coords: np.ndarray) -> bool:
+    """
+    Tests, if the coordinate array is a closed ring
+    :param coords: (n x 2) coordinate array
+    :return: True, if the array has at least four vertices and the first and last vertex are equal
+    """
+    return len(coords) > 3 and bool(np.all(coords[0] == coords[-1]))
+
+
+def _signed_area(ring: np.ndarray) -> float:
+    """
+    Calculates the signed area of a closed ring (positive for counter clockwise rings)
+    :param ring: (n x 2) coordinate array of the ring
+    :return: the signed area
+    """
+    x = ring[:, 0]
+    y = ring[:, 1]
+    return float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2
+
+
+def _stitch(lower: np.ndarray, upper: np.ndarray) -> List[np.ndarray] or None:
+    """
+    Stitches the polygon between two offset lines of the same base line part. Open lines are joined at both ends to
+    one ring, closed lines become the exterior ring and the hole of the polygon.
+    :param lower: (n x 2) coordinate array of the lower boundary
+    :param upper: (m x 2) coordinate array of the upper boundary
+    :return: list of polygon rings (exterior first) or None, if no polygon can be created
+    """
+    if len(lower) < 2 or len(upper) < 2:
+        return None
+
+    if _is_ring(lower) and _is_ring(upper):
+        rings = sorted((lower, upper), key=lambda ring: abs(_signed_area(ring)), reverse=True)
+        # exterior rings are counter clockwise, holes clockwise
+        return [ring if (_signed_area(ring) > 0) == (index == 0) else ring[::-1] for index, ring in enumerate(rings)]
+
+    # the upper line is appended reversed, if it shares the direction of the lower line. Some offset curves (e.g. of
+    # GEOS before 3.11 for negative distances) are reversed, their ends are compared to avoid a self crossing ring.
+    if np.hypot(*(lower[-1] - upper[0])) < np.hypot(*(lower[-1] - upper[-1])):
+        upper = upper[::-1]
+    ring = np.concatenate((lower, upper[::-1], lower[:1]))
+    if len(ring) < 4:
+        return None
+    return [ring if _signed_area(ring) >= 0 else ring[::-1]]
+
+
+def polygons_to_geometry(polygons: Sequence[List[np.ndarray]]) -> QgsGeometry:
+    """
+    Creates a multi polygon geometry from the given polygons. The geometry is built from WKB.
+    :param polygons: list of polygons, every polygon is a list of closed (n x 2) coordinate arrays (exterior first)
+    :return: returns a QgsGeometry multi polygon
+    """
+    wkb = [struct.pack('<BII', 1, 6, len(polygons))]
+    for rings in polygons:
+        wkb.append(struct.pack('<BII', 1, 3, len(rings)))
+        for ring in rings:
+            ring = np.ascontiguousarray(ring, dtype='<f8')
+            wkb.append(struct.pack('<I', len(ring)) + ring.tobytes())
+    geometry = QgsGeometry()
+    geometry.fromWkb(b''.join(wkb))
+    return geometry
+
+
+def band_geometry(lower: Sequence[np.ndarray], upper: Sequence[np.ndarray]) -> QgsGeometry or None:
+    """
+    Creates the band polygon between two (multi part) offset lines of the same base line. The parts of both lines are
+    paired by their index.
+    :param lower: list of (n x 2) coordinate arrays of the lower boundary, one per part
+    :param upper: list of (n x 2) coordinate arrays of the upper boundary, one per part
+    :return: the multi polygon geometry or None, if the parts of both lines do not match
+    """
+    if len(lower) == 0 or len(lower) != len(upper):
+        return None
+
+    polygons = list()
+    for lower_part, upper_part in zip(lower, upper):
+        rings = _stitch(np.asarray(lower_part, dtype=float), np.asarray(upper_part, dtype=float))
+        if rings is not None:
+            polygons.append(rings)
+    if len(polygons) == 0:
+        return None
+    return polygons_to_geometry(polygons)
+
+
+def lower_boundaries(distances: Sequence[float], lower_distances: Sequence[float]) -> List[int or None]:
+    """
+    Finds the constructed line, which bounds every unit at its lower boundary. If no line is constructed at the
+    lower boundary distance (e.g. the unit below is not constructed), the next constructed line beyond it is used,
+    so the band also covers the units without line.
+    :param distances: signed offset distance of every unit
+    :param lower_distances: signed distance of the lower boundary of every unit
+    :return: list with the index of the lower boundary line of every unit, -1 for the base line and None, if no line
+    is constructed at or beyond the lower boundary
+    """
+    scale = max([abs(distance) for distance in distances] + [1.0])
+    tolerance = DISTANCE_TOLERANCE * scale
+    # the base line is the first candidate (index -1), so it is preferred to a unit line at distance 0
+    candidates = np.concatenate(([0.0], np.asarray(distances, dtype=float)))
+    indices = np.arange(-1, len(distances))
+
+    result = list()
+    for index, (distance, lower_distance) in enumerate(zip(distances, lower_distances)):
+        direction = 1.0 if lower_distance >= distance else -1.0
+        beyond = (candidates - lower_distance) * direction
+        usable = (beyond >= -tolerance) & (indices != index)
+        if not np.any(usable):
+            result.append(None)
+            continue
+        nearest = np.flatnonzero(usable)[np.argmin(beyond[usable])]
+        result.append(int(indices[nearest]))
+    return result
+
+
+def unit_bands(coordinates: Sequence[np.ndarray], distances: Sequence[float], lower_distances: Sequence[float],
+               geometries: Sequence[QgsGeometry]) -> List[QgsGeometry or None]:
+    """
+    Creates the band polygon of every unit from the already computed offset lines. The upper boundary of a unit is
+    its own offset line, the lower boundary is the base line (distance 0) or the offset line of another unit at the
+    lower boundary distance, see lower_boundaries. No additional offsets are computed.
+    :param coordinates: list of (n x 2) coordinate arrays of the base line, one per part
+    :param distances: signed offset distance of every unit
+    :param lower_distances: signed distance of the lower boundary of every unit
+    :param geometries: offset line of every unit
+    :return: list with the band polygon of every unit, None for units without constructed line at or beyond their
+    lower boundary or with boundaries, whose parts do not match
+    """
+    arrays = dict()
+
+    def boundary(index: int) -> List[np.ndarray]:
+        if index == -1:
+            return list(coordinates)
+        if index not in arrays:
+            arrays[index] = geometry_to_arrays(geometries[index])
+        return arrays[index]
+
+    return [None if lower is None else band_geometry(boundary(lower), boundary(index))
+            for index, lower in enumerate(lower_boundaries(distances, lower_distances))]
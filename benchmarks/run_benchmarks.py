@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Headless benchmarks of the offset engine (and the GEOS offset curve per unit as its reference), the side detection,
+ the preview construction, the preview update after a vertex edit and the build of the unit lines. The plugin is
+ driven through its public interface with an offscreen map canvas, the results are written as JSON document and can
+ be compared with the results of a previous run.
+
+ usage: python3 benchmarks/run_benchmarks.py [--shapes sinuous,spiral] [--vertices 100,10000] [--units 1,100]
+                                             [--output bench_output.txt] [--compare previous.txt]
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+# the benchmarks do not need a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt5.QtGui import QColor
+from qgis.core import Qgis, QgsApplication, QgsPoint, QgsProject, QgsRectangle
+
+from stand_in import InterfaceStandIn
+from synthetic import SHAPES, TABLE_THICKNESS, unit_table
+
+# directory of the plugin, the parent directory of the benchmarks
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# default result file, excluded from version control
+DEFAULT_OUTPUT = os.path.join(PLUGIN_DIR, "bench_output.txt")
+# all benchmark stages
+STAGES = ("geos", "offset", "side", "preview", "edit", "build")
+# maximum time in seconds a single preview or build may take
+TIMEOUT = 3600.0
+
+
+def import_plugin() -> Dict[str, object]:
+    """
+    Imports the plugin modules as package, so the relative imports of the plugin work
+    :return: dictionary of the imported modules by module name
+    """
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    package = os.path.basename(PLUGIN_DIR)
+    names = ["HorizonConstruct", "LineConstruction", "OffsetEngine", "parallel_line_construction_dockwidget"]
+    return {name: importlib.import_module("{}.{}".format(package, name)) for name in names}
+
+
+def metadata() -> Dict[str, object]:
+    """
+    Collects the information about the measured version and the environment
+    :return: dictionary of the metadata
+    """
+    version = ""
+    with open(os.path.join(PLUGIN_DIR, "metadata.txt")) as metadata_file:
+        for line in metadata_file:
+            if line.startswith("version="):
+                version = line.split("=", 1)[1].strip()
+
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=PLUGIN_DIR,
+                                           stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = ""
+
+    return {
+        "plugin_version": version,
+        "revision": revision,
+        "qgis_version": Qgis.QGIS_VERSION,
+        "python_version": platform.python_version(),
+        "numpy_version": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "date": datetime.datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def summarize(times: List[float]) -> Dict[str, float]:
+    """
+    Summarizes the measured times
+    :param times: measured times in seconds
+    :return: dictionary with minimum, median and maximum time and the number of measurements
+    """
+    return {"min": min(times), "median": statistics.median(times), "max": max(times), "repeat": len(times)}
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = TIMEOUT) -> None:
+    """
+    Processes the Qt events until the condition is fulfilled. Background tasks report their results through the
+    event loop.
+    :param condition: function, which returns True, if the waiting is finished
+    :param timeout: maximum waiting time in seconds
+    :return: Nothing
+    :raises TimeoutError: if the condition is not fulfilled within the timeout
+    """
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Benchmark stage did not finish within {} s".format(timeout))
+        QgsApplication.processEvents()
+        time.sleep(0.001)
+
+
+class Benchmark:
+    """
+    Drives the line construction of the plugin with synthetic data
+    """
+
+    def __init__(self, modules: Dict[str, object], repeat: int, side_queries: int, workers: int) -> None:
+        """
+        Initialization of the class
+        :param modules: imported plugin modules
+        :param repeat: number of measurements per benchmark
+        :param side_queries: number of calc_side calls per measurement
+        :param workers: number of worker threads of the offset computation
+        """
+        self.__modules = modules
+        self.__repeat = repeat
+        self.__side_queries = side_queries
+        self.__workers = workers
+        self.__iface = InterfaceStandIn()
+        self.__dockwidget = modules["parallel_line_construction_dockwidget"].ParallelLineConstructionDockWidget()
+        self.__construction = modules["LineConstruction"].LineConstruction(self.__iface, self.__dockwidget)
+        self.__construction.workers = workers
+
+    #
+    # private functions
+    #
+
+    def __setup(self, coords: np.ndarray, table: List) -> None:
+        """
+        Prepares a construction like the plugin does after a feature was selected and a side was chosen
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: Nothing
+        """
+        horizon = self.__modules["HorizonConstruct"]
+        data = [horizon.UnitConstructionData(name=name, distance=distance, color=QColor(*rgb), base_unit=index == 0)
+                for index, (name, distance, rgb) in enumerate(table)]
+        construction = self.__construction
+        construction.reset()
+        construction.model = horizon.UnitConstructionModel(data)
+        geometry = self.__modules["OffsetEngine"].array_to_geometry(coords)
+        construction.active_geometry = geometry
+        construction.active_line = geometry.asPolyline()
+        construction.offset_cache.clear()
+
+        extent = QgsRectangle(geometry.boundingBox())
+        extent.grow(TABLE_THICKNESS)
+        self.__iface.zoom_to(extent)
+
+        # choose the left side of the middle segment
+        middle = len(coords) // 2
+        direction = coords[middle] - coords[middle - 1]
+        point = (coords[middle - 1] + coords[middle]) / 2 + np.array((-direction[1], direction[0])) * 1e-3
+        construction.calc_side(QgsPoint(float(point[0]), float(point[1])))
+
+        # apply all pending signals, the measurements start without queued recomputations
+        QgsApplication.processEvents()
+        construction.scheduler.cancel()
+
+    def __run_preview(self) -> float:
+        """
+        Computes the preview of the current construction
+        :return: the elapsed time in seconds
+        """
+        start = time.perf_counter()
+        self.__construction.scheduler.request()
+        self.__construction.scheduler.flush()
+        wait_until(self.__dockwidget.construct.isEnabled)
+        return time.perf_counter() - start
+
+    #
+    # public functions
+    #
+
+    def build(self, coords: np.ndarray, table: List) -> Dict[str, float]:
+        """
+        Measures the build of the unit lines into a temporary layer. The build starts from a computed preview, like
+        a click on the construct button.
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: summary of the measured times
+        """
+        times = list()
+        for _ in range(self.__repeat):
+            self.__setup(coords, table)
+            self.__run_preview()
+            start = time.perf_counter()
+            self.__dockwidget.construct.click()
+            # the construction is reset, after the lines are written
+            wait_until(lambda: self.__construction.active_geometry is None)
+            times.append(time.perf_counter() - start)
+            # noinspection PyArgumentList
+            QgsProject.instance().removeAllMapLayers()
+        return summarize(times)
+
+    def edit(self, coords: np.ndarray, table: List) -> Dict[str, float]:
+        """
+        Measures the preview update after the middle vertex of the base line was moved, like a drag with the vertex
+        tool in an edit session
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: summary of the measured times
+        """
+        self.__setup(coords, table)
+        self.__run_preview()
+        middle = len(coords) // 2
+        step = np.linalg.norm(coords[middle] - coords[middle - 1])
+        times = list()
+        for index in range(self.__repeat):
+            edited = coords.copy()
+            edited[middle] += (0.0, step * (1 if index % 2 == 0 else -1))
+            geometry = self.__modules["OffsetEngine"].array_to_geometry(edited)
+            start = time.perf_counter()
+            self.__construction.active_geometry = geometry
+            self.__construction.active_line = geometry.asPolyline()
+            self.__run_preview()
+            times.append(time.perf_counter() - start)
+        return summarize(times)
+
+    def geos(self, coords: np.ndarray, table: List) -> Dict[str, float]:
+        """
+        Measures the GEOS offset curve of every unit, the reference of the offset stage
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: summary of the measured times
+        """
+        offset_engine = self.__modules["OffsetEngine"]
+        distances = np.cumsum([distance for _, distance, _ in table]).tolist()
+        times = list()
+        for _ in range(self.__repeat):
+            start = time.perf_counter()
+            geometry = offset_engine.array_to_geometry(coords)
+            for distance in distances:
+                geometry.offsetCurve(distance, offset_engine.DEFAULT_SEGMENTS, offset_engine.JOIN_STYLE_MITER, 10.0)
+            times.append(time.perf_counter() - start)
+        return summarize(times)
+
+    def offset(self, coords: np.ndarray, table: List) -> Dict[str, float]:
+        """
+        Measures the offset engine alone (exact offsets of all units, including the loop removal and the validity
+        test)
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: summary of the measured times
+        """
+        offset_engine = self.__modules["OffsetEngine"]
+        distances = np.cumsum([distance for _, distance, _ in table]).tolist()
+        times = list()
+        for _ in range(self.__repeat):
+            start = time.perf_counter()
+            engine = offset_engine.MultiPartOffsetEngine([coords], offset_engine.JOIN_STYLE_MITER)
+            engine.geometries(distances, self.__workers)
+            times.append(time.perf_counter() - start)
+        return summarize(times)
+
+    def preview(self, coords: np.ndarray, table: List) -> Dict[str, float]:
+        """
+        Measures the preview construction for the full extent of the base line
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: summary of the measured times
+        """
+        times = list()
+        for _ in range(self.__repeat):
+            self.__setup(coords, table)
+            times.append(self.__run_preview())
+        return summarize(times)
+
+    def side(self, coords: np.ndarray, table: List) -> Dict[str, float]:
+        """
+        Measures calc_side for random positions around the base line
+        :param coords: (n x 2) coordinate array of the base line
+        :param table: rows of the unit table
+        :return: summary of the measured times per call
+        """
+        self.__setup(coords, table)
+        generator = np.random.RandomState(0)
+        lower = coords.min(axis=0) - TABLE_THICKNESS
+        upper = coords.max(axis=0) + TABLE_THICKNESS
+        positions = [QgsPoint(float(x), float(y))
+                     for x, y in generator.uniform(lower, upper, (self.__side_queries, 2))]
+
+        times = list()
+        for _ in range(self.__repeat):
+            start = time.perf_counter()
+            for position in positions:
+                self.__construction.calc_side(position)
+            times.append((time.perf_counter() - start) / len(positions))
+            self.__construction.scheduler.cancel()
+        return summarize(times)
+
+    def unload(self) -> None:
+        """
+        Removes the construction from the map canvas
+        :return: Nothing
+        """
+        self.__construction.unload()
+
+
+def compare(results: List[Dict], path: str, threshold: float) -> int:
+    """
+    Prints the ratio between the current and the previous median time of every benchmark
+    :param results: current results
+    :param path: path of the previous result file
+    :param threshold: ratio, above which a benchmark counts as regression
+    :return: the number of regressions
+    """
+    with open(path) as previous_file:
+        previous = json.load(previous_file)
+    keys = ("stage", "shape", "vertices", "units")
+    reference = {tuple(entry[key] for key in keys): entry["median"] for entry in previous["results"]}
+
+    regressions = 0
+    for entry in results:
+        old = reference.get(tuple(entry[key] for key in keys))
+        if old is None or old <= 0:
+            continue
+        ratio = entry["median"] / old
+        marker = ""
+        if ratio > threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        print("{:8} {:9} {:>8} {:>5}  {:8.3f}x{}".format(entry["stage"], entry["shape"], entry["vertices"],
+                                                        entry["units"], ratio, marker))
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Runs the benchmarks
+    :param argv: command line arguments
+    :return: exit code (1, if a regression was found)
+    """
+    parser = argparse.ArgumentParser(description="Headless benchmarks of the parallel line construction")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated list of {}".format(STAGES))
+    parser.add_argument("--shapes", default=",".join(SHAPES), help="comma separated list of {}".format(
+        tuple(SHAPES)))
+    parser.add_argument("--vertices", default="100,1000,10000,100000,1000000",
+                        help="comma separated vertex counts of the base lines")
+    parser.add_argument("--units", default="1,10,100,1000", help="comma separated row counts of the unit tables")
+    parser.add_argument("--max-points", type=float, default=2e7,
+                        help="skip combinations with more than vertices * units offset points")
+    parser.add_argument("--repeat", type=int, default=3, help="number of measurements per benchmark")
+    parser.add_argument("--side-queries", type=int, default=1000, help="calc_side calls per measurement")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="offset worker threads")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="path of the JSON result file")
+    parser.add_argument("--compare", default=None, help="path of a previous result file")
+    parser.add_argument("--threshold", type=float, default=1.2, help="regression ratio of the median times")
+    args = parser.parse_args(argv)
+
+    stages = [stage for stage in args.stages.split(",") if stage != ""]
+    shapes = [shape for shape in args.shapes.split(",") if shape != ""]
+    unknown = [name for name in stages if name not in STAGES] + [name for name in shapes if name not in SHAPES]
+    if len(unknown) > 0:
+        parser.error("unknown stages or shapes: {}".format(", ".join(unknown)))
+    vertex_counts = [int(value) for value in args.vertices.split(",")]
+    row_counts = [int(value) for value in args.units.split(",")]
+
+    # noinspection PyArgumentList
+    QgsApplication.setPrefixPath(os.environ.get("QGIS_PREFIX_PATH", "/usr"), True)
+    application = QgsApplication([], True)
+    application.initQgis()
+
+    results = list()
+    benchmark = None
+    try:
+        benchmark = Benchmark(import_plugin(), max(args.repeat, 1), max(args.side_queries, 1),
+                              max(args.workers, 1))
+        for shape in shapes:
+            for vertices in vertex_counts:
+                coords = SHAPES[shape](vertices)
+                for stage in stages:
+                    # the side detection does not depend on the unit table
+                    for rows in (row_counts[:1] if stage == "side" else row_counts):
+                        if stage != "side" and vertices * rows > args.max_points:
+                            continue
+                        summary = getattr(benchmark, stage)(coords, unit_table(rows))
+                        entry = {"stage": stage, "shape": shape, "vertices": vertices, "units": rows}
+                        entry.update(summary)
+                        results.append(entry)
+                        print("{:8} {:9} {:>8} {:>5}  {:10.6f} s".format(stage, shape, vertices, rows,
+                                                                         summary["median"]))
+                        sys.stdout.flush()
+    finally:
+        if benchmark is not None:
+            benchmark.unload()
+        application.exitQgis()
+
+    with open(args.output, "w") as output_file:
+        json.dump({"metadata": metadata(), "results": results}, output_file, indent=2)
+    print("results written to {}".format(args.output))
+
+    if args.compare is not None:
+        return 1 if compare(results, args.compare, args.threshold) > 0 else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
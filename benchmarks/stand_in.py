@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Lightweight replacement of the QGIS interface for running the plugin without the QGIS desktop application
+"""
+
+from typing import List, Tuple
+
+from qgis.core import QgsRectangle
+from qgis.gui import QgsMapCanvas
+
+
+class MessageBarStandIn:
+    """
+    Records all messages instead of showing them
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialization of the class
+        """
+        self.messages = list()  # type: List[Tuple[str, str, str]]
+
+    def pushCritical(self, title: str, text: str) -> None:
+        """
+        Records a critical message
+        :param title: message title
+        :param text: message text
+        :return: Nothing
+        """
+        self.messages.append(("critical", title, text))
+
+    def pushInfo(self, title: str, text: str) -> None:
+        """
+        Records an info message
+        :param title: message title
+        :param text: message text
+        :return: Nothing
+        """
+        self.messages.append(("info", title, text))
+
+    def pushWarning(self, title: str, text: str) -> None:
+        """
+        Records a warning message
+        :param title: message title
+        :param text: message text
+        :return: Nothing
+        """
+        self.messages.append(("warning", title, text))
+
+
+class InterfaceStandIn:
+    """
+    Replacement of QgisInterface, which provides a real (offscreen) map canvas and a recording message bar
+    """
+
+    def __init__(self, width: int = 1200, height: int = 800) -> None:
+        """
+        Initialization of the class
+        :param width: width of the map canvas in pixels
+        :param height: height of the map canvas in pixels
+        """
+        self.__canvas = QgsMapCanvas()
+        self.__canvas.resize(width, height)
+        # the canvas only knows its output size after it was shown
+        self.__canvas.show()
+        self.__message_bar = MessageBarStandIn()
+
+    def mapCanvas(self) -> QgsMapCanvas:
+        """
+        returns the map canvas
+        :return: the map canvas
+        """
+        return self.__canvas
+
+    def messageBar(self) -> MessageBarStandIn:
+        """
+        returns the message bar
+        :return: the message bar
+        """
+        return self.__message_bar
+
+    def zoom_to(self, extent: QgsRectangle) -> None:
+        """
+        Sets the visible extent of the map canvas
+        :param extent: new visible extent
+        :return: Nothing
+        """
+        self.__canvas.setExtent(extent)
+        self.__canvas.refresh()
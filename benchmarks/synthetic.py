@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Synthetic base lines and unit tables for the benchmarks. All data is generated from a fixed seed, so every run
+ measures the same geometries.
+"""
+
+import colorsys
+import math
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+# length of every synthetic base line in map units
+LINE_LENGTH = 10000.0
+# total thickness of every synthetic unit table in map units
+TABLE_THICKNESS = 1000
+# seed of the random generator used for the noisy base lines
+SEED = 42
+
+
+def straight_line(vertices: int) -> np.ndarray:
+    """
+    Creates a straight base line
+    :param vertices: number of vertices
+    :return: (vertices x 2) coordinate array
+    """
+    x = np.linspace(0.0, LINE_LENGTH, vertices)
+    return np.column_stack((x, np.zeros(vertices)))
+
+
+def sinuous_line(vertices: int) -> np.ndarray:
+    """
+    Creates a sine shaped base line with concave bends, whose radius is smaller than the largest offsets
+    :param vertices: number of vertices
+    :return: (vertices x 2) coordinate array
+    """
+    x = np.linspace(0.0, LINE_LENGTH, vertices)
+    return np.column_stack((x, 0.05 * LINE_LENGTH * np.sin(x / LINE_LENGTH * 8 * math.pi)))
+
+
+def spiral_line(vertices: int) -> np.ndarray:
+    """
+    Creates an archimedean spiral with four turns
+    :param vertices: number of vertices
+    :return: (vertices x 2) coordinate array
+    """
+    angle = np.linspace(0.0, 8 * math.pi, vertices)
+    radius = 0.1 * LINE_LENGTH + angle / (8 * math.pi) * 0.4 * LINE_LENGTH
+    return np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+
+
+def noisy_line(vertices: int) -> np.ndarray:
+    """
+    Creates a straight base line with random perpendicular noise, every vertex is a small zigzag
+    :param vertices: number of vertices
+    :return: (vertices x 2) coordinate array
+    """
+    generator = np.random.RandomState(SEED)
+    x = np.linspace(0.0, LINE_LENGTH, vertices)
+    spacing = LINE_LENGTH / max(vertices - 1, 1)
+    return np.column_stack((x, generator.normal(0.0, spacing, vertices)))
+
+
+# all base line generators by shape name
+SHAPES = {
+    "straight": straight_line,
+    "sinuous": sinuous_line,
+    "spiral": spiral_line,
+    "noisy": noisy_line,
+}  # type: Dict[str, Callable[[int], np.ndarray]]
+
+
+def unit_table(rows: int) -> List[Tuple[str, int, Tuple[int, int, int]]]:
+    """
+    Creates the rows of a synthetic unit table. All units are constructed, the first one is the base unit. The
+    distances sum up to about TABLE_THICKNESS.
+    :param rows: number of rows
+    :return: list of (name, distance, RGB colour) tuples
+    """
+    distance = max(TABLE_THICKNESS // max(rows, 1), 1)
+    table = list()
+    for row in range(rows):
+        red, green, blue = colorsys.hsv_to_rgb((row * 0.618034) % 1.0, 0.8, 0.9)
+        table.append(("unit_{:04d}".format(row), distance, (int(red * 255), int(green * 255), int(blue * 255))))
+    return table
@@ -20,22 +20,35 @@ email                : stephan@donndorf.info
 import io
 import json
 import os.path
-import sys
-import traceback
+from typing import List
 
-from PyQt5.QtCore import QCoreApplication, QSettings, QTranslator, Qt, qVersion
-from PyQt5.QtGui import QIcon, QColor
+from PyQt5.QtCore import QCoreApplication, QSettings, QTimer, QTranslator, Qt, qVersion
+from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QAction, QFileDialog, QHeaderView, QPushButton
-from qgis.core import QgsGeometry, QgsMapLayer, QgsMessageLog, QgsPoint, QgsProject, QgsWkbTypes
+from qgis.core import QgsApplication, QgsGeometry, QgsMapLayer, QgsPoint, QgsPointXY, QgsProject, QgsWkbTypes
 from qgis.gui import QgsMapToolEmitPoint
 
-from .HorizonConstruct import UnitConstructionData, UnitConstructionDelegate, UnitConstructionModel
+from .FileOutput import FORMAT_MEMORY, OUTPUT_FORMATS
+from .HorizonConstruct import UnitConstructionData, UnitConstructionDelegate, UnitConstructionModel, \
+    unit_table_from_json
 from .LineConstruction import LineConstruction
+from .OffsetDiskCache import DEFAULT_MAX_BYTES, OffsetDiskCache
+from .PluginLogger import LOG_INFO, LOG_LEVELS, LOGGER
+from .ProcessingProvider import ParallelLineConstructionProvider
 from .parallel_line_construction_dockwidget import ParallelLineConstructionDockWidget
 # Initialize Qt resources from file resources.py
 # noinspection PyUnresolvedReferences
 from .resources import *
 
+# refresh interval of the diagnostics panel in milliseconds
+DIAGNOSTICS_INTERVAL = 1000
+# settings keys of the log configuration
+LOG_LEVEL_SETTING = "parallel_line_construction/log_level"
+LOG_GEOMETRIES_SETTING = "parallel_line_construction/log_geometries"
+# settings keys of the disk cache, its size is given in bytes
+DISK_CACHE_SETTING = "parallel_line_construction/disk_cache"
+DISK_CACHE_SIZE_SETTING = "parallel_line_construction/disk_cache_size"
+
 
 class ParallelLineConstruction:
     """QGIS Plugin Implementation."""
@@ -55,7 +68,7 @@ class ParallelLineConstruction:
         self.plugin_dir = os.path.dirname(__file__)
 
         # initialize locale
-        locale = QSettings().value('locale/userLocale')[0:2]
+        locale = (QSettings().value('locale/userLocale') or '')[0:2]
         locale_path = os.path.join(
             self.plugin_dir,
             'i18n',
@@ -68,12 +81,22 @@ class ParallelLineConstruction:
             if qVersion() > '4.3.3':
                 QCoreApplication.installTranslator(self.translator)
 
+        # restore the log configuration
+        try:
+            LOGGER.level = QSettings().value(LOG_LEVEL_SETTING, LOG_INFO, type=int)
+        except ValueError:
+            LOGGER.level = LOG_INFO
+        LOGGER.dump_geometries = QSettings().value(LOG_GEOMETRIES_SETTING, False, type=bool)
+
         # Declare instance attributes
         self.actions = []
         self.menu = self.tr(u'&Parallel Line Construction')
         # TODO: We are going to let the user set this up in a future iteration
-        self.toolbar = self.iface.addToolBar(u'ParallelLineConstruction')
-        self.toolbar.setObjectName(u'ParallelLineConstruction')
+        # without interface (e.g. in qgis_process) only the processing provider is loaded
+        self.toolbar = None
+        if self.iface is not None:
+            self.toolbar = self.iface.addToolBar(u'ParallelLineConstruction')
+            self.toolbar.setObjectName(u'ParallelLineConstruction')
 
         # print "** INITIALIZING ParallelLineConstruction"
 
@@ -84,6 +107,9 @@ class ParallelLineConstruction:
         self.__model = None
         self.__active_layer = None
         self.__line_construct = None
+        self.__provider = None
+        self.__diagnostics_timer = None
+        self.__diagnostics_revision = -1
 
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
@@ -174,6 +200,16 @@ class ParallelLineConstruction:
 
         return action
 
+    # noinspection PyPep8Naming
+    def initProcessing(self):
+        """Registers the processing provider for headless and batch constructions. QGIS calls this function
+        without GUI (e.g. in qgis_process), initGui calls it for the desktop application."""
+        if self.__provider is not None:
+            return
+        self.__provider = ParallelLineConstructionProvider()
+        # noinspection PyArgumentList
+        QgsApplication.processingRegistry().addProvider(self.__provider)
+
     # noinspection PyPep8Naming
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
@@ -185,6 +221,8 @@ class ParallelLineConstruction:
             callback=self.run,
             parent=self.iface.mainWindow())
 
+        self.initProcessing()
+
     # --------------------------------------------------------------------------
 
     # noinspection PyPep8Naming
@@ -214,10 +252,17 @@ class ParallelLineConstruction:
                 self.tr(u'&Parallel Line Construction'),
                 action)
             self.iface.removeToolBarIcon(action)
+        if self.__provider is not None:
+            # noinspection PyArgumentList
+            QgsApplication.processingRegistry().removeProvider(self.__provider)
+            self.__provider = None
+        if self.__diagnostics_timer is not None:
+            self.__diagnostics_timer.stop()
+
         # remove the toolbar
         try:
             del self.toolbar
-            self.__line_construct.reset()
+            self.__line_construct.unload()
         except AttributeError:
             pass
 
@@ -246,9 +291,18 @@ class ParallelLineConstruction:
             self.iface.addDockWidget(Qt.RightDockWidgetArea, self.dockwidget)
             self.dockwidget.show()
 
+            if self.__line_construct is not None:
+                self.__line_construct.unload()
             self.__line_construct = LineConstruction(self.iface, self.dockwidget)
             self.dockwidget.line_join_style.addItems(["Use rounded joins", "Use mitered joins", "Use beveled joins"])
             self.dockwidget.line_join_style.setCurrentIndex(1)
+            self.dockwidget.batch_side_rule.addItems(["Side of the clicked point", "Same side as the first feature"])
+            self.dockwidget.batch_side_rule.setCurrentIndex(0)
+            self.dockwidget.batch_construction.toggled.connect(self.dockwidget.batch_side_rule.setEnabled)
+            self.dockwidget.output_format.clear()
+            self.dockwidget.output_format.addItems([output_format[0] for output_format in OUTPUT_FORMATS])
+            self.dockwidget.output_format.currentIndexChanged.connect(self.on_output_format_changed)
+            self.dockwidget.output_format.setCurrentIndex(FORMAT_MEMORY)
 
             self.dockwidget.add_unit.clicked.connect(self.on_add_unit_clicked)
             self.dockwidget.remove_unit.clicked.connect(self.on_remove_unit_clicked)
@@ -258,6 +312,27 @@ class ParallelLineConstruction:
             self.dockwidget.save_unit_table.clicked.connect(self.on_save_unit_table_clicked)
             self.dockwidget.start_construction.clicked.connect(self.on_start_line_construction_clicked)
 
+            # the diagnostics panel is only refreshed while it is expanded
+            if self.__diagnostics_timer is None:
+                self.__diagnostics_timer = QTimer()
+                self.__diagnostics_timer.setInterval(DIAGNOSTICS_INTERVAL)
+                # noinspection PyUnresolvedReferences
+                self.__diagnostics_timer.timeout.connect(self.on_diagnostics_timeout)
+            self.__diagnostics_revision = -1
+            self.dockwidget.diagnostics.toggled.connect(self.on_diagnostics_toggled)
+            self.dockwidget.reset_diagnostics.clicked.connect(self.on_reset_diagnostics_clicked)
+            self.dockwidget.export_diagnostics.clicked.connect(self.on_export_diagnostics_clicked)
+            self.on_diagnostics_toggled(self.dockwidget.diagnostics.isChecked())
+            self.dockwidget.log_level.clear()
+            self.dockwidget.log_level.addItems([name for _, name in LOG_LEVELS])
+            self.dockwidget.log_level.setCurrentIndex([level for level, _ in LOG_LEVELS].index(LOGGER.level))
+            self.dockwidget.log_level.currentIndexChanged.connect(self.on_log_level_changed)
+            self.dockwidget.log_geometries.setChecked(LOGGER.dump_geometries)
+            self.dockwidget.log_geometries.toggled.connect(self.on_log_geometries_toggled)
+            self.dockwidget.disk_cache.setChecked(QSettings().value(DISK_CACHE_SETTING, False, type=bool))
+            self.dockwidget.disk_cache.toggled.connect(self.on_disk_cache_toggled)
+            self.on_disk_cache_toggled(self.dockwidget.disk_cache.isChecked())
+
             try:
                 self.__model = UnitConstructionModel()
                 self.__line_construct.model = self.__model
@@ -285,9 +360,6 @@ class ParallelLineConstruction:
         :param e: Exception data
         :return: Nothing
         """
-        _, _, exc_traceback = sys.exc_info()
-        text = "Error Message:\n{}\nTraceback:\n{}".format(str(e), '\n'.join(traceback.format_tb(exc_traceback)))
-
         widget = self.iface.messageBar().createMessage("Error", "An exception occurred during the process. " +
                                                        "For more details, please take a look to the log windows.")
         button = QPushButton(widget)
@@ -297,8 +369,20 @@ class ParallelLineConstruction:
         widget.layout().addWidget(button)
         self.iface.messageBar().pushWidget(widget, level = 2)
 
-        # noinspection PyCallByClass,PyArgumentList,PyTypeChecker
-        QgsMessageLog.logMessage(text, level=2)
+        LOGGER.exception(e)
+
+    # noinspection PyMethodMayBeStatic
+    def _first_part(self, geometry: QgsGeometry) -> List[QgsPointXY]:
+        """
+        returns the vertices of the first part of the given line geometry. All parts of a multi part geometry are
+        constructed, the first one is used as the active line.
+        :param geometry: line or multi line geometry
+        :return: list of the vertices of the first part
+        """
+        if geometry.isMultipart():
+            parts = geometry.asMultiPolyline()
+            return parts[0] if len(parts) > 0 else list()
+        return geometry.asPolyline()
 
     def _parse_selection(self):
         """
@@ -320,16 +404,15 @@ class ParallelLineConstruction:
 
         text = ""
 
-        # noinspection PyArgumentList
-        if QgsWkbTypes.isMultiType(self.iface.activeLayer().wkbType()):
-            text += "This is line is stored as a multi part line. This tool only uses the first part, if more than " + \
-                    "one exists!"
-
         if len(selected_features) > 1:
             if text != "":
                 text += "\n\n"
-            text += "Multiple features selected. Using only the first of this selection."
+            text += "Multiple features selected. The preview uses only the first of this selection. Check " + \
+                    "\"Construct along all selected features\" to construct the units along every feature."
 
+        self.__line_construct.source_crs = self.__active_layer.crs()
+        self.__line_construct.batch_geometries = [feature.geometry() for feature in selected_features]
+        self.__line_construct.batch_feature_ids = [feature.id() for feature in selected_features]
         self.__line_construct.active_feature_id = selected_features[0].id()
         self.__line_construct.active_geometry = selected_features[0].geometry()
 
@@ -338,10 +421,7 @@ class ParallelLineConstruction:
             self.__line_construct.reset()
             return
 
-        if self.__line_construct.active_geometry.isMultipart():
-            self.__line_construct.active_geometry = self.__line_construct.active_geometry.asGeometryCollection()[0]
-
-        line = self.__line_construct.active_geometry.asPolyline()
+        line = self._first_part(self.__line_construct.active_geometry)
         if len(line) < 2:
             self.iface.messageBar().pushWarning("Warning", "Selected line has less than two points. Cannot use it.")
             self.__line_construct.reset()
@@ -394,6 +474,64 @@ class ParallelLineConstruction:
 
         self._parse_selection()
 
+    def on_diagnostics_timeout(self) -> None:
+        """
+        slot, which shows the current stage timings in the diagnostics panel, if new spans were recorded
+        :return: Nothing
+        """
+        timings = self.__line_construct.timings
+        if timings.revision == self.__diagnostics_revision:
+            return
+        self.__diagnostics_revision = timings.revision
+        self.dockwidget.show_timings(timings.summary())
+
+    def on_diagnostics_toggled(self, checked: bool) -> None:
+        """
+        slot, which starts the refresh of the diagnostics panel, if it is expanded, and stops it otherwise
+        :param checked: True, if the diagnostics panel is expanded
+        :return: Nothing
+        """
+        if checked:
+            self.__diagnostics_revision = -1
+            self.on_diagnostics_timeout()
+            self.__diagnostics_timer.start()
+        else:
+            self.__diagnostics_timer.stop()
+
+    def on_disk_cache_toggled(self, checked: bool) -> None:
+        """
+        slot, which enables or disables the persistent offset cache inside the QGIS profile directory
+        :param checked: True, if the offsets are cached on disk
+        :return: Nothing
+        """
+        QSettings().setValue(DISK_CACHE_SETTING, checked)
+        if not checked:
+            self.__line_construct.disk_cache = None
+            return
+        # noinspection PyArgumentList
+        directory = os.path.join(QgsApplication.qgisSettingsDirPath(), "parallel_line_construction", "offset_cache")
+        try:
+            max_bytes = QSettings().value(DISK_CACHE_SIZE_SETTING, DEFAULT_MAX_BYTES, type=int)
+            self.__line_construct.disk_cache = OffsetDiskCache(directory, max_bytes)
+        except ValueError:
+            self.__line_construct.disk_cache = OffsetDiskCache(directory)
+
+    def on_export_diagnostics_clicked(self) -> None:
+        """
+        Slot for saving the stage timings into a text file in JSON format.
+        :return: Nothing
+        """
+        # noinspection PyArgumentList
+        file = QFileDialog.getSaveFileName(self.dockwidget, "Save to", QgsProject.instance().readPath("./"),
+                                           "JSON file (*.json);;All(*)")
+        file = file[0]
+        if file != "":
+            try:
+                with io.open(file, 'w', encoding='utf8') as outfile:
+                    outfile.write(self.__line_construct.timings.to_json())
+            except IOError as e:
+                self._exception_handling(e)
+
     def on_geometry_changed(self, fid: int, geometry: QgsGeometry) -> None:
         """
         Slot activated, if a geometry changed in an edit session of the currently selected active layer
@@ -401,8 +539,7 @@ class ParallelLineConstruction:
         :param geometry: changed QgsGeometry object
         :return: Nothing
         """
-        # noinspection PyCallByClass,PyArgumentList,PyTypeChecker
-        QgsMessageLog.logMessage("on_geometry_changed [{}]: {}".format(fid, str(geometry.asJson())), level=0)
+        LOGGER.geometry(geometry, "on_geometry_changed [{}]", fid)
 
         if self.__line_construct.active_feature_id == fid:
             # -> last part of self._parse_selection
@@ -413,10 +550,7 @@ class ParallelLineConstruction:
                 self.__line_construct.reset()
                 return
 
-            if self.__line_construct.active_geometry.isMultipart():
-                self.__line_construct.active_geometry = self.__line_construct.active_geometry.asGeometryCollection()[0]
-
-            line = self.__line_construct.active_geometry.asPolyline()
+            line = self._first_part(self.__line_construct.active_geometry)
             if len(line) < 2:
                 self.iface.messageBar().pushWarning("Warning", "Selected line has less than two points. Cannot use it.")
                 self.__line_construct.reset()
@@ -424,6 +558,26 @@ class ParallelLineConstruction:
 
             self.__line_construct.active_line = line
 
+    def on_log_geometries_toggled(self, checked: bool) -> None:
+        """
+        slot, which enables or disables the debug dumps of edited geometries
+        :param checked: True, if the geometries are dumped
+        :return: Nothing
+        """
+        LOGGER.dump_geometries = checked
+        QSettings().setValue(LOG_GEOMETRIES_SETTING, checked)
+
+    def on_log_level_changed(self, index: int) -> None:
+        """
+        slot, which sets the minimum level of the plugin log messages
+        :param index: index of the selected log level
+        :return: Nothing
+        """
+        if index < 0:
+            return
+        LOGGER.level = LOG_LEVELS[index][0]
+        QSettings().setValue(LOG_LEVEL_SETTING, LOGGER.level)
+
     def on_move_unit_down_clicked(self) -> None:
         """
         slot for moving the unit selected in the view down in the model, if possible
@@ -461,38 +615,23 @@ class ParallelLineConstruction:
         file = QFileDialog.getOpenFileName(self.dockwidget, "Save to", QgsProject.instance().readPath("./"),
                                            "JSON file (*.json);;All(*)")
         file = file[0]
-        with open(file) as data_file:
-            data_loaded = json.load(data_file)
+        with self.__line_construct.timings.span("unit table: load"):
+            with open(file) as data_file:
+                data_loaded = json.load(data_file)
 
-        # parsing the data
-        model_data = list()
-        try:
-            keys = [int(i) for i in list(data_loaded.keys())]
-            # noinspection PyCallByClass,PyArgumentList,PyTypeChecker
-            #QgsMessageLog.logMessage("keys: {}".format(str(keys)), level=0)
-            keys.sort()
-            #QgsMessageLog.logMessage("keys sorted: {}".format(str(keys)), level=0)
-            for i in keys:
-                i = str(i)
-                data = UnitConstructionData()
-                for j in data_loaded[i]:
-                    index = UnitConstructionData.get_header_index(j)
-                    if index == -1:
-                        raise ValueError("Unknown key: {}".format(str(j)))
-                    if j == "color":
-                        data_loaded[i][j] = QColor(data_loaded[i][j])
-                    data[index] = data_loaded[i][j]
-                model_data.append(data)
+            # parsing the data
+            try:
+                model_data = unit_table_from_json(data_loaded)
 
-        except Exception as e:
-            self._exception_handling(e)
-            return
+            except Exception as e:
+                self._exception_handling(e)
+                return
 
-        for i in range(self.__model.rowCount()):
-            self.__model.removeRow(0)
+            for i in range(self.__model.rowCount()):
+                self.__model.removeRow(0)
 
-        for item in model_data:
-            self.__model.insertRow(self.__model.rowCount(), item)
+            for item in model_data:
+                self.__model.insertRow(self.__model.rowCount(), item)
 
     def on_manage_click(self, pos: QgsPoint, clicked_button: int) -> None:
         """
@@ -513,6 +652,15 @@ class ParallelLineConstruction:
         self.__my_map_tool = None
         self.iface.mapCanvas().xyCoordinates.disconnect(self.on_update_coordinates)
 
+    def on_output_format_changed(self, index: int) -> None:
+        """
+        slot, which enables the output file selection for file based output formats
+        :param index: index of the selected output format
+        :return: Nothing
+        """
+        self.dockwidget.output_file.setEnabled(index != FORMAT_MEMORY)
+        self.dockwidget.output_file.setFilter(OUTPUT_FORMATS[index][3] if index >= 0 else "")
+
     def on_remove_unit_clicked(self) -> None:
         """
         Remove the unit data from the model of the selected index in the view
@@ -526,6 +674,14 @@ class ParallelLineConstruction:
         row = selection.selectedIndexes()[0].row()
         self.__model.removeRow(row)
 
+    def on_reset_diagnostics_clicked(self) -> None:
+        """
+        Slot, which removes all recorded stage timings
+        :return: Nothing
+        """
+        self.__line_construct.timings.clear()
+        self.dockwidget.show_timings(dict())
+
     def on_save_unit_table_clicked(self) -> None:
         """
         Slot for saving the current UnitConstructionModel into a text file in JSON format.
@@ -535,7 +691,10 @@ class ParallelLineConstruction:
         file = QFileDialog.getSaveFileName(self.dockwidget, "Save to", QgsProject.instance().readPath("./"),
                                            "JSON file (*.json);;All(*)")
         file = file[0]
-        if file != "":
+        if file == "":
+            return
+
+        with self.__line_construct.timings.span("unit table: save"):
             out_dict = dict()
             for i in range(self.__model.rowCount()):
                 out_dict[i] = dict()
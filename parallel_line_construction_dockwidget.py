@@ -23,13 +23,18 @@
 """
 
 import os
+from typing import Dict
 
 from PyQt5 import QtGui, QtWidgets, uic
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'parallel_line_construction_dockwidget_base.ui'))
 
+# columns of the diagnostics table: header and key of the timing summary
+TIMING_COLUMNS = (("Stage", ""), ("Count", "count"), ("Last [ms]", "last_ms"), ("p50 [ms]", "p50_ms"),
+                  ("p90 [ms]", "p90_ms"), ("p99 [ms]", "p99_ms"), ("Max [ms]", "max_ms"))
+
 
 class ParallelLineConstructionDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
     closingPlugin = pyqtSignal()
@@ -44,6 +49,30 @@ class ParallelLineConstructionDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         # #widgets-and-dialogs-with-auto-connect
         self.setupUi(self)
 
+        # the diagnostics panel is collapsed, while its group box is unchecked
+        self.diagnostics_table.setColumnCount(len(TIMING_COLUMNS))
+        self.diagnostics_table.setHorizontalHeaderLabels([column[0] for column in TIMING_COLUMNS])
+        self.diagnostics_table.verticalHeader().setVisible(False)
+        self.diagnostics_contents.setVisible(self.diagnostics.isChecked())
+        self.diagnostics.toggled.connect(self.diagnostics_contents.setVisible)
+
     def closeEvent(self, event):
         self.closingPlugin.emit()
         event.accept()
+
+    def show_timings(self, summary: Dict[str, Dict[str, float]]) -> None:
+        """
+        Shows the timing summary of the construction stages in the diagnostics table
+        :param summary: timing summary by stage name, see StageTimer.summary
+        :return: Nothing
+        """
+        table = self.diagnostics_table
+        table.setRowCount(len(summary))
+        for row, (stage, entry) in enumerate(summary.items()):
+            table.setItem(row, 0, QtWidgets.QTableWidgetItem(stage))
+            for column, (_, key) in enumerate(TIMING_COLUMNS[1:], 1):
+                text = str(entry[key]) if key == "count" else "{:.2f}".format(entry[key])
+                item = QtWidgets.QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(row, column, item)
+        table.resizeColumnsToContents()
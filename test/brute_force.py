@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Brute force reference implementations, which the tests compare with the optimized array code
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+def segment_arrays(parts: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Collects the non degenerated segments of all parts
+    :param parts: list of (n x 2) coordinate arrays
+    :return: tuple of the (s x 2) start and end points
+    """
+    starts = list()
+    ends = list()
+    for part in parts:
+        part = np.asarray(part, dtype=float).reshape(-1, 2)
+        keep = np.any(part[1:] != part[:-1], axis=1)
+        starts.append(part[:-1][keep])
+        ends.append(part[1:][keep])
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def point_distances(points: np.ndarray, parts: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Calculates the distance of every point to the nearest segment by testing all segments
+    :param points: (m x 2) array of points
+    :param parts: list of (n x 2) coordinate arrays of the line
+    :return: array of the m distances
+    """
+    starts, ends = segment_arrays(parts)
+    vectors = ends - starts
+    relative = np.asarray(points, dtype=float).reshape(-1, 2)[:, np.newaxis, :] - starts[np.newaxis]
+    t = np.clip(np.sum(relative * vectors, axis=2) / np.sum(vectors * vectors, axis=1), 0.0, 1.0)
+    nearest = relative - vectors[np.newaxis] * t[:, :, np.newaxis]
+    return np.hypot(nearest[:, :, 0], nearest[:, :, 1]).min(axis=1)
+
+
+def intersecting_pairs(coords: np.ndarray, closed: bool = False) -> List[Tuple[int, int]]:
+    """
+    Tests every pair of non adjacent segments of a line for an intersection
+    :param coords: (n x 2) coordinate array of the line
+    :param closed: True, if the first and the last segment are adjacent
+    :return: sorted list of the (first, second) segment indices of all intersecting pairs
+    """
+    starts = coords[:-1]
+    vectors = coords[1:] - starts
+    count = len(starts)
+    pairs = list()
+    for a in range(count):
+        for b in range(a + 2, count):
+            if closed and a == 0 and b == count - 1:
+                continue
+            r, s = vectors[a], vectors[b]
+            denominator = r[0] * s[1] - r[1] * s[0]
+            if denominator == 0:
+                continue
+            qp = starts[b] - starts[a]
+            t = (qp[0] * s[1] - qp[1] * s[0]) / denominator
+            u = (qp[0] * r[1] - qp[1] * r[0]) / denominator
+            if 0 <= t <= 1 and 0 <= u <= 1:
+                pairs.append((a, b))
+    return pairs
+
+
+def winding_line(vertices: int, noise: float = 0.0, seed: int = 0) -> np.ndarray:
+    """
+    Creates an x monotone line with bends of several scales
+    :param vertices: number of vertices
+    :param noise: standard deviation of the random noise added to the y coordinates
+    :param seed: seed of the random noise
+    :return: (vertices x 2) coordinate array
+    """
+    x = np.linspace(0.0, 2000.0, vertices)
+    y = 60 * np.sin(x / 37) + 25 * np.sin(x / 11 + 1) + 8 * np.sin(x / 3.3)
+    if noise > 0:
+        y = y + np.random.default_rng(seed).normal(0.0, noise, vertices)
+    return np.column_stack((x, y))
+
+
+def zigzag_line(teeth: int, width: float = 10.0, height: float = 40.0) -> np.ndarray:
+    """
+    Creates a zigzag line with sharp teeth
+    :param teeth: number of teeth
+    :param width: width of a tooth
+    :param height: height of a tooth
+    :return: (2 * teeth + 1 x 2) coordinate array
+    """
+    x = np.arange(2 * teeth + 1) * width / 2
+    y = np.where(np.arange(2 * teeth + 1) % 2 == 0, 0.0, height)
+    return np.column_stack((x, y))
+
+
+def random_walk(vertices: int, seed: int = 0) -> np.ndarray:
+    """
+    Creates a random walk, which crosses itself
+    :param vertices: number of vertices
+    :param seed: seed of the random steps
+    :return: (vertices x 2) coordinate array
+    """
+    return np.cumsum(np.random.default_rng(seed).normal(0.0, 1.0, (vertices, 2)), axis=0)
+
+
+def offset_line(coords: np.ndarray, distance: float, closed: bool = False) -> np.ndarray:
+    """
+    Creates the raw offset line of a line from both offset points of every segment, so the joins are beveled and the
+    inner joins form loops
+    :param coords: (n x 2) coordinate array of the line
+    :param distance: signed offset distance, positive distances are left of the line direction
+    :param closed: True, if the last vertex of the line equals its first vertex
+    :return: (m x 2) coordinate array of the raw offset line without duplicate vertices
+    """
+    vectors = np.diff(coords, axis=0)
+    normals = np.column_stack((-vectors[:, 1], vectors[:, 0])) / np.hypot(vectors[:, 0], vectors[:, 1])[:, np.newaxis]
+    points = np.stack((coords[:-1] + distance * normals, coords[1:] + distance * normals), axis=1).reshape(-1, 2)
+    if closed:
+        points = np.vstack((points, points[:1]))
+    return points[np.append(True, np.any(points[1:] != points[:-1], axis=1))]
+
+
+def unit_columns(units: Sequence, base: int, side: int) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Sums the distances of the unit table row by row, like the construction did before the prefix sums
+    :param units: objects with construct_unit and distance attributes in table order
+    :param base: row index of the base unit, -1 for none
+    :param side: construction side (1 or -1)
+    :return: tuple of the rows of the constructed units, their signed distance and the signed distance of their
+    lower boundary
+    """
+    rows = list()
+    offsets = list()
+    lower_offsets = list()
+    if base == -1:
+        return rows, offsets, lower_offsets
+
+    total = 0
+    for row in range(base + 1, len(units)):
+        lower = total
+        total += units[row].distance * side * -1
+        if units[row].construct_unit:
+            rows.append(row)
+            offsets.append(total)
+            lower_offsets.append(lower)
+
+    total = 0
+    for row in range(base, -1, -1):
+        if units[row].construct_unit:
+            rows.append(row)
+            offsets.append(total)
+            lower_offsets.append(total + units[row].distance * side)
+        total -= units[row].distance * side * -1
+    return rows, offsets, lower_offsets
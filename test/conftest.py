@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Shared fixtures of the tests
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def qgis_application():
+    """
+    Initializes a QGIS application without GUI for the tests, which need data providers. The tests are skipped, if
+    QGIS is not installed.
+    """
+    qgis_core = pytest.importorskip("qgis.core")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    application = qgis_core.QgsApplication([], False)
+    application.initQgis()
+    yield application
+    application.exitQgis()
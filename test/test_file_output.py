@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Writes features through the file output stream and reads them back
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsCoordinateReferenceSystem  # noqa: E402
+
+from ..FeatureWriter import FeatureWriter  # noqa: E402
+from ..FileOutput import FORMAT_FLATGEOBUF, FileOutputStream  # noqa: E402
+from ..OffsetEngine import array_to_geometry  # noqa: E402
+
+
+@pytest.mark.parametrize("count", [1, 25, 1001])
+def test_stream_writes_all_features(qgis_application, tmp_path, count):
+    """
+    All features added through the bulk writer are in the FlatGeobuf file, when the stream is closed
+    """
+    stream = FileOutputStream(str(tmp_path / "lines.fgb"), FORMAT_FLATGEOBUF, "lines",
+                              QgsCoordinateReferenceSystem("EPSG:25832"))
+    writer = FeatureWriter(stream.sink, stream.fields, stream.fields.indexOf("name"), True, False, chunk_size=10)
+    writer.add([["unit {}".format(i), array_to_geometry(np.array([[i, 0.0], [i, 10.0 + i]]))] for i in range(count)])
+    writer.close()
+    layer = stream.close()
+
+    assert layer.featureCount() == count
+    names = sorted(feature["name"] for feature in layer.getFeatures())
+    assert names == sorted("unit {}".format(i) for i in range(count))
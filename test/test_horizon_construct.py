@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Compares the prefix sums of UnitConstructionModel.unit_columns with the row by row sums over the unit table
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qgis.gui")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+
+from . import brute_force  # noqa: E402
+from ..HorizonConstruct import UnitConstructionData, UnitConstructionModel  # noqa: E402
+
+
+def _random_model(rows, seed):
+    """
+    returns a model with random construct flags, distances and base unit
+    """
+    generator = np.random.default_rng(seed)
+    base = int(generator.integers(rows)) if rows > 0 else -1
+    return UnitConstructionModel([UnitConstructionData(construct_unit=bool(generator.random() < 0.7),
+                                                       base_unit=row == base, name="unit {}".format(row),
+                                                       distance=int(generator.integers(0, 1000)))
+                                  for row in range(rows)])
+
+
+def _assert_columns(model):
+    """
+    Asserts, that the columns of both sides match the row by row sums
+    """
+    units = [model.row(row) for row in range(model.rowCount())]
+    for side in (1, -1):
+        rows, offsets, lower_offsets = model.unit_columns(side)
+        expected = brute_force.unit_columns(units, model.base_item_index, side)
+        assert rows.tolist() == expected[0]
+        assert offsets.tolist() == expected[1]
+        assert lower_offsets.tolist() == expected[2]
+
+
+@pytest.mark.parametrize("rows", [0, 1, 2, 7, 50])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_random_tables(rows, seed):
+    """
+    Random tables with the base unit at any row
+    """
+    _assert_columns(_random_model(rows, seed))
+
+
+def test_no_unit_constructed():
+    """
+    Tables without constructed unit return empty columns
+    """
+    model = UnitConstructionModel([UnitConstructionData(construct_unit=False, distance=10) for _ in range(4)])
+    for column in model.unit_columns(1):
+        assert len(column) == 0
+
+
+def test_edited_table():
+    """
+    The columns follow every edit of the table
+    """
+    model = _random_model(20, 3)
+    generator = np.random.default_rng(4)
+    for step in range(60):
+        row = int(generator.integers(model.rowCount()))
+        action = step % 6
+        if action == 0:
+            model.setData(model.index(row, 0), not model.row(row).construct_unit, Qt.EditRole)
+        elif action == 1:
+            model.setData(model.index(row, 1), True, Qt.EditRole)
+        elif action == 2:
+            model.setData(model.index(row, 3), int(generator.integers(0, 1000)), Qt.EditRole)
+        elif action == 3:
+            model.insertRow(row, UnitConstructionData(name="inserted {}".format(step),
+                                                      distance=int(generator.integers(0, 1000))))
+        elif action == 4:
+            model.move_row_up(row)
+        else:
+            model.move_row_down(row)
+        _assert_columns(model)
+
+    while model.rowCount() > 0:
+        model.removeRow(0)
+        _assert_columns(model)
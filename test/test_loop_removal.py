@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Compares the loop search of LoopRemoval with brute force results
+"""
+
+import numpy as np
+import pytest
+
+from .brute_force import intersecting_pairs, random_walk
+from ..LoopRemoval import segment_intersections
+
+
+def _closed_walk(vertices, seed):
+    """
+    returns a random walk, whose last vertex is its first vertex
+    """
+    coords = random_walk(vertices, seed)
+    return np.concatenate((coords, coords[:1]))
+
+
+@pytest.mark.parametrize("coords, closed", [(random_walk(300), False), (random_walk(600, seed=5), False),
+                                            (_closed_walk(300, 7), True)])
+def test_intersections_match_brute_force(coords, closed):
+    """
+    The grid search finds every intersecting pair of non adjacent segments and the intersection points lie on both
+    segments
+    """
+    first, second, points = segment_intersections(coords, closed)
+    assert sorted(zip(first.tolist(), second.tolist())) == intersecting_pairs(coords, closed)
+    for a, b, point in zip(first, second, points):
+        for segment in (a, b):
+            start, end = coords[segment], coords[segment + 1]
+            cross = (end[0] - start[0]) * (point[1] - start[1]) - (end[1] - start[1]) * (point[0] - start[0])
+            assert abs(cross) <= 1e-9 * max(1.0, np.hypot(*(end - start)) ** 2)
+
+
+@pytest.mark.parametrize("window", [(0, 50), (120, 180), (250, 299)])
+def test_window_intersections_match_brute_force(window):
+    """
+    With a window, exactly the intersecting pairs with a segment inside of the window are found
+    """
+    coords = random_walk(300, seed=3)
+    first, second, _ = segment_intersections(coords, window=window)
+    expected = [(a, b) for a, b in intersecting_pairs(coords)
+                if window[0] <= a < window[1] or window[0] <= b < window[1]]
+    assert sorted(zip(first.tolist(), second.tolist())) == expected
+
+
+def test_too_many_pairs_are_rejected():
+    """
+    A limit of the candidate pairs rejects rough lines
+    """
+    with pytest.raises(ValueError):
+        segment_intersections(random_walk(2000, seed=9), max_pairs=10)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Compares the loops updated after a local edit of the base line with the loops searched again on the whole line. The
+ raw offset lines are created with NumPy, so the tests run without QGIS.
+"""
+
+import numpy as np
+import pytest
+
+from .brute_force import offset_line, winding_line
+from ..LoopRemoval import changed_range, cut_loops, find_loops, update_loops
+from ..SegmentIndex import SegmentIndex
+
+
+def _moved(base, index, step):
+    """
+    returns a copy of the base line with one vertex moved perpendicular to the x axis
+    """
+    edited = base.copy()
+    edited[index] += (0.0, step)
+    return edited
+
+
+def _assert_equal(updated, searched):
+    """
+    Asserts, that both loop states contain the same line, loops and trimmed ends
+    """
+    assert updated is not None
+    for field in ("coords", "first", "second", "invalid", "head", "tail"):
+        assert np.array_equal(getattr(updated, field), getattr(searched, field)), field
+    assert np.allclose(updated.points, searched.points)
+    assert updated.trimmed == searched.trimmed
+    assert np.array_equal(cut_loops(updated)[0], cut_loops(searched)[0])
+
+
+def _update(base, edited, distance, closed=False):
+    """
+    Updates the loops of the offset line after the edit and searches the loops of the edited offset line again
+    :return: tuple of the updated and the searched loops
+    """
+    previous = find_loops(offset_line(base, distance, closed), distance, SegmentIndex([base]), closed)
+    coords = offset_line(edited, distance, closed)
+    index = SegmentIndex([edited])
+    return update_loops(previous, coords, distance, index, closed, base, edited), \
+        find_loops(coords, distance, index, closed)
+
+
+def test_changed_range():
+    """
+    The changed range lies between the common start and the common end of both arrays
+    """
+    line = np.column_stack((np.arange(10.0), np.zeros(10)))
+    assert changed_range(line, line.copy()) is None
+    assert changed_range(line, _moved(line, 4, 1.0)) == (4, 5, 5)
+    assert changed_range(line, np.delete(line, 4, axis=0)) == (4, 5, 4)
+    assert changed_range(line, np.insert(line, 4, (3.5, 1.0), axis=0)) == (4, 4, 5)
+    assert changed_range(line, line[:-2]) == (8, 10, 8)
+    assert changed_range(line, np.vstack((line, (10.0, 0.0)))) == (10, 10, 11)
+    assert changed_range(line, _moved(_moved(line, 0, 1.0), 9, 1.0)) == (0, 10, 10)
+
+
+@pytest.mark.parametrize("distance", [-45.0, 12.0, 45.0])
+@pytest.mark.parametrize("position", [0.02, 0.5, 0.98])
+def test_update_after_vertex_move(distance, position):
+    """
+    Moves one vertex of a winding line near its start, in its middle and near its end
+    """
+    base = winding_line(1200)
+    _assert_equal(*_update(base, _moved(base, int(position * (len(base) - 1)), 3.0), distance))
+
+
+@pytest.mark.parametrize("distance", [-45.0, 45.0])
+def test_update_after_vertex_insert_and_delete(distance):
+    """
+    Inserted and deleted vertices shift the loops after the changed range
+    """
+    base = winding_line(1200)
+    inserted = np.insert(base, 600, (base[599] + base[600]) / 2 + (0.0, 2.0), axis=0)
+    _assert_equal(*_update(base, inserted, distance))
+    _assert_equal(*_update(base, np.delete(base, 600, axis=0), distance))
+
+
+@pytest.mark.parametrize("distance", [-45.0, 45.0])
+def test_update_after_several_edits(distance):
+    """
+    Every update starts from the previous update, like the preview during a drag of a vertex
+    """
+    base = winding_line(800)
+    state = find_loops(offset_line(base, distance), distance, SegmentIndex([base]))
+    for step, index in enumerate([200, 201, 400, 401, 400]):
+        edited = _moved(base, index, 4.0 if step % 2 == 0 else -6.0)
+        coords = offset_line(edited, distance)
+        segment_index = SegmentIndex([edited])
+        state = update_loops(state, coords, distance, segment_index, False, base, edited)
+        _assert_equal(state, find_loops(coords, distance, segment_index))
+        base = edited
+
+
+def test_update_of_closed_line():
+    """
+    The offset of a closed ring has no trimmed ends
+    """
+    angles = np.linspace(0.0, 2 * np.pi, 400)
+    radius = 100 + 20 * np.sin(7 * angles)
+    base = np.column_stack((radius * np.cos(angles), radius * np.sin(angles)))
+    base[-1] = base[0]
+    edited = base.copy()
+    edited[100] *= 1.05
+    _assert_equal(*_update(base, edited, -25.0, True))
+
+
+def test_unchanged_line():
+    """
+    An unchanged base line keeps its loops
+    """
+    base = winding_line(600)
+    coords = offset_line(base, 40.0)
+    index = SegmentIndex([base])
+    previous = find_loops(coords, 40.0, index)
+    _assert_equal(update_loops(previous, coords.copy(), 40.0, index, False, base, base.copy()), previous)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Regression tests of the offset lines on winding, zigzag and noisy base lines: every offset line has to be simple and
+ keep the offset distance to the base line
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from .brute_force import point_distances, winding_line, zigzag_line  # noqa: E402
+from ..OffsetEngine import DEFAULT_SEGMENTS, JOIN_STYLE_BEVEL, JOIN_STYLE_MITER, JOIN_STYLE_ROUND, VALID_TOLERANCE, \
+    MultiPartOffsetEngine, OffsetEngine, array_to_geometry, geometry_to_arrays  # noqa: E402
+
+JOIN_STYLES = [JOIN_STYLE_ROUND, JOIN_STYLE_MITER, JOIN_STYLE_BEVEL]
+
+
+def _assert_valid(base, geometry, distance, join_style):
+    """
+    Asserts, that the offset line is simple and all its vertices keep the distance to the base line. Beveled joins
+    are cut along their chords, which are closer to the base line, so their vertices only have to keep the distance
+    of the vertices of the GEOS offset curve.
+    """
+    assert not geometry.isEmpty()
+    assert geometry.isSimple()
+    vertices = np.concatenate(geometry_to_arrays(geometry))
+    limit = abs(distance) * (1 - VALID_TOLERANCE)
+    if join_style == JOIN_STYLE_BEVEL:
+        reference = array_to_geometry(base).offsetCurve(distance, DEFAULT_SEGMENTS, join_style, 10.0)
+        reference_vertices = np.concatenate(geometry_to_arrays(reference))
+        limit = min(limit, point_distances(reference_vertices, [base]).min() - 1e-9 * abs(distance))
+    assert point_distances(vertices, [base]).min() >= limit
+
+
+@pytest.mark.parametrize("join_style", JOIN_STYLES)
+@pytest.mark.parametrize("distance", [-60.0, 20.0, 60.0])
+def test_winding_line(join_style, distance):
+    """
+    Bends of several scales create loops, which overlap each other at larger distances
+    """
+    base = winding_line(1500)
+    for geometry in OffsetEngine(base, join_style).geometries([distance]):
+        _assert_valid(base, geometry, distance, join_style)
+
+
+@pytest.mark.parametrize("join_style", JOIN_STYLES)
+@pytest.mark.parametrize("distance", [-8.0, 3.0, 25.0])
+def test_zigzag_line(join_style, distance):
+    """
+    Sharp teeth create long miters and inner loops, which are longer than the teeth
+    """
+    base = zigzag_line(60)
+    engine = OffsetEngine(base, join_style)
+    for geometry in engine.geometries([distance]):
+        _assert_valid(base, geometry, distance, join_style)
+    if join_style == JOIN_STYLE_MITER:
+        # the many candidate pairs of the long teeth do not replace the line by the GEOS offset curve
+        assert engine.fallbacks == 0
+
+
+@pytest.mark.parametrize("join_style", JOIN_STYLES)
+@pytest.mark.parametrize("seed", [0, 1])
+def test_noisy_line(join_style, seed):
+    """
+    Noise at the scale of the vertex spacing creates many small loops
+    """
+    base = winding_line(1500, 0.3, seed)
+    distances = [15.0, -40.0, 60.0]
+    for distance, geometry in zip(distances, OffsetEngine(base, join_style).geometries(distances)):
+        _assert_valid(base, geometry, distance, join_style)
+
+
+def test_loops_of_replaced_lines_are_counted():
+    """
+    Lines, which are replaced by the GEOS offset curve, count their loops as well
+    """
+    engine = OffsetEngine(winding_line(1500, 0.3))
+    engine.geometries([15.0])
+    assert engine.fallbacks == 1
+    assert engine.loops_removed > 0
+
+
+def test_workers_give_the_serial_result():
+    """
+    The thread pool computes the same lines as the serial computation
+    """
+    base = winding_line(1500, 0.3)
+    distances = [5.0 * i for i in range(-6, 7)]
+    serial = OffsetEngine(base).geometries(distances)
+    parallel = OffsetEngine(base).geometries(distances, workers=4)
+    for first, second in zip(serial, parallel):
+        assert first.asWkb() == second.asWkb()
+
+
+@pytest.mark.parametrize("join_style", JOIN_STYLES)
+@pytest.mark.parametrize("distance", [-60.0, 20.0, 60.0])
+def test_geos_offset_curve(join_style, distance):
+    """
+    The offsets of the simplified base line follow the GEOS offset curve of the base line
+    """
+    base = winding_line(1500)
+    geometry = OffsetEngine(base, join_style).geometries([distance])[0]
+    expected = array_to_geometry(base).offsetCurve(distance, DEFAULT_SEGMENTS, join_style, 10.0)
+    assert geometry.hausdorffDistance(expected) <= abs(distance) * VALID_TOLERANCE
+
+
+@pytest.mark.parametrize("join_style", JOIN_STYLES)
+@pytest.mark.parametrize("distance", [-150.0, 150.0])
+def test_offset_of_simplified_base_line(join_style, distance):
+    """
+    The offset lines of a densely digitized base line have far fewer vertices than the base line, but keep its end
+    points and follow the GEOS offset curve
+    """
+    x = np.linspace(0.0, 2000.0, 5000)
+    base = np.column_stack((x, 100.0 * np.sin(x / 200.0)))
+    engine = OffsetEngine(base, join_style)
+    geometry = engine.geometries([distance])[0]
+    assert engine.fallbacks == 0
+    _assert_valid(base, geometry, distance, join_style)
+
+    coords = geometry_to_arrays(geometry)[0]
+    assert len(coords) < len(base) / 10
+    for point, end, direction in ((coords[0], base[0], base[1] - base[0]), (coords[-1], base[-1], base[-1] - base[-2])):
+        normal = np.array([-direction[1], direction[0]]) / np.hypot(*direction)
+        assert np.allclose(point, end + distance * normal)
+    expected = array_to_geometry(base).offsetCurve(distance, DEFAULT_SEGMENTS, join_style, 10.0)
+    assert geometry.hausdorffDistance(expected) <= abs(distance) * VALID_TOLERANCE
+
+
+@pytest.mark.parametrize("join_style", JOIN_STYLES)
+@pytest.mark.parametrize("simplify", [False, True])
+def test_edited_base_line(join_style, simplify):
+    """
+    The engine of an edited base line splices the offsets of the changed vertices into the offset lines of the
+    previous engine and gets the offset lines of a new engine
+    """
+    x = np.linspace(0.0, 2000.0, 2000)
+    base = np.column_stack((x, 100.0 * np.sin(x / 200.0)))
+    distances = [-150.0, -10.0, 10.0, 150.0]
+    previous = OffsetEngine(base, join_style, simplify=simplify, keep_loops=True)
+    previous.geometries(distances)
+    edited = base.copy()
+    edited[950:1050, 1] += 5.0 * np.sin(np.linspace(0.0, np.pi, 100))
+
+    engine = OffsetEngine(edited, join_style, simplify=simplify, keep_loops=True, previous=previous)
+    expected = OffsetEngine(edited, join_style, simplify=simplify)
+    tolerance = VALID_TOLERANCE if simplify else 0.0
+    for distance, geometry, reference in zip(distances, engine.geometries(distances), expected.geometries(distances)):
+        _assert_valid(edited, geometry, distance, join_style)
+        assert geometry.hausdorffDistance(reference) <= abs(distance) * tolerance + 1e-9
+    assert engine.fallbacks == expected.fallbacks == 0
+    if not simplify:
+        for line, reference in zip(engine.offset(distances), expected.offset(distances)):
+            assert np.allclose(line, reference)
+
+
+def test_multi_part_line():
+    """
+    The offsets of all parts are combined, the parts are tested separately
+    """
+    parts = [winding_line(800), zigzag_line(20) + np.array([0.0, 400.0])]
+    engine = MultiPartOffsetEngine(parts, JOIN_STYLE_MITER)
+    geometry = engine.geometries([30.0])[0]
+    assert geometry.isSimple()
+    vertices = np.concatenate(geometry_to_arrays(geometry))
+    assert point_distances(vertices, parts).min() >= 30.0 * (1 - VALID_TOLERANCE)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Compares the grid queries of SegmentIndex with brute force results over all segments
+"""
+
+import numpy as np
+import pytest
+
+from .brute_force import point_distances, random_walk
+from ..SegmentIndex import SegmentIndex, nearest_side
+
+
+def _lines():
+    """
+    returns test lines as lists of parts: a self crossing random walk, a dense sine, a closed ring and a multi part
+    line with a degenerated part
+    """
+    x = np.linspace(0.0, 100.0, 2000)
+    angles = np.linspace(0.0, 2 * np.pi, 200)
+    ring = np.column_stack((30 * np.cos(angles), 20 * np.sin(angles)))
+    ring[-1] = ring[0]
+    return [
+        [random_walk(500)],
+        [np.column_stack((x, 5 * np.sin(x)))],
+        [ring],
+        [random_walk(200, seed=1), np.array([[3.0, 3.0], [3.0, 3.0]]), random_walk(300, seed=2) + 10],
+    ]
+
+
+def _points(parts, count=400, seed=3):
+    """
+    returns random points around the bounding box of the line
+    """
+    coords = np.concatenate(parts)
+    lower, upper = coords.min(axis=0), coords.max(axis=0)
+    margin = 0.2 * (upper - lower)
+    return np.random.default_rng(seed).uniform(lower - margin, upper + margin, (count, 2))
+
+
+@pytest.mark.parametrize("parts", _lines())
+@pytest.mark.parametrize("tolerance", [0.0, 0.01, 0.5])
+def test_closer_than_matches_brute_force(parts, tolerance):
+    """
+    The exact and the coarse distance tests agree with the distances to all segments
+    """
+    index = SegmentIndex(parts)
+    points = _points(parts)
+    distances = point_distances(points, parts)
+    for limit in (0.1, 1.0, 5.0, float(np.median(distances))):
+        expected = distances < limit
+        np.testing.assert_array_equal(index.closer_than(points, limit, tolerance), expected)
+
+
+@pytest.mark.parametrize("parts", _lines())
+def test_nearest_matches_brute_force(parts):
+    """
+    The nearest segment search finds the distance of the brute force search and the side of nearest_side
+    """
+    index = SegmentIndex(parts)
+    points = _points(parts, 100)
+    distances = point_distances(points, parts)
+    for point, distance in zip(points, distances):
+        found, side = index.nearest(float(point[0]), float(point[1]))
+        assert found == pytest.approx(distance, abs=1e-9)
+        assert side == nearest_side(parts, float(point[0]), float(point[1]))
+
+
+def test_side_of_a_straight_line():
+    """
+    Points left and right of a line and of a corner vertex get the expected side
+    """
+    index = SegmentIndex([np.array([[0.0, 0.0], [10.0, 0.0], [20.0, 0.0]])])
+    assert index.side(5.0, 1.0) == 1
+    assert index.side(15.0, -1.0) == -1
+    # the nearest point is the shared vertex of a corner
+    corner = SegmentIndex([np.array([[0.0, 0.0], [10.0, 0.0], [10.0, 10.0]])])
+    assert corner.side(11.0, -1.0) == -1
+    assert corner.side(9.0, 1.0) == 1
+
+
+def test_degenerated_line_is_rejected():
+    """
+    A line without two distinct vertices cannot be indexed
+    """
+    with pytest.raises(ValueError):
+        SegmentIndex([np.array([[1.0, 1.0], [1.0, 1.0]])])
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS plugin: ParallelLineConstruction
+
+This plugin constructs parallel lines based on a given base line
+
+copyright            : (C) 2018 by Stephan Donndorf
+email                : stephan@donndorf.info
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Tests the lower boundaries of the band polygons for unit tables with and without constructed units in between
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from ..OffsetEngine import OffsetEngine, array_to_geometry, geometry_to_arrays  # noqa: E402
+from ..UnitBands import lower_boundaries, unit_bands  # noqa: E402
+
+# unit_columns(1) of the distances (10, 20, 30, 40, 50) with base unit 2: the upward units 3 and 4, the base unit
+# and the downward units 1 and 0
+DISTANCES = [-40.0, -90.0, 0.0, 30.0, 50.0]
+LOWER_DISTANCES = [0.0, -40.0, 30.0, 50.0, 60.0]
+
+
+def test_lower_boundaries_of_all_units():
+    """
+    Every unit is bounded by the base line or the line of its neighbour, the last downward unit has no lower line
+    """
+    assert lower_boundaries(DISTANCES, LOWER_DISTANCES) == [-1, 0, 3, 4, None]
+
+
+def test_lower_boundaries_skip_units_without_line():
+    """
+    If unit 1 is not constructed, the base unit is bounded by the next constructed line beyond it
+    """
+    keep = [0, 1, 2, 4]
+    distances = [DISTANCES[i] for i in keep]
+    lower_distances = [LOWER_DISTANCES[i] for i in keep]
+    assert lower_boundaries(distances, lower_distances) == [-1, 0, 3, None]
+
+
+def test_lower_boundaries_prefer_the_base_line():
+    """
+    The base line is used instead of the line of the base unit at distance 0
+    """
+    assert lower_boundaries([0.0, -10.0], [10.0, 0.0]) == [None, -1]
+
+
+def test_unit_bands_without_line_in_between():
+    """
+    The band of the base unit also covers the unit without line, only the last downward unit has no band
+    """
+    base = np.column_stack((np.linspace(0.0, 100.0, 11), np.zeros(11)))
+    distances = [DISTANCES[i] for i in (0, 1, 2, 4)]
+    lower_distances = [LOWER_DISTANCES[i] for i in (0, 1, 2, 4)]
+    geometries = OffsetEngine(base).geometries(distances)
+    bands = unit_bands([base], distances, lower_distances, geometries)
+    assert [band is None for band in bands] == [False, False, False, True]
+    assert not any(band.isEmpty() for band in bands[:3])
+
+
+def test_unit_bands_with_reversed_upper_line():
+    """
+    A reversed upper line (e.g. a negative offset curve of GEOS before 3.11) does not create a self crossing band
+    """
+    base = np.column_stack((np.linspace(0.0, 100.0, 11), np.zeros(11)))
+    geometries = OffsetEngine(base).geometries([10.0, 20.0])
+    geometries[1] = array_to_geometry(geometry_to_arrays(geometries[1])[0][::-1])
+    bands = unit_bands([base], [10.0, 20.0], [0.0, 10.0], geometries)
+    assert bands[1].isGeosValid()
+    assert bands[1].area() == pytest.approx(1000.0)